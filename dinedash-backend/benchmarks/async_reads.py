@@ -0,0 +1,62 @@
+"""
+Compare the sync (WSGI) and async (ASGI) deployments on the read endpoints.
+
+Starts gunicorn with each profile in turn against the configured database,
+fires the same number of concurrent GETs at the menu, a tracking lookup and
+analytics, and prints throughput and latency percentiles for each:
+
+    python benchmarks/async_reads.py --concurrency 200 --requests 4000 --workers 2
+
+Both profiles get the same number of worker processes. The database needs at
+least one order (for the tracking lookup); the ASGI run needs uvicorn and
+uvicorn-worker installed (see requirements.txt).
+"""
+import argparse
+import sys
+
+from harness import PROFILES, run, setup_django, start_server, stop_server, summarize
+
+
+def tracking_code():
+    """ The tracking code of the latest order in the database the servers will use. """
+    from orders.models import Order
+
+    code = Order.objects.order_by('-pk').values_list('tracking_code', flat=True).first()
+    if code is None:
+        sys.exit("The database has no orders to look up; place one (or seed data) first.")
+    return code
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=4000)
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes for both profiles')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--profiles', nargs='+', choices=sorted(PROFILES), default=['sync', 'async'])
+    args = parser.parse_args()
+
+    setup_django()
+    base_url = f'http://127.0.0.1:{args.port}'
+    paths = ['/api/meals/', f'/api/orders/{tracking_code()}/', '/api/orders/analytics/']
+
+    def send(session, number):
+        return session.get(base_url + paths[number % len(paths)], timeout=60)
+
+    print(f"{args.requests} requests, {args.concurrency} concurrent, {args.workers} workers, over: {', '.join(paths)}")
+    print(f"{'profile':<8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for profile in args.profiles:
+        server = start_server(profile, args.port, args.workers)
+        try:
+            run(send, min(args.requests, 200), 10)  # warm up
+            result = summarize(*run(send, args.requests, args.concurrency))
+        finally:
+            stop_server(server)
+        print(
+            f"{profile:<8} {result['throughput_rps']:>8.0f} {result['p50_ms']:>8.1f} "
+            f"{result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['errors']:>7}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Shared plumbing for the benchmark scripts: Django setup, starting a local
+gunicorn, driving concurrent requests and summarising latencies.
+"""
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+PROFILES = {
+    'sync': ('gunicorn.conf.py', 'dinedash.wsgi:application', 'False'),
+    'async': ('gunicorn.asgi.conf.py', 'dinedash.asgi:application', 'True'),
+}
+
+
+def setup_django():
+    """ Configures Django in this process, against the same database the servers use. """
+    # Rate limits would turn most of a run into 429s; the servers started here inherit this
+    os.environ.setdefault('DISABLE_THROTTLING', 'True')
+    sys.path.insert(0, str(BACKEND_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dinedash.settings')
+    import django
+    django.setup()
+
+
+def start_server(profile, port, workers):
+    """ Starts gunicorn with one of PROFILES on 127.0.0.1:port and waits until it answers. """
+    config, app, async_views = PROFILES[profile]
+    env = {**os.environ, 'ASYNC_READ_VIEWS': async_views}
+    server = subprocess.Popen(
+        ['gunicorn', '--config', config, '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+         '--access-logfile', '/dev/null', app],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f'http://127.0.0.1:{port}/healthz/', timeout=1)
+            return server
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    server.terminate()
+    sys.exit(f"The {profile} server did not start; run it by hand to see why.")
+
+
+def stop_server(server):
+    server.terminate()
+    server.wait()
+
+
+def run(send, total, concurrency):
+    """
+    Calls ``send(session, number)`` for number in range(total) from ``concurrency`` threads.
+
+    ``send`` makes one request with the given requests.Session and returns it.
+    Returns (seconds, sorted latencies, errors), where an error is an
+    exception or a status of 400 or more.
+    """
+    sessions = {}
+
+    def timed(number):
+        session = sessions.setdefault(number % concurrency, requests.Session())
+        started = time.perf_counter()
+        try:
+            ok = send(session, number).status_code < 400
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, range(total)))
+    elapsed = time.perf_counter() - started
+    return elapsed, sorted(latency for latency, _ in results), sum(not ok for _, ok in results)
+
+
+def percentile(values, fraction):
+    """ The value below which ``fraction`` of the sorted ``values`` fall. """
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def summarize(elapsed, latencies, errors):
+    """ Throughput and latency percentiles (in ms) of one run() as a dict. """
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+    }
@@ -0,0 +1,219 @@
+"""
+Load test for the checkout and order hot paths, with a baseline to compare against.
+
+Drives checkout, the order list, tracking lookups, analytics and mock-verify
+at a fixed concurrency against a local server, then counts the database
+queries each scenario makes per request (in this process, through the test
+client, against the same database). Results are printed and written as JSON:
+
+    python manage.py seed_benchmark_data --orders 20000 --clear
+    python benchmarks/hot_paths.py --start-server --output benchmarks/baseline.json
+    # ...change something...
+    python benchmarks/hot_paths.py --start-server --compare benchmarks/baseline.json
+
+--compare exits with status 1 when a scenario's p95 latency or throughput is
+worse than the baseline by more than --tolerance, or it makes more queries or
+errors. SQLite serialises writes, so expect some errors on the write
+scenarios there; compare runs made against the same database engine.
+Without --start-server, point --base-url at a server started with
+DISABLE_THROTTLING=True.
+"""
+import argparse
+import json
+import logging
+import subprocess
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+from harness import BACKEND_DIR, run, setup_django, start_server, stop_server, summarize
+
+SCENARIOS = ['checkout', 'order_list', 'tracking', 'analytics', 'mock_verify']
+# Requests per scenario used to count queries
+QUERY_SAMPLES = 5
+
+
+class Workload:
+    """ The requests each scenario sends, built from the seeded data. """
+
+    def __init__(self, base_url):
+        from meals.models import Meal
+        from orders.management.commands.seed_benchmark_data import CUSTOMER_EMAIL, MEAL_PREFIX, TRANSACTION_REF_PREFIX
+        from orders.models import Order
+        from payments.models import Payment
+
+        self.base_url = base_url
+        self.customer_email = CUSTOMER_EMAIL
+        self.meal_ids = list(Meal.objects.filter(name__startswith=MEAL_PREFIX, is_available=True).values_list('pk', flat=True))
+        self.tracking_codes = list(
+            Order.objects.filter(customer_email=CUSTOMER_EMAIL).values_list('tracking_code', flat=True)[:1000]
+        )
+        # Each pending payment can be verified once; the query count samples take the first few
+        self.payments = list(
+            Payment.objects.filter(transaction_ref__startswith=TRANSACTION_REF_PREFIX, status=Payment.STATUS_PENDING)
+            .values_list('transaction_ref', 'order_id')
+        )
+        if not (self.meal_ids and self.tracking_codes and self.payments):
+            sys.exit("No seeded data to work with; run `python manage.py seed_benchmark_data` first.")
+
+    def request(self, scenario, number):
+        """ (method, path, JSON body or None) of request ``number`` of a scenario. """
+        if scenario == 'checkout':
+            meal_ids = [self.meal_ids[(number + offset) % len(self.meal_ids)] for offset in range(number % 3 + 1)]
+            return 'post', '/api/orders/checkout/', {
+                'order': {
+                    'customer_name': 'Bench Customer',
+                    'customer_email': self.customer_email,
+                    'order_type': 'dine in',
+                    'table_number': 'B1',
+                    'items': [{'meal_id': meal_id, 'quantity': 1} for meal_id in meal_ids],
+                },
+                'payment': {'method': 'cash'},
+            }
+        if scenario == 'order_list':
+            return 'get', '/api/orders/', None
+        if scenario == 'tracking':
+            return 'get', f'/api/orders/{self.tracking_codes[number % len(self.tracking_codes)]}/', None
+        if scenario == 'analytics':
+            return 'get', '/api/orders/analytics/', None
+        if scenario == 'mock_verify':
+            tx_ref, order_id = self.payments[number % len(self.payments)]
+            return 'get', f'/api/payments/mock-verify/?tx_ref={tx_ref}&order_id={order_id}&status=successful', None
+        raise ValueError(f"Unknown scenario {scenario}")
+
+    def sender(self, scenario, offset=0):
+        """ A send(session, number) for harness.run(), starting at request ``offset``. """
+        def send(session, number):
+            method, path, body = self.request(scenario, offset + number)
+            return session.request(method, self.base_url + path, json=body, timeout=60)
+        return send
+
+    def count_queries(self, scenario, offset=0):
+        """ The mean number of queries per request over QUERY_SAMPLES requests, made in this process. """
+        from django.db import connection
+        from django.test import Client
+        from django.test.utils import CaptureQueriesContext
+
+        client = Client(HTTP_HOST='localhost')
+        total = 0
+        for number in range(offset, offset + QUERY_SAMPLES):
+            method, path, body = self.request(scenario, number)
+            with CaptureQueriesContext(connection) as queries:
+                if body is None:
+                    client.generic(method.upper(), path)
+                else:
+                    client.generic(method.upper(), path, json.dumps(body), content_type='application/json')
+            total += len(queries)
+        return round(total / QUERY_SAMPLES, 1)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """ Prints each scenario against the baseline. Returns the regressions found. """
+    regressions = []
+    print(f"\nAgainst {baseline['meta'].get('commit') or 'the baseline'} (tolerance {tolerance:.0%}):")
+    for scenario, result in results['scenarios'].items():
+        before = baseline['scenarios'].get(scenario)
+        if not before:
+            print(f"  {scenario}: not in the baseline")
+            continue
+        p95_change = result['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0
+        rps_change = result['throughput_rps'] / before['throughput_rps'] - 1 if before['throughput_rps'] else 0
+        print(
+            f"  {scenario}: p95 {before['p95_ms']} -> {result['p95_ms']} ms ({p95_change:+.0%}), "
+            f"throughput {before['throughput_rps']} -> {result['throughput_rps']} req/s ({rps_change:+.0%}), "
+            f"queries {before['queries_per_request']} -> {result['queries_per_request']}"
+        )
+        if p95_change > tolerance:
+            regressions.append(f"{scenario}: p95 latency up {p95_change:.0%}")
+        if rps_change < -tolerance:
+            regressions.append(f"{scenario}: throughput down {-rps_change:.0%}")
+        if result['queries_per_request'] > before['queries_per_request']:
+            regressions.append(f"{scenario}: queries per request up to {result['queries_per_request']}")
+        if result['errors'] > before['errors']:
+            regressions.append(f"{scenario}: {result['errors']} errors, was {before['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000', help='Server to test (ignored with --start-server)')
+    parser.add_argument('--start-server', action='store_true', help='Start gunicorn (sync profile) for the run')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers with --start-server')
+    parser.add_argument('--port', type=int, default=8765, help='Port for --start-server')
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=500, help='Requests per scenario')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--output', help='Write the results to this JSON file (e.g. to make a baseline)')
+    parser.add_argument('--compare', help='Baseline JSON file to compare the results with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown before --compare fails')
+    args = parser.parse_args()
+
+    setup_django()
+    # The query counting requests would otherwise log each checkout over the table
+    logging.disable(logging.INFO)
+    from django.db import connection
+
+    server = None
+    base_url = args.base_url.rstrip('/')
+    if args.start_server:
+        server = start_server('sync', args.port, args.workers)
+        base_url = f'http://127.0.0.1:{args.port}'
+
+    workload = Workload(base_url)
+    if 'mock_verify' in args.scenarios and len(workload.payments) < args.requests + QUERY_SAMPLES:
+        print(f"Only {len(workload.payments)} pending payments: some mock-verify requests will repeat an already "
+              f"verified payment. Seed more orders (or a higher --pending) for a clean run.")
+
+    results = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'database': connection.vendor,
+            'base_url': base_url,
+            'workers': args.workers if args.start_server else None,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+        },
+        'scenarios': {},
+    }
+
+    print(f"{args.requests} requests per scenario, {args.concurrency} concurrent, against {base_url}")
+    print(f"{'scenario':<12} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'queries':>8}")
+    try:
+        for scenario in args.scenarios:
+            # Mock-verify samples use the first pending payments, the load the ones after them
+            queries = workload.count_queries(scenario)
+            result = summarize(*run(workload.sender(scenario, offset=QUERY_SAMPLES), args.requests, args.concurrency))
+            result['queries_per_request'] = queries
+            results['scenarios'][scenario] = result
+            print(
+                f"{scenario:<12} {result['throughput_rps']:>8.0f} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+                f"{result['p99_ms']:>8.1f} {result['errors']:>7} {queries:>8}"
+            )
+    finally:
+        if server:
+            stop_server(server)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2) + '\n')
+        print(f"\nWrote {args.output}")
+
+    if args.compare:
+        regressions = compare(results, json.loads(Path(args.compare).read_text()), args.tolerance)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("\nNo regressions.")
+
+
+if __name__ == '__main__':
+    main()
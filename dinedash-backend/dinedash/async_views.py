@@ -0,0 +1,73 @@
+"""
+Async read views.
+
+The hottest read endpoints (the menu, order tracking and analytics) have
+native async versions, routed instead of the DRF views when
+``settings.ASYNC_READ_VIEWS`` is on, normally with the ASGI gunicorn profile
+(gunicorn.asgi.conf.py). There a slow query or a slow mobile client holds a
+coroutine instead of a whole worker process.
+
+DRF views are sync only, so these are plain Django views that answer with
+the same bodies, status codes and error format, and apply the same
+authentication and throttling, as the DRF views they stand in for.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .utils import custom_exception_handler
+
+
+def json_response(data, status=200):
+    """ An HttpResponse with the same JSON encoding as a DRF Response. """
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+class AsyncReadView(View):
+    """ Base for async GET views: checks the default DRF throttles (and ``throttle_scope``) first. """
+    http_method_names = ['get', 'head', 'options']
+    throttle_scope = None
+
+    async def dispatch(self, request, *args, **kwargs):
+        denied = await sync_to_async(self.check_throttles)(request)
+        if denied is not None:
+            return denied
+        return await super().dispatch(request, *args, **kwargs)
+
+    def check_throttles(self, request):
+        """ Runs the DRF throttles like APIView.initial(). Returns an error response, or None if allowed. """
+        drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+        try:
+            waits = []
+            for throttle_class in api_settings.DEFAULT_THROTTLE_CLASSES:
+                throttle = throttle_class()
+                if not throttle.allow_request(drf_request, self):
+                    waits.append(throttle.wait())
+            if waits:
+                raise exceptions.Throttled(max((wait for wait in waits if wait is not None), default=None))
+        except exceptions.APIException as exc:
+            return self.error_response(exc, drf_request)
+        return None
+
+    def error_response(self, exc, request=None):
+        """ The response the DRF exception handler gives for an APIException. """
+        response = custom_exception_handler(exc, {'request': request, 'view': self})
+        error = json_response(response.data, status=response.status_code)
+        for header, value in response.items():
+            if header != 'Content-Type':
+                error[header] = value
+        return error
+
+
+def split_by_method(read_view, write_view):
+    """ One view for a URL: GET and HEAD go to the async read_view, everything else to the sync write_view. """
+    async def view(request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            return await read_view(request, *args, **kwargs)
+        return await sync_to_async(write_view)(request, *args, **kwargs)
+    return csrf_exempt(view)
@@ -0,0 +1,122 @@
+"""
+Streaming exports.
+
+Rows are encoded as CSV or JSON Lines a chunk at a time and can be gzipped on
+the fly, so an export of any size is sent (or written) without ever holding
+more than one chunk in memory. The row generators live with their models,
+e.g. ``orders.exports``.
+
+Under ASGI, Django reads a sync streaming body into a list before sending it,
+so there the chunks are handed over as an async iterator instead, each one
+produced in the sync thread (where the database connection lives).
+"""
+import csv
+import io
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+FORMATS = {
+    'csv': ('text/csv', '.csv'),
+    'jsonl': ('application/x-ndjson', '.jsonl'),
+}
+
+# Rows encoded before a chunk of output is handed on
+ROWS_PER_CHUNK = 500
+
+# Spreadsheets run a cell starting with one of these as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def csv_safe(value):
+    """ Text that a spreadsheet would run as a formula, prefixed with ' so it shows as typed. """
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return f"'{value}"
+    return value
+
+
+def encode(rows, file_format, columns=None):
+    """
+    Encode rows (dicts) as CSV or JSON Lines.
+
+    Args:
+        rows: Iterable of dicts; CSV rows are flat, JSON Lines rows may nest. Text CSV
+            values starting with =, +, -, @, tab or carriage return get a leading '
+        file_format: 'csv' or 'jsonl'
+        columns: CSV header, in order
+
+    Yields:
+        Encoded text, a chunk of rows at a time
+    """
+    buffer = io.StringIO()
+    if file_format == 'csv':
+        writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+        writer.writeheader()
+
+        def write(row):
+            # Customer-entered text (names, addresses, notes) could otherwise inject formulas
+            writer.writerow({key: csv_safe(value) for key, value in row.items()})
+    else:
+        def write(row):
+            buffer.write(json.dumps(row, cls=DjangoJSONEncoder))
+            buffer.write('\n')
+
+    pending = 0
+    for row in rows:
+        write(row)
+        pending += 1
+        if pending == ROWS_PER_CHUNK:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzipped(chunks):
+    """ Compress a stream of text chunks into a gzip stream, chunk by chunk. """
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def asynchronous(chunks):
+    """ Iterate a sync stream of chunks from async code, producing each chunk in the sync thread. """
+    iterator = iter(chunks)
+    done = object()
+    while (chunk := await sync_to_async(next)(iterator, done)) is not done:
+        yield chunk
+
+
+def export_response(rows, file_format, name, columns=None, compress=False, request=None):
+    """
+    A StreamingHttpResponse that downloads the rows as a file.
+
+    Args:
+        rows: Iterable of dicts (see encode)
+        file_format: 'csv' or 'jsonl'
+        name: File name without extension; today's date is appended
+        columns: CSV header
+        compress: Send a .gz file compressed on the fly
+        request: The request being answered; under ASGI the body is an async iterator
+    """
+    content_type, extension = FORMATS[file_format]
+    chunks = encode(rows, file_format, columns)
+    filename = f'{name}-{timezone.localdate().isoformat()}{extension}'
+    if compress:
+        chunks, content_type, filename = gzipped(chunks), 'application/gzip', filename + '.gz'
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        chunks = asynchronous(chunks)
+
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,233 @@
+"""
+Per-request query counts and timings.
+
+RequestMetricsMiddleware wraps every database connection with
+``connection.execute_wrapper`` for the length of a request and records:
+
+- db: the number of queries and the time spent running them
+- render: time spent rendering a DRF response's data to JSON (or any other
+  deferred-rendering response), measured around ``response.render()``
+- view: time from the view being called to its response being rendered
+- serializer: time views spent validating input and building ``.data``,
+  measured where they wrap that work in ``timed_section('serializer')``
+  (including any queries the serializers run); part of view
+- total: time spent below the middleware
+
+They are sent back in a ``Server-Timing`` header (readable in the browser's
+network panel) unless ``settings.REQUEST_METRICS_SERVER_TIMING`` is off, and
+logged on the "dinedash.requests" logger as structured fields (db_queries,
+db_ms, render_ms, serializer_ms, view_ms, duration_ms, ...): at DEBUG for every request, and
+as a warning for requests slower than ``settings.SLOW_REQUEST_THRESHOLD_MS``.
+
+With ``settings.SLOW_QUERY_LOG`` on, every query slower than
+``settings.SLOW_QUERY_THRESHOLD_MS`` is logged on "dinedash.slow_queries"
+with its fingerprint (the SQL with literals and parameters replaced by ``?``,
+so repeats of the same query group together) and the view that ran it.
+
+Every request is also recorded in the Prometheus metrics (dinedash.metrics).
+
+Queries run while a streaming response is consumed, after the middleware has
+returned, are not counted.
+"""
+import hashlib
+import logging
+import re
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from . import metrics as prometheus
+
+logger = logging.getLogger('dinedash.requests')
+slow_query_logger = logging.getLogger('dinedash.slow_queries')
+
+_current = ContextVar('request_metrics', default=None)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w."])\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|%\(\w+\)s')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """ The shape of a query: literals and parameters become ?, and lists of them (...). """
+    sql = _STRING.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+class RequestMetrics:
+    """ What one request has spent so far. Also the execute_wrapper that counts its queries. """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.render_started = None
+        self.view_started = None
+        self.view_time = 0.0
+        self.total_time = 0.0
+        # Seconds spent in each timed_section(); serializer is always reported
+        self.sections = {'serializer': 0.0}
+        self.open_sections = set()
+        self.view = None
+        self.url_name = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += duration
+            if getattr(settings, 'SLOW_QUERY_LOG', False) and duration * 1000 >= settings.SLOW_QUERY_THRESHOLD_MS:
+                self.log_slow_query(sql, duration)
+
+    def log_slow_query(self, sql, duration):
+        shape = fingerprint(sql)
+        fingerprint_id = hashlib.sha1(shape.encode()).hexdigest()[:12]
+        slow_query_logger.warning(
+            f"Slow query ({duration * 1000:.1f}ms) in {self.view or 'no view'}: {shape}",
+            extra={'fingerprint': shape, 'fingerprint_id': fingerprint_id,
+                   'duration_ms': round(duration * 1000, 2), 'view': self.view},
+        )
+
+    def server_timing(self):
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'render;dur={self.render_time * 1000:.1f}',
+            *(f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.sections.items()),
+            f'view;dur={self.view_time * 1000:.1f}',
+            f'total;dur={self.total_time * 1000:.1f}',
+        ])
+
+    def fields(self):
+        return {
+            'view': self.view,
+            'db_queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 2),
+            'render_ms': round(self.render_time * 1000, 2),
+            **{f'{name}_ms': round(seconds * 1000, 2) for name, seconds in self.sections.items()},
+            'view_ms': round(self.view_time * 1000, 2),
+            'duration_ms': round(self.total_time * 1000, 2),
+        }
+
+
+@contextmanager
+def timed_section(name):
+    """
+    Adds the time spent in the block to the current request's ``name`` timing,
+    sent as ``name`` in Server-Timing and logged as ``<name>_ms``.
+
+    A section nested in one of the same name is only counted once. Outside a
+    request (commands, jobs) nothing is recorded.
+    """
+    metrics = _current.get()
+    if metrics is None or name in metrics.open_sections:
+        yield
+        return
+    metrics.open_sections.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.open_sections.discard(name)
+        metrics.sections[name] = metrics.sections.get(name, 0.0) + time.perf_counter() - started
+
+
+class RequestMetricsMiddleware:
+    """ Records the queries and time each request takes, see the module docstring. """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with self.wrap_connections(metrics):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        # Connections belong to the thread the ORM runs in, which sync_to_async shares for the whole request
+        wrappers = await sync_to_async(self.wrap_connections)(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(wrappers.close)()
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = _current.get()
+        if metrics is not None:
+            match = request.resolver_match
+            metrics.view = (match.view_name or match._func_path) if match else None
+            # Unnamed patterns (healthz/) go by their route, which is just as bounded
+            metrics.url_name = (match.url_name or match.route) if match else None
+            metrics.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # Called just before Django renders the response; the callback runs just after
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.render_started = time.perf_counter()
+            response.add_post_render_callback(lambda rendered: self.rendered(metrics))
+        return response
+
+    @staticmethod
+    def rendered(metrics):
+        metrics.render_time += time.perf_counter() - metrics.render_started
+
+    @staticmethod
+    def wrap_connections(metrics):
+        wrappers = ExitStack()
+        for connection in connections.all():
+            wrappers.enter_context(connection.execute_wrapper(metrics))
+        return wrappers
+
+    def finish(self, request, response, metrics):
+        now = time.perf_counter()
+        metrics.total_time = now - metrics.started
+        if metrics.view_started is not None:
+            metrics.view_time = now - metrics.view_started
+
+        prometheus.observe_request(
+            metrics.url_name, request.method, response.status_code, metrics.total_time, metrics.queries,
+        )
+        if getattr(settings, 'REQUEST_METRICS_SERVER_TIMING', True):
+            existing = response.get('Server-Timing')
+            response['Server-Timing'] = f'{existing}, {metrics.server_timing()}' if existing else metrics.server_timing()
+
+        slow = metrics.total_time * 1000 >= getattr(settings, 'SLOW_REQUEST_THRESHOLD_MS', 1000)
+        level = logging.WARNING if slow else logging.DEBUG
+        if logger.isEnabledFor(level):
+            logger.log(
+                level,
+                f"{'Slow request: ' if slow else ''}{request.method} {request.path} {response.status_code} in "
+                f"{metrics.total_time * 1000:.1f}ms ({metrics.queries} queries, {metrics.db_time * 1000:.1f}ms db)",
+                extra={'method': request.method, 'path': request.path, 'status_code': response.status_code,
+                       **metrics.fields()},
+            )
+        return response
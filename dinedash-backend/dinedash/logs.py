@@ -0,0 +1,29 @@
+"""
+Log formatting.
+
+Kept free of Django and DRF imports: LOGGING is configured before apps load.
+"""
+import json
+import logging
+
+# Attributes every LogRecord has; anything else was passed with extra=
+_LOG_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Formats each record as one JSON object: timestamp, level, module and
+    message, plus any fields passed with ``extra=`` and the traceback, if any.
+    """
+
+    def format(self, record):
+        entry = {
+            'timestamp': self.formatTime(record),
+            'level': record.levelname,
+            'module': record.module,
+            'message': record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _LOG_RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
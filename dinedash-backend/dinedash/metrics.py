@@ -0,0 +1,112 @@
+"""
+Prometheus metrics, served at /metrics.
+
+- dinedash_request_duration_seconds: request latency histogram per URL name
+  (checkout, order-list, analytics, mock-verify, ...) and method
+- dinedash_requests_total: requests per URL name, method and status code
+- dinedash_request_db_queries: histogram of queries per request, per URL name
+- dinedash_throttled_requests_total: requests rejected with 429, per URL name
+- dinedash_checkouts_total: checkouts per payment method and outcome
+- dinedash_order_status_transitions_total: committed status changes, per
+  from/to status
+
+The request metrics are recorded by RequestMetricsMiddleware
+(dinedash.instrumentation) with the timings it already takes.
+
+gunicorn runs several worker processes, each with its own counters. The
+gunicorn configs set ``PROMETHEUS_MULTIPROC_DIR``, so every worker writes
+its metrics to files there and /metrics adds up all of them; without it
+(runserver, tests) the process's own metrics are served.
+"""
+import os
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+# Labels for requests that matched no URL pattern or used an unusual method, so
+# clients can't create new series at will
+UNMATCHED = 'unmatched'
+OTHER_METHOD = 'OTHER'
+METHODS = {'GET', 'HEAD', 'OPTIONS', 'POST', 'PUT', 'PATCH', 'DELETE'}
+
+request_duration = Histogram(
+    'dinedash_request_duration_seconds', 'Request latency, up to the response leaving the middleware.',
+    ['url_name', 'method'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+requests_total = Counter(
+    'dinedash_requests', 'Requests served.', ['url_name', 'method', 'status'],
+)
+request_db_queries = Histogram(
+    'dinedash_request_db_queries', 'Database queries made by a request.', ['url_name'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+throttled_requests = Counter(
+    'dinedash_throttled_requests', 'Requests rejected by a rate limit (429).', ['url_name'],
+)
+checkouts = Counter(
+    'dinedash_checkouts', 'Checkout attempts by payment method and outcome.', ['method', 'outcome'],
+)
+order_status_transitions = Counter(
+    'dinedash_order_status_transitions', 'Committed order status changes.', ['from_status', 'to_status'],
+)
+
+
+def observe_request(url_name, method, status_code, duration, queries):
+    """ Records one finished request (called by RequestMetricsMiddleware). """
+    url_name = url_name or UNMATCHED
+    method = method if method in METHODS else OTHER_METHOD
+    request_duration.labels(url_name, method).observe(duration)
+    requests_total.labels(url_name, method, str(status_code)).inc()
+    request_db_queries.labels(url_name).observe(queries)
+    if status_code == 429:
+        throttled_requests.labels(url_name).inc()
+
+
+def checkout_outcome(response):
+    """ What became of a checkout, from the response the view gave. """
+    status_code = response.status_code
+    data = response.data if isinstance(getattr(response, 'data', None), dict) else {}
+    if status_code == 201:
+        # Cash checkouts complete at once; a declined card payment also ends here
+        return (data.get('payment') or {}).get('status') or 'completed'
+    if status_code == 202:
+        return 'processing' if data.get('status') == 'PROCESSING' else 'pending_payment'
+    if status_code == 400:
+        return 'invalid'
+    if status_code == 429:
+        return 'throttled'
+    if status_code >= 500:
+        return 'error'
+    return 'rejected'
+
+
+def observe_checkout(method, response):
+    """ Counts a checkout response (method: a valid payment method or 'unknown').
+        Idempotent replays are skipped, they were counted the first time. """
+    if response.get('Idempotent-Replayed'):
+        return
+    checkouts.labels(method, checkout_outcome(response)).inc()
+
+
+def observe_transitions(counts):
+    """ Counts committed status changes, given as {(from_status, to_status): number of orders}. """
+    for (from_status, to_status), count in counts.items():
+        order_status_transitions.labels(from_status, to_status).inc(count)
+
+
+def metrics_view(request):
+    """ The metrics in the Prometheus text format, summed over all worker processes. """
+    token = settings.METRICS_TOKEN
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -50,11 +50,13 @@ INSTALLED_APPS = [
     'meals',
     'orders',
     'payments',
+    'jobs',
 ]
 
 # Middleware
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  # MUST be first
+    'dinedash.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -110,6 +112,87 @@ if DATABASE_URL:
     if 'postgres' in DATABASE_URL:
         DATABASES['default']['ENGINE'] = 'django.db.backends.postgresql'
 
+# Caching
+# Defaults to an in-process cache; point CACHE_BACKEND/CACHE_LOCATION at a file
+# or Redis cache to share it between workers, e.g.
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache CACHE_LOCATION=redis://localhost:6379/1
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'dinedash'),
+    }
+}
+
+# Menu cache: shared cache alias, per-process LRU size and entry lifetime (seconds)
+MENU_CACHE_ALIAS = os.getenv('MENU_CACHE_ALIAS', 'default')
+MENU_CACHE_LOCAL_SIZE = int(os.getenv('MENU_CACHE_LOCAL_SIZE', '32'))
+MENU_CACHE_TIMEOUT = int(os.getenv('MENU_CACHE_TIMEOUT', '86400'))
+
+# Order changes feed: how many seconds a change must be old before the feed returns it.
+# Change numbers are handed out without a lock, so a write can commit after one that
+# took a later number; the lag gives it time to land before the token moves past it.
+# Keep it above the longest order-writing transaction.
+ORDER_CHANGES_VISIBILITY_LAG = float(os.getenv('ORDER_CHANGES_VISIBILITY_LAG', '2'))
+
+# Live order events (Server-Sent Events). The local backplane only reaches
+# streams in the same process; use orders.events.RedisBackplane with several workers
+# or with manage.py run_workers (gunicorn.asgi.conf.py uses it and refuses the local one).
+ORDER_EVENTS_BACKPLANE = os.getenv('ORDER_EVENTS_BACKPLANE', 'orders.events.LocalBackplane')
+ORDER_EVENTS_REDIS_URL = os.getenv('ORDER_EVENTS_REDIS_URL', 'redis://localhost:6379/0')
+ORDER_EVENTS_BACKLOG = int(os.getenv('ORDER_EVENTS_BACKLOG', '500'))
+# The stream holds its connection open for as long as a dashboard is open, which would
+# tie up a whole sync worker under WSGI, so it is only served under ASGI (gunicorn.asgi.conf.py
+# turns it on). Dashboards fall back to polling while it is off.
+ORDER_EVENT_STREAM = os.getenv('ORDER_EVENT_STREAM', 'False').lower() == 'true'
+
+# How long (seconds) a checkout Idempotency-Key and its stored response are kept
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', '86400'))
+
+# Background jobs (manage.py run_workers): retries, backoff (seconds) and
+# when a running job is considered abandoned by a dead worker
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '5'))
+JOB_RETRY_BASE_DELAY = int(os.getenv('JOB_RETRY_BASE_DELAY', '10'))
+JOB_RETRY_MAX_DELAY = int(os.getenv('JOB_RETRY_MAX_DELAY', '3600'))
+JOB_STALE_AFTER = int(os.getenv('JOB_STALE_AFTER', '900'))
+# How long (seconds) finished jobs are kept before jobs.purge_finished_jobs deletes them
+JOB_DONE_RETENTION = int(os.getenv('JOB_DONE_RETENTION', str(7 * 86400)))
+JOB_FAILED_RETENTION = int(os.getenv('JOB_FAILED_RETENTION', str(30 * 86400)))
+# Jobs queued again every N seconds by the run_workers process
+JOB_SCHEDULE = {
+    'payments.expire_pending_payments': 15 * 60,
+    'orders.refresh_sales_rollups': 60 * 60,
+    'jobs.purge_finished_jobs': 24 * 60 * 60,
+}
+
+# Pending payments older than this (seconds) are marked failed
+PAYMENT_PENDING_TIMEOUT = int(os.getenv('PAYMENT_PENDING_TIMEOUT', '86400'))
+
+# Uploaded meal images are scaled down to fit within this many pixels
+MEAL_IMAGE_MAX_SIZE = int(os.getenv('MEAL_IMAGE_MAX_SIZE', '1200'))
+
+# Keyword lists used to categorize meals by name, as {category: [keywords]} in
+# priority order; None uses the built-in lists in meals.categories
+MEAL_CATEGORY_KEYWORDS = None
+
+# Seconds to wait when downloading a meal image given by URL in a menu import,
+# and the largest download accepted (bytes)
+MEAL_IMAGE_DOWNLOAD_TIMEOUT = int(os.getenv('MEAL_IMAGE_DOWNLOAD_TIMEOUT', '20'))
+MEAL_IMAGE_MAX_DOWNLOAD_BYTES = int(os.getenv('MEAL_IMAGE_MAX_DOWNLOAD_BYTES', str(10 * 1024 * 1024)))
+
+# Where archived orders are written (orders.archive): local disk by default, or
+# e.g. ORDER_ARCHIVE_STORAGE_BACKEND=storages.backends.s3boto3.S3Boto3Storage with
+# ORDER_ARCHIVE_LOCATION as the key prefix in AWS_STORAGE_BUCKET_NAME.
+# Archives are Parquet when pyarrow is installed, gzip JSONL otherwise.
+ORDER_ARCHIVE_STORAGE = {
+    'BACKEND': os.getenv('ORDER_ARCHIVE_STORAGE_BACKEND', 'django.core.files.storage.FileSystemStorage'),
+    'OPTIONS': {'location': os.getenv('ORDER_ARCHIVE_LOCATION', str(BASE_DIR / 'archive'))},
+}
+
+# Serve the menu, order tracking and analytics from native async views. Turned
+# on by the ASGI gunicorn profile (gunicorn.asgi.conf.py); under sync workers
+# the DRF views are faster
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'False').lower() == 'true'
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -280,6 +363,22 @@ REST_FRAMEWORK = {
     'EXCEPTION_HANDLER': 'dinedash.utils.custom_exception_handler',
 }
 
+# Per-request query counts and timings (dinedash.instrumentation): the
+# Server-Timing header, a warning for requests slower than SLOW_REQUEST_THRESHOLD_MS
+# (every request is logged at DEBUG), and an opt-in log of slow queries
+REQUEST_METRICS_SERVER_TIMING = os.getenv('REQUEST_METRICS_SERVER_TIMING', 'True').lower() == 'true'
+SLOW_REQUEST_THRESHOLD_MS = int(os.getenv('SLOW_REQUEST_THRESHOLD_MS', '1000'))
+SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG', 'False').lower() == 'true'
+SLOW_QUERY_THRESHOLD_MS = int(os.getenv('SLOW_QUERY_THRESHOLD_MS', '100'))
+
+# Prometheus metrics at /metrics (dinedash.metrics). When set, scrapers must send
+# "Authorization: Bearer <token>"
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Load testing (benchmarks/) only: the rate limits would reject most of a run
+if os.getenv('DISABLE_THROTTLING', 'False').lower() == 'true':
+    REST_FRAMEWORK['DEFAULT_THROTTLE_CLASSES'] = []
+
 # Logging configuration
 LOGGING = {
     'version': 1,
@@ -294,8 +393,8 @@ LOGGING = {
             'style': '{',
         },
         'json': {
-            'format': '{"timestamp": "%(asctime)s", "level": "%(levelname)s", "module": "%(module)s", "message": "%(message)s"}',
-            'class': 'logging.Formatter',
+            # Also writes the fields passed with extra=, e.g. the request metrics
+            '()': 'dinedash.logs.JSONFormatter',
         },
     },
     'handlers': {
@@ -338,6 +437,10 @@ FLUTTERWAVE_PUBLIC_KEY = os.getenv('FLUTTERWAVE_PUBLIC_KEY', 'd44043e1-3ead-4cc1
 FLUTTERWAVE_SECRET_KEY = os.getenv('FLUTTERWAVE_SECRET_KEY', 'ItZfEZE8pASHnTapuJl9cw0XQ8YxSszH')
 FLUTTERWAVE_BASE_URL = os.getenv('FLUTTERWAVE_BASE_URL', 'https://api.flutterwave.com/v3')
 
+# Tracking codes are a keyed permutation of the order ID. Never change this
+# key once codes have been issued, or new codes may collide with old ones.
+TRACKING_CODE_KEY = os.getenv('TRACKING_CODE_KEY', 'dinedash-tracking-codes')
+
 # File upload settings
 DATA_UPLOAD_MAX_MEMORY_SIZE = int(os.getenv('DATA_UPLOAD_MAX_MEMORY_SIZE', '10485760'))  # 10MB default
 FILE_UPLOAD_MAX_MEMORY_SIZE = int(os.getenv('FILE_UPLOAD_MAX_MEMORY_SIZE', '10485760'))  # 10MB default
\ No newline at end of file
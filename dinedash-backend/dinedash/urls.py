@@ -20,6 +20,8 @@ from django.http import JsonResponse
 from django.conf import settings
 from django.conf.urls.static import static
 
+from .metrics import metrics_view
+
 def health_check(request):
     return JsonResponse({"status": "ok"})
 
@@ -32,6 +34,8 @@ urlpatterns = [
     path('api/auth/', include('dj_rest_auth.urls')),
     path('api/auth/registration/', include('dj_rest_auth.registration.urls')),
     path('healthz/', health_check),
+    # Prometheus scrape endpoint, summed over all gunicorn workers (see dinedash.metrics)
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 # Media files are handled by S3 when AWS credentials are configured
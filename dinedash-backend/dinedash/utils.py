@@ -1,10 +1,20 @@
 """
 Custom utilities for DineDash backend.
 """
+import hashlib
+import json
 import logging
+import time
+from collections import Counter
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.utils.dateparse import parse_date
 from rest_framework.views import exception_handler
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 
 logger = logging.getLogger(__name__)
 
@@ -82,4 +92,149 @@ def sanitize_input(data):
     elif isinstance(data, list):
         return [sanitize_input(item) for item in data]
     else:
-        return data
\ No newline at end of file
+        return data
+
+
+def filter_by_params(queryset, params, choices):
+    """
+    Apply exact-match and date range filters from query parameters.
+
+    Args:
+        queryset: QuerySet of a model with a created_at field
+        params: request.query_params
+        choices: Dict of query parameter -> allowed values, e.g. {'status': [...]}
+
+    Date filters (start_date/end_date, YYYY-MM-DD, inclusive) become a
+    created_at range rather than a __date lookup so they can use the index.
+
+    Returns:
+        The filtered QuerySet
+    """
+    for field, allowed in choices.items():
+        value = params.get(field)
+        if value:
+            if value not in allowed:
+                raise ValidationError({field: f"Invalid {field} '{value}'."})
+            queryset = queryset.filter(**{field: value})
+
+    for param, lookup, offset in (('start_date', 'created_at__gte', 0), ('end_date', 'created_at__lt', 1)):
+        value = params.get(param)
+        if not value:
+            continue
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            raise ValidationError({param: "Dates must be in YYYY-MM-DD format."})
+        day += timezone.timedelta(days=offset)
+        start_of_day = timezone.make_aware(timezone.datetime.combine(day, timezone.datetime.min.time()))
+        queryset = queryset.filter(**{lookup: start_of_day})
+
+    return queryset
+
+
+def make_etag(*parts):
+    """
+    Build a strong ETag from the values that identify a version of a resource.
+
+    Args:
+        parts: Values (IDs, timestamps, versions) that change whenever the body does
+
+    Returns:
+        A quoted ETag string
+    """
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()
+    return quote_etag(digest)
+
+
+def set_validators(response, etag, last_modified=None):
+    """
+    Attach ETag/Last-Modified headers and ask clients to revalidate before reusing the body.
+    """
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def conditional_response(request, etag, last_modified=None):
+    """
+    Evaluate If-None-Match/If-Modified-Since (and If-Match) for a resource.
+
+    Args:
+        request: The incoming request
+        etag: Current ETag of the resource (see make_etag)
+        last_modified: Aware datetime of the last change, if known
+
+    Returns:
+        A 304 (or 412) response when the client's copy is still current, otherwise None
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def estimate_count(queryset):
+    """
+    Estimate how many rows a queryset matches without counting them.
+
+    On PostgreSQL this asks the planner (EXPLAIN), which is instant even on
+    huge tables; other databases fall back to COUNT(*).
+
+    Returns:
+        An approximate row count
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def delete_in_batches(queryset, batch_size=1000, sleep=0, progress=None):
+    """
+    Delete the rows of a queryset in primary-key order, one short transaction per batch.
+
+    Each batch is found with a keyset (pk > last pk) query, so no batch has to
+    skip over rows already looked at, and cascades only ever load one batch's
+    related rows. Deleting everything with one .delete() would instead hold a
+    single long transaction and collect every related row in memory.
+
+    Args:
+        queryset: Rows to delete
+        batch_size: Rows of the queryset's model per batch
+        sleep: Seconds to pause between batches, to leave room for live traffic
+        progress: Optional callable receiving the running totals after each batch
+
+    Returns:
+        A Counter of deleted rows per model label, including cascades
+    """
+    deleted = Counter()
+    last_pk = None
+    while True:
+        batch = queryset.order_by('pk')
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        pks = list(batch.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return deleted
+
+        with transaction.atomic(using=queryset.db):
+            _, per_model = queryset.model._base_manager.using(queryset.db).filter(pk__in=pks).delete()
+        deleted.update(per_model)
+        last_pk = pks[-1]
+
+        if progress:
+            progress(deleted)
+        if sleep:
+            time.sleep(sleep)
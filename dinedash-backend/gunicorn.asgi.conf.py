@@ -0,0 +1,57 @@
+# ASGI profile: uvicorn workers serving dinedash.asgi:application
+#
+#   gunicorn --config gunicorn.asgi.conf.py dinedash.asgi:application
+#
+# Each worker runs an event loop, so slow queries on the async read views and
+# long-lived streams (orders/stream/) hold a coroutine instead of a process.
+# Fewer workers are needed than with the sync profile in gunicorn.conf.py.
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+# Route the menu, tracking and analytics reads to their async views
+os.environ.setdefault('ASYNC_READ_VIEWS', 'True')
+# Serve the live order stream (orders/stream/), which only makes sense on an event loop
+os.environ.setdefault('ORDER_EVENT_STREAM', 'True')
+# Events are published by every worker and by manage.py run_workers (async checkouts),
+# so streams need a backplane that crosses processes (ORDER_EVENTS_REDIS_URL)
+os.environ.setdefault('ORDER_EVENTS_BACKPLANE', 'orders.events.RedisBackplane')
+
+bind = "0.0.0.0:8000"
+workers = multiprocessing.cpu_count() + 1
+worker_class = "uvicorn_worker.UvicornWorker"
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+max_requests = 1000
+max_requests_jitter = 50
+preload_app = True
+accesslog = "-"
+errorlog = "-"
+loglevel = "info"
+
+# With the local backplane each stream would only see its own worker's events, and
+# dashboards stop polling once their stream opens, so they would miss orders
+if (os.environ['ORDER_EVENT_STREAM'].lower() == 'true'
+        and os.environ['ORDER_EVENTS_BACKPLANE'] == 'orders.events.LocalBackplane'):
+    raise RuntimeError(
+        "ORDER_EVENT_STREAM needs a backplane shared by all processes: set "
+        "ORDER_EVENTS_BACKPLANE=orders.events.RedisBackplane, or ORDER_EVENT_STREAM=False."
+    )
+
+# Prometheus metrics: each worker writes its counters to files in this directory
+# and /metrics adds them up (see dinedash.metrics). Set before the app is loaded.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'dinedash-metrics'))
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+
+def on_starting(server):
+    # Files left by an earlier run would be added to this run's counters
+    shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
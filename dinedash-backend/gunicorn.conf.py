@@ -1,4 +1,7 @@
 import multiprocessing
+import os
+import shutil
+import tempfile
 
 bind = "0.0.0.0:8000"
 workers = multiprocessing.cpu_count() * 2 + 1
@@ -11,4 +14,20 @@ max_requests_jitter = 50
 preload_app = True
 accesslog = "-"
 errorlog = "-"
-loglevel = "info"
\ No newline at end of file
+loglevel = "info"
+
+# Prometheus metrics: each worker writes its counters to files in this directory
+# and /metrics adds them up (see dinedash.metrics). Set before the app is loaded.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'dinedash-metrics'))
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+
+def on_starting(server):
+    # Files left by an earlier run would be added to this run's counters
+    shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Avg, Count, Max, Q
+from django.utils import timezone
+
+from jobs.models import Job
+
+
+class Command(BaseCommand):
+    help = 'Show per-job counts, failures and run times'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help='Only include jobs queued in the last N hours')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timezone.timedelta(hours=options['hours'])
+        rows = (
+            Job.objects.filter(created_at__gte=since)
+            .values('name')
+            .annotate(
+                total=Count('id'),
+                queued=Count('id', filter=Q(status=Job.STATUS_QUEUED)),
+                failed=Count('id', filter=Q(status=Job.STATUS_FAILED)),
+                retried=Count('id', filter=Q(attempts__gt=1)),
+                avg_ms=Avg('duration_ms', filter=Q(status=Job.STATUS_DONE)),
+                max_ms=Max('duration_ms', filter=Q(status=Job.STATUS_DONE)),
+            )
+            .order_by('name')
+        )
+        if not rows:
+            self.stdout.write(f"No jobs in the last {options['hours']} hours")
+            return
+
+        self.stdout.write(f"{'job':<40} {'total':>6} {'queued':>6} {'failed':>6} {'retried':>7} {'avg ms':>8} {'max ms':>8}")
+        for row in rows:
+            self.stdout.write(
+                f"{row['name']:<40} {row['total']:>6} {row['queued']:>6} {row['failed']:>6} {row['retried']:>7} "
+                f"{row['avg_ms'] or 0:>8.0f} {row['max_ms'] or 0:>8}"
+            )
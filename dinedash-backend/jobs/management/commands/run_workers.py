@@ -0,0 +1,100 @@
+import multiprocessing
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from jobs.queue import Worker, requeue_stale, schedule_periodic
+
+# How often (seconds) the main process queues periodic jobs and rescues jobs from dead workers
+HOUSEKEEPING_INTERVAL = 30
+
+
+def run_threads(count, poll_interval, stop):
+    """ Runs ``count`` worker threads until ``stop`` is set. Used by every worker process. """
+    threads = [
+        threading.Thread(
+            target=Worker(poll_interval=poll_interval).run_forever,
+            args=(stop,),
+            name=f'job-worker-{number}',
+        )
+        for number in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_process(count, poll_interval):
+    """ Entry point of a child worker process: stop on SIGTERM, like the parent. """
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    signal.signal(signal.SIGINT, lambda *args: stop.set())
+    run_threads(count, poll_interval, stop)
+
+
+class Command(BaseCommand):
+    help = 'Run background job workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=2, help='Worker threads per process')
+        parser.add_argument(
+            '--processes', type=int, default=0,
+            help='Worker processes to start, each with --threads threads (default: threads in this process)',
+        )
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Run the jobs that are due now and exit')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            requeue_stale()
+            schedule_periodic()
+            count = Worker().run_until_empty()
+            self.stdout.write(self.style.SUCCESS(f'Ran {count} jobs'))
+            return
+
+        stop = threading.Event()
+        # Finish the current jobs and exit when the platform stops the process
+        signal.signal(signal.SIGTERM, lambda *args: stop.set())
+
+        if options['processes']:
+            # Children must not share the parent's database connection
+            connection.close()
+            workers = [
+                multiprocessing.Process(
+                    target=run_process,
+                    args=(options['threads'], options['poll_interval']),
+                    name=f'job-worker-process-{number}',
+                )
+                for number in range(options['processes'])
+            ]
+        else:
+            workers = [threading.Thread(
+                target=run_threads,
+                args=(options['threads'], options['poll_interval'], stop),
+                name='job-workers',
+            )]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(
+            f"Started {options['threads'] * max(options['processes'], 1)} job workers "
+            f"in {max(options['processes'], 1)} process(es)"
+        )
+
+        try:
+            while not stop.is_set() and any(worker.is_alive() for worker in workers):
+                requeue_stale()
+                schedule_periodic()
+                stop.wait(HOUSEKEEPING_INTERVAL)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stdout.write('Stopping job workers after their current job...')
+            stop.set()
+            for worker in workers:
+                if isinstance(worker, multiprocessing.Process):
+                    worker.terminate()
+                worker.join()
+            connection.close()
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0002_retries_and_timing'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['name', 'status', 'run_after'], name='jobs_job_name_12a711_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['status', 'finished_at'], name='jobs_job_status_d700c4_idx'),
+        ),
+    ]
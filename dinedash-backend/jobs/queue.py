@@ -0,0 +1,204 @@
+"""
+Database-backed job queue.
+
+Request handlers hand slow work to a background worker in one line:
+
+    enqueue('orders.initiate_checkout_payment', payment_id=payment.id)
+
+The job row is written in the caller's transaction, so a job only becomes
+visible to workers if the work that created it commits, and never before.
+Job functions register themselves with ``@task(name)`` in an app's
+``tasks.py``; the jobs app imports every ``tasks.py`` at startup. Jobs may
+run more than once (after a retry or a worker crash), so job functions
+must be safe to repeat.
+
+Workers (``manage.py run_workers``) claim due jobs oldest first. Where the
+database supports it (Postgres), a claim uses SELECT ... FOR UPDATE SKIP
+LOCKED so workers never wait on each other. SQLite has no row locks, so
+there a worker claims with a conditional UPDATE and moves on to the next
+candidate if another worker got there first.
+
+A failed job is retried with exponential backoff until it has been tried
+``max_attempts`` times. Jobs listed in ``settings.JOB_SCHEDULE`` are queued
+again every interval by the run_workers process.
+
+Finished jobs are kept for a while for job_stats and debugging, then deleted
+by the scheduled ``jobs.purge_finished_jobs`` job (see purge_finished).
+"""
+import logging
+import random
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from dinedash.utils import delete_in_batches
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+CLAIM_CANDIDATES = 10
+
+_registry = {}
+
+
+def task(name):
+    """ Registers a function as the job called ``name``. It receives the job's payload as keyword arguments. """
+    def register(func):
+        _registry[name] = func
+        return func
+    return register
+
+
+def enqueue(name, /, run_after=None, max_attempts=None, **payload):
+    """ Queues a job in the current transaction. The payload must be JSON serialisable. """
+    if name not in _registry:
+        raise ValueError(f"Unknown job '{name}'.")
+    return Job.objects.create(
+        name=name,
+        payload=payload,
+        run_after=run_after or timezone.now(),
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+    )
+
+
+def claim(worker_id):
+    """ Marks the oldest due job as running for this worker and returns it, or None if there is nothing to do. """
+    now = timezone.now()
+    due = Job.objects.filter(status=Job.STATUS_QUEUED, run_after__lte=now).order_by('run_after', 'id')
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job = due.select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            job.status = Job.STATUS_RUNNING
+            job.locked_by = worker_id
+            job.started_at = now
+            job.attempts += 1
+            job.save(update_fields=['status', 'locked_by', 'started_at', 'attempts'])
+            return job
+
+    for candidate in due.values_list('pk', flat=True)[:CLAIM_CANDIDATES]:
+        claimed = Job.objects.filter(pk=candidate, status=Job.STATUS_QUEUED).update(
+            status=Job.STATUS_RUNNING, locked_by=worker_id, started_at=now, attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return Job.objects.get(pk=candidate)
+    return None
+
+
+def retry_delay(attempts):
+    """ Seconds to wait before the next try: doubles with every attempt, capped, with some jitter
+        so that jobs that failed together don't all retry together. """
+    delay = min(settings.JOB_RETRY_BASE_DELAY * 2 ** (attempts - 1), settings.JOB_RETRY_MAX_DELAY)
+    return delay * random.uniform(0.75, 1.25)
+
+
+def run(job):
+    """ Runs a claimed job in its own transaction and records the outcome. Returns True on success. """
+    started = time.monotonic()
+    try:
+        func = _registry.get(job.name)
+        if func is None:
+            raise LookupError(f"No job function registered as '{job.name}'.")
+        with transaction.atomic():
+            func(**job.payload)
+    except Exception as e:
+        duration_ms = int((time.monotonic() - started) * 1000)
+        now = timezone.now()
+        if job.attempts < job.max_attempts:
+            delay = retry_delay(job.attempts)
+            logger.warning(
+                f"Job {job.name} #{job.pk} failed after {duration_ms} ms (attempt {job.attempts} of "
+                f"{job.max_attempts}), retrying in {delay:.0f}s: {str(e)}"
+            )
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.STATUS_QUEUED, run_after=now + timezone.timedelta(seconds=delay),
+                last_error=str(e), locked_by='', duration_ms=duration_ms,
+            )
+        else:
+            logger.error(f"Job {job.name} #{job.pk} failed for good after {job.attempts} attempts: {str(e)}")
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.STATUS_FAILED, last_error=str(e), finished_at=now, duration_ms=duration_ms,
+            )
+        return False
+
+    duration_ms = int((time.monotonic() - started) * 1000)
+    logger.info(f"Job {job.name} #{job.pk} finished in {duration_ms} ms")
+    Job.objects.filter(pk=job.pk).update(
+        status=Job.STATUS_DONE, last_error='', finished_at=timezone.now(), duration_ms=duration_ms,
+    )
+    return True
+
+
+def requeue_stale():
+    """ Puts jobs back in the queue whose worker died while running them. Returns how many were requeued. """
+    cutoff = timezone.now() - timezone.timedelta(seconds=settings.JOB_STALE_AFTER)
+    stale = Job.objects.filter(status=Job.STATUS_RUNNING, started_at__lt=cutoff)
+    error = 'The worker stopped before the job finished.'
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.STATUS_FAILED, last_error=error, finished_at=timezone.now(),
+    )
+    return stale.update(status=Job.STATUS_QUEUED, last_error=error, locked_by='')
+
+
+def purge_finished(batch_size=1000, sleep=0):
+    """ Deletes done jobs older than settings.JOB_DONE_RETENTION and failed ones older than
+        settings.JOB_FAILED_RETENTION (both in seconds), in batches. Returns how many were deleted. """
+    now = timezone.now()
+    deleted = 0
+    for status, retention in [(Job.STATUS_DONE, settings.JOB_DONE_RETENTION),
+                              (Job.STATUS_FAILED, settings.JOB_FAILED_RETENTION)]:
+        old = Job.objects.filter(status=status, finished_at__lt=now - timezone.timedelta(seconds=retention))
+        deleted += delete_in_batches(old, batch_size=batch_size, sleep=sleep)[Job._meta.label]
+    return deleted
+
+
+def schedule_periodic():
+    """ Queues the next run of every job in settings.JOB_SCHEDULE ({name: seconds}) that has none pending. """
+    now = timezone.now()
+    for name, interval in settings.JOB_SCHEDULE.items():
+        jobs = Job.objects.filter(name=name)
+        if jobs.filter(status__in=[Job.STATUS_QUEUED, Job.STATUS_RUNNING]).exists():
+            continue
+        last_run = jobs.order_by('-run_after').values_list('run_after', flat=True).first()
+        next_run = last_run + timezone.timedelta(seconds=interval) if last_run else now
+        enqueue(name, run_after=max(next_run, now))
+
+
+class Worker:
+    """ Claims and runs jobs one at a time until stopped. Each worker thread needs its own Worker. """
+
+    def __init__(self, worker_id=None, poll_interval=1.0):
+        self.worker_id = worker_id or f'worker-{uuid.uuid4().hex[:8]}'
+        self.poll_interval = poll_interval
+
+    def run_once(self):
+        """ Runs one due job. Returns False if there was none. """
+        job = claim(self.worker_id)
+        if job is None:
+            return False
+        run(job)
+        return True
+
+    def run_until_empty(self):
+        """ Runs due jobs until none are left, and returns how many ran. """
+        count = 0
+        while self.run_once():
+            count += 1
+        return count
+
+    def run_forever(self, stop=None):
+        stop = stop or threading.Event()
+        try:
+            while not stop.is_set():
+                close_old_connections()
+                if not self.run_once():
+                    stop.wait(self.poll_interval)
+        finally:
+            connection.close()
@@ -0,0 +1,15 @@
+"""
+Background jobs for the job queue itself, run by ``manage.py run_workers``.
+"""
+import logging
+
+from .queue import purge_finished, task
+
+logger = logging.getLogger(__name__)
+
+
+@task('jobs.purge_finished_jobs')
+def purge_finished_jobs():
+    deleted = purge_finished()
+    if deleted:
+        logger.info(f"Deleted {deleted} finished jobs past their retention")
@@ -0,0 +1,127 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .models import Job
+from .queue import Worker, claim, enqueue, purge_finished, requeue_stale, run, schedule_periodic, task
+
+calls = []
+
+
+@task('jobs.tests.record')
+def record(value):
+    calls.append(value)
+
+
+@task('jobs.tests.tick')
+def tick():
+    calls.append('tick')
+
+
+@task('jobs.tests.explode')
+def explode():
+    raise RuntimeError('boom')
+
+
+class JobQueueTests(TestCase):
+    """ Jobs are claimed oldest first, run once and record their outcome. """
+
+    def setUp(self):
+        calls.clear()
+
+    def test_jobs_run_in_order_and_only_once(self):
+        enqueue('jobs.tests.record', value=1)
+        enqueue('jobs.tests.record', value=2)
+        enqueue('jobs.tests.record', value=3, run_after=timezone.now() + timezone.timedelta(hours=1))
+
+        self.assertEqual(Worker().run_until_empty(), 2)
+        self.assertEqual(calls, [1, 2])
+        self.assertEqual(Job.objects.filter(status=Job.STATUS_DONE).count(), 2)
+        self.assertIsNone(claim('another-worker'))
+
+    def test_jobs_from_rolled_back_transactions_never_run(self):
+        with transaction.atomic():
+            enqueue('jobs.tests.record', value=1)
+            transaction.set_rollback(True)
+        self.assertFalse(Job.objects.exists())
+
+    def test_failures_are_retried_with_backoff_then_given_up(self):
+        enqueue('jobs.tests.explode', max_attempts=2)
+        job = claim('worker-1')
+        self.assertEqual((job.status, job.attempts, job.locked_by), (Job.STATUS_RUNNING, 1, 'worker-1'))
+
+        self.assertFalse(run(job))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.last_error), (Job.STATUS_QUEUED, 'boom'))
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIsNone(claim('worker-1'))
+
+        Job.objects.update(run_after=timezone.now())
+        self.assertFalse(run(claim('worker-1')))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_FAILED, 2))
+        self.assertIsNotNone(job.duration_ms)
+
+    @override_settings(JOB_STALE_AFTER=60)
+    def test_jobs_of_dead_workers_are_requeued(self):
+        enqueue('jobs.tests.record', value=1)
+        claim('dead-worker')
+        Job.objects.update(started_at=timezone.now() - timezone.timedelta(minutes=5))
+
+        self.assertEqual(requeue_stale(), 1)
+        self.assertEqual(Worker().run_until_empty(), 1)
+        self.assertEqual(calls, [1])
+
+    @override_settings(JOB_SCHEDULE={'jobs.tests.tick': 600})
+    def test_periodic_jobs_are_queued_once_per_interval(self):
+        schedule_periodic()
+        schedule_periodic()
+        self.assertEqual(Worker().run_until_empty(), 1)
+
+        schedule_periodic()
+        next_run = Job.objects.get(status=Job.STATUS_QUEUED).run_after
+        self.assertGreater(next_run, timezone.now() + timezone.timedelta(seconds=500))
+        self.assertEqual(calls, ['tick'])
+
+    @override_settings(JOB_DONE_RETENTION=3600, JOB_FAILED_RETENTION=7200)
+    def test_finished_jobs_are_purged_after_their_retention(self):
+        now = timezone.now()
+        old_done = enqueue('jobs.tests.tick')
+        recent_done = enqueue('jobs.tests.tick')
+        old_failed = enqueue('jobs.tests.explode')
+        recent_failed = enqueue('jobs.tests.explode')
+        queued = enqueue('jobs.tests.tick', run_after=now - timezone.timedelta(days=1))
+        for job, status, age in [(old_done, Job.STATUS_DONE, 2), (recent_done, Job.STATUS_DONE, 0.5),
+                                 (old_failed, Job.STATUS_FAILED, 3), (recent_failed, Job.STATUS_FAILED, 1.5)]:
+            Job.objects.filter(pk=job.pk).update(status=status, finished_at=now - timezone.timedelta(hours=age))
+
+        self.assertEqual(purge_finished(batch_size=1), 2)
+        self.assertEqual(
+            set(Job.objects.values_list('pk', flat=True)), {recent_done.pk, recent_failed.pk, queued.pk},
+        )
+
+    def test_job_stats(self):
+        enqueue('jobs.tests.record', value=1)
+        enqueue('jobs.tests.explode', max_attempts=1)
+        Worker().run_until_empty()
+
+        out = StringIO()
+        call_command('job_stats', stdout=out)
+        lines = {line.split()[0]: line.split()[1:] for line in out.getvalue().splitlines()[1:]}
+        self.assertEqual(lines['jobs.tests.record'][:3], ['1', '0', '0'])
+        self.assertEqual(lines['jobs.tests.explode'][:3], ['1', '0', '1'])
+
+    def test_unknown_jobs_are_rejected_when_queued(self):
+        with self.assertRaises(ValueError):
+            enqueue('jobs.tests.missing')
+
+    @override_settings(JOB_SCHEDULE={})
+    def test_run_workers_once_drains_the_queue(self):
+        enqueue('jobs.tests.record', value='a')
+        out = StringIO()
+        call_command('run_workers', '--once', stdout=out)
+        self.assertEqual(calls, ['a'])
+        self.assertIn('Ran 1 jobs', out.getvalue())
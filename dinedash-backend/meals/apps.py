@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class MealsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'meals'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+        from .cache import invalidate_menu
+        from .models import Meal
+
+        # Any change to a meal invalidates the cached menu
+        post_save.connect(invalidate_menu, sender=Meal, dispatch_uid='meals.invalidate_menu.save')
+        post_delete.connect(invalidate_menu, sender=Meal, dispatch_uid='meals.invalidate_menu.delete')
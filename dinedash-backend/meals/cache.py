@@ -0,0 +1,201 @@
+"""
+Menu cache.
+
+The rendered menu is cached in two layers: a small per-process LRU in front
+of the shared Django cache (``settings.MENU_CACHE_ALIAS``, which can be
+locmem, file based or Redis). Every entry is keyed by a menu version counter
+that is bumped whenever a meal is created, updated or deleted, so stale
+entries are never served and simply age out.
+
+Entries are (content, etag, last_modified) tuples so conditional requests
+can be answered without touching the database either.
+
+The a-prefixed methods (aversion, akey_for, aget, aset, alast_modified) are
+for async views: they use the cache's async API, so a Redis or file cache
+round trip doesn't block the event loop.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlencode, urlsplit, urlunsplit
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from rest_framework.response import Response
+
+VERSION_KEY = 'menu:version'
+CHANGED_AT_KEY = 'menu:changed_at'
+
+# The query parameters the menu list reads. Anything else a client adds is left
+# out of cache keys and page links, so it can't create new cache entries
+MENU_QUERY_PARAMS = ('page',)
+
+
+def canonical_menu_url(url):
+    """ The URL with only MENU_QUERY_PARAMS, in a fixed order, and page numbers without leading zeros. """
+    parts = urlsplit(url)
+    params = parse_qs(parts.query)
+    kept = []
+    for name in MENU_QUERY_PARAMS:
+        if params.get(name):
+            # Like request.GET.get(), the last value wins
+            value = params[name][-1]
+            kept.append((name, str(int(value)) if value.isascii() and value.isdigit() else value))
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(kept), ''))
+
+
+class PrerenderedJSONResponse(Response):
+    """ A DRF response whose JSON body was rendered earlier, e.g. taken from a cache.
+
+        The bytes are sent as-is; ``data`` is only decoded if something asks for it. """
+
+    def __init__(self, content, status=None, headers=None):
+        self.prerendered_content = content
+        super().__init__(status=status, headers=headers, content_type='application/json')
+
+    @property
+    def data(self):
+        if self._data is None and self.prerendered_content:
+            self._data = json.loads(self.prerendered_content)
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+    @property
+    def rendered_content(self):
+        self['Content-Type'] = self.content_type
+        return self.prerendered_content
+
+
+class MenuCache:
+    def __init__(self, alias=None, local_size=None, timeout=None):
+        self.alias = alias or getattr(settings, 'MENU_CACHE_ALIAS', 'default')
+        self.local_size = local_size if local_size is not None else getattr(settings, 'MENU_CACHE_LOCAL_SIZE', 32)
+        self.timeout = timeout if timeout is not None else getattr(settings, 'MENU_CACHE_TIMEOUT', 60 * 60 * 24)
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def version(self):
+        version = self.shared.get(VERSION_KEY)
+        if version is None:
+            # add() so that concurrent first requests agree on the starting version
+            self.shared.add(VERSION_KEY, 1, timeout=None)
+            version = self.shared.get(VERSION_KEY, 1)
+        return version
+
+    async def aversion(self):
+        """ version() for async views. """
+        version = await self.shared.aget(VERSION_KEY)
+        if version is None:
+            await self.shared.aadd(VERSION_KEY, 1, timeout=None)
+            version = await self.shared.aget(VERSION_KEY, 1)
+        return version
+
+    def bump(self):
+        """ Invalidates every cached menu response, in every process. """
+        try:
+            self.shared.incr(VERSION_KEY)
+        except ValueError:
+            self.shared.add(VERSION_KEY, 2, timeout=None)
+        self.shared.set(CHANGED_AT_KEY, timezone.now(), timeout=None)
+
+    def last_modified(self):
+        """ When the menu last changed: the newest Meal.updated_at, or the last
+            invalidation if that is later (deleting a meal leaves no updated_at behind). """
+        from .models import Meal
+
+        last_updated = Meal.objects.aggregate(last=Max('updated_at'))['last']
+        changed_at = self.shared.get(CHANGED_AT_KEY)
+        return max(filter(None, [last_updated, changed_at]), default=None)
+
+    async def alast_modified(self):
+        """ last_modified() for async views. """
+        from .models import Meal
+
+        last_updated = (await Meal.objects.aaggregate(last=Max('updated_at')))['last']
+        changed_at = await self.shared.aget(CHANGED_AT_KEY)
+        return max(filter(None, [last_updated, changed_at]), default=None)
+
+    def key_for(self, request):
+        """ Cache key for a request, tied to the current menu version.
+
+            The scheme, host and path are part of the key because the page links and
+            image URLs in the body are absolute, and so are the parameters the list
+            reads; any other query parameters are ignored (see canonical_menu_url). """
+        return f'menu:{self.version()}:{self._url_hash(request)}'
+
+    async def akey_for(self, request):
+        """ key_for() for async views. """
+        return f'menu:{await self.aversion()}:{self._url_hash(request)}'
+
+    @staticmethod
+    def _url_hash(request):
+        return hashlib.sha1(canonical_menu_url(request.build_absolute_uri()).encode()).hexdigest()
+
+    def get(self, key):
+        """ The cached (content, etag, last_modified) entry for a key, or None. """
+        entry = self._recall(key)
+        if entry is None:
+            entry = self.shared.get(key)
+            if entry is not None:
+                self._remember(key, entry)
+        return entry
+
+    async def aget(self, key):
+        """ get() for async views. """
+        entry = self._recall(key)
+        if entry is None:
+            entry = await self.shared.aget(key)
+            if entry is not None:
+                self._remember(key, entry)
+        return entry
+
+    def set(self, key, entry):
+        self.shared.set(key, entry, timeout=self.timeout)
+        self._remember(key, entry)
+
+    async def aset(self, key, entry):
+        """ set() for async views. """
+        await self.shared.aset(key, entry, timeout=self.timeout)
+        self._remember(key, entry)
+
+    def _recall(self, key):
+        with self._lock:
+            if key in self._local:
+                self._local.move_to_end(key)
+                return self._local[key]
+        return None
+
+    def _remember(self, key, entry):
+        if self.local_size <= 0:
+            return
+        with self._lock:
+            self._local[key] = entry
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+
+
+menu_cache = MenuCache()
+
+
+def invalidate_menu(**kwargs):
+    """ Signal receiver: bump the menu version once the change is committed.
+
+        Bumping before the commit could let a concurrent request cache the old
+        menu under the new version. """
+    transaction.on_commit(menu_cache.bump)
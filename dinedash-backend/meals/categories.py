@@ -0,0 +1,127 @@
+"""
+Keyword-based meal categorisation.
+
+Every category's keywords are compiled into a single regular expression,
+one named group per category, so a name is scanned once however many
+keywords there are. Keywords match anywhere in a name, so "burger" matches
+"Cheeseburger" and "cake" matches "Pancakes". The name is read left to
+right and each keyword found uses up its letters, so the "tea" inside
+"Steak" is never seen. When a name matches several categories, the one
+listed first wins.
+
+The keyword lists come from ``settings.MEAL_CATEGORY_KEYWORDS`` when set,
+otherwise from DEFAULT_KEYWORDS. default_categorizer() compiles them once
+per process (and again if the setting is changed, e.g. in tests).
+"""
+import re
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+
+from .cache import menu_cache
+from .models import Meal
+
+DEFAULT_KEYWORDS = {
+    Meal.CATEGORY_MAIN_COURSE: ['pizza', 'pasta', 'burger', 'steak', 'chicken', 'fish', 'rice', 'noodle', 'curry', 'grill'],
+    Meal.CATEGORY_DESSERTS: ['cake', 'ice cream', 'pie', 'cookie', 'brownie', 'pudding', 'tart', 'mousse', 'sorbet'],
+    Meal.CATEGORY_DRINKS: ['soda', 'juice', 'water', 'coffee', 'tea', 'beer', 'wine', 'cocktail', 'smoothie', 'milkshake'],
+    Meal.CATEGORY_APPETIZERS: ['salad', 'soup', 'fries', 'wings', 'nachos', 'spring roll', 'dumpling', 'bruschetta'],
+    Meal.CATEGORY_SIDES: ['bread', 'chips', 'sauce', 'dip', 'pickle', 'onion rings', 'coleslaw'],
+}
+
+
+class Categorizer:
+    """ Picks a category for a meal name from keyword lists ({category: [keywords]}, in priority order). """
+
+    def __init__(self, keywords=None):
+        keywords = keywords or getattr(settings, 'MEAL_CATEGORY_KEYWORDS', None) or DEFAULT_KEYWORDS
+        valid = {choice[0] for choice in Meal.CATEGORY_CHOICES}
+        unknown = set(keywords) - valid
+        if unknown:
+            raise ImproperlyConfigured(f"Unknown meal categories in keyword lists: {', '.join(sorted(unknown))}")
+
+        self.categories = [category for category, words in keywords.items() if words]
+        groups = []
+        for number, category in enumerate(self.categories):
+            # Longest first, so "ice cream" is tried before a shorter keyword at the same place
+            words = sorted({word.strip().lower() for word in keywords[category] if word.strip()}, key=len, reverse=True)
+            alternatives = '|'.join(r'\s+'.join(map(re.escape, word.split())) for word in words)
+            groups.append(f'(?P<c{number}>{alternatives})')
+        self.pattern = re.compile('|'.join(groups), re.IGNORECASE) if groups else None
+
+    def categorize(self, name):
+        """ The category for a meal name, or None if no keyword matches. """
+        if not self.pattern or not name:
+            return None
+        matched = [int(match.lastgroup[1:]) for match in self.pattern.finditer(name)]
+        return self.categories[min(matched)] if matched else None
+
+
+_default_categorizer = None
+
+
+def default_categorizer():
+    """ The Categorizer for the configured keyword lists, built on first use. """
+    global _default_categorizer
+    if _default_categorizer is None:
+        _default_categorizer = Categorizer()
+    return _default_categorizer
+
+
+@receiver(setting_changed)
+def reset_default_categorizer(setting, **kwargs):
+    global _default_categorizer
+    if setting == 'MEAL_CATEGORY_KEYWORDS':
+        _default_categorizer = None
+
+
+def recategorize(queryset=None, categorizer=None, dry_run=False, chunk_size=500, progress=None):
+    """
+    Sets the category of every meal whose name matches a keyword.
+
+    Args:
+        queryset: Meals to look at (default: all)
+        categorizer: Categorizer to use (default: the configured keywords)
+        dry_run: Work out the changes without writing them
+        chunk_size: Meals read, and written, at a time
+        progress: Called with (meal, old category, new category) for every change
+
+    Returns:
+        The number of meals changed (or that would be)
+
+    Only the category column is written, with one bulk_update per chunk.
+    Each chunk is committed on its own, so a large run never holds one long
+    transaction; if it stops partway, running it again picks up the rest.
+    Meals that match no keyword keep their category.
+    """
+    categorizer = categorizer or default_categorizer()
+    meals = (queryset if queryset is not None else Meal.objects.all()).only('id', 'name', 'category').order_by('pk')
+
+    changed = 0
+    last_pk = None
+    while True:
+        batch = meals.filter(pk__gt=last_pk) if last_pk is not None else meals
+        batch = list(batch[:chunk_size])
+        if not batch:
+            return changed
+        last_pk = batch[-1].pk
+
+        chunk = []
+        for meal in batch:
+            category = categorizer.categorize(meal.name)
+            if category is None or category == meal.category:
+                continue
+            if progress:
+                progress(meal, meal.category, category)
+            meal.category = category
+            chunk.append(meal)
+        changed += len(chunk)
+
+        if chunk and not dry_run:
+            with transaction.atomic():
+                Meal.objects.bulk_update(chunk, ['category'])
+                # bulk_update sends no signals
+                transaction.on_commit(menu_cache.bump)
@@ -0,0 +1,165 @@
+"""
+Bulk menu import.
+
+A menu (CSV with a header row, or a JSON list of objects) is upserted by
+meal name in a handful of queries whatever its size: rows are validated
+without touching the database, every name is looked up in one query, and
+meals are written with one ``bulk_create(update_conflicts=True)`` on
+``name`` per set of columns the rows give, where the database supports it
+(a bulk_create plus a bulk_update per column set elsewhere). Columns a row
+leaves out get the model defaults on a new meal and are left as they are
+on an existing one.
+
+Images are not part of the import. A row may give an ``image_url``, which
+a background job downloads and attaches after the import has committed.
+"""
+import csv
+import io
+import json
+
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from jobs.queue import enqueue
+from .cache import menu_cache
+from .models import Meal
+from .serializers import MealSerializer
+
+MAX_ROWS = 2000
+
+CREATED = 'created'
+UPDATED = 'updated'
+INVALID = 'invalid'
+
+# Columns written by an import; everything else on Meal is left alone
+MEAL_FIELDS = ['name', 'category', 'description', 'price', 'prep_time', 'is_available', 'is_veg']
+
+
+class MenuImportError(Exception):
+    """ The file could not be read as a menu. """
+
+
+class MealImportSerializer(MealSerializer):
+    """ Validates one import row without queries: names are resolved for the whole file at once. """
+    image = None
+    image_url = serializers.URLField(required=False, allow_blank=True, write_only=True)
+
+    class Meta(MealSerializer.Meta):
+        fields = MEAL_FIELDS + ['image_url']
+        extra_kwargs = {'name': {'validators': []}}
+
+    def validate_name(self, value):
+        return value.strip()
+
+
+def read_rows(fileobj, file_format):
+    """
+    Parse an uploaded menu.
+
+    Args:
+        fileobj: Binary file object
+        file_format: 'csv' or 'json'
+
+    Returns:
+        A list of row dicts
+    """
+    try:
+        text = fileobj.read().decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise MenuImportError("The file must be UTF-8 encoded.")
+
+    if file_format == 'csv':
+        # Empty cells mean "use the default" rather than an empty value
+        return [
+            {column.strip(): value for column, value in row.items() if column and value not in (None, '')}
+            for row in csv.DictReader(io.StringIO(text))
+        ]
+    try:
+        rows = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise MenuImportError(f"Invalid JSON: {str(e)}")
+    if isinstance(rows, dict):
+        rows = rows.get('meals')
+    if not isinstance(rows, list):
+        raise MenuImportError("JSON menus must be a list of meals, or an object with a 'meals' list.")
+    return rows
+
+
+def import_meals(rows, dry_run=False):
+    """
+    Upsert meals by name.
+
+    Args:
+        rows: List of dicts with MealSerializer fields, plus an optional image_url
+        dry_run: Validate and report what would happen without writing anything
+
+    Returns:
+        A list with one result per row, in order: {'row', 'name', 'result'}
+        where result is CREATED, UPDATED or INVALID (with 'errors'). If any row
+        is invalid nothing is written.
+    """
+    if len(rows) > MAX_ROWS:
+        raise MenuImportError(f"A menu import can have at most {MAX_ROWS} meals.")
+
+    results, valid, seen = [], [], set()
+    for number, row in enumerate(rows, start=1):
+        serializer = MealImportSerializer(data=row if isinstance(row, dict) else {})
+        if not serializer.is_valid():
+            results.append({'row': number, 'name': row.get('name') if isinstance(row, dict) else None,
+                            'result': INVALID, 'errors': serializer.errors})
+            continue
+        data = serializer.validated_data
+        if data['name'] in seen:
+            results.append({'row': number, 'name': data['name'], 'result': INVALID,
+                            'errors': {'name': ["This name appears more than once in the file."]}})
+            continue
+        seen.add(data['name'])
+        # What an existing meal gets updated with: only the columns the row gave
+        supplied = tuple(field for field in MEAL_FIELDS if field != 'name' and field in row)
+        valid.append((data, supplied))
+        results.append({'row': number, 'name': data['name'], 'result': None})
+
+    existing = set(Meal.objects.filter(name__in=seen).values_list('name', flat=True))
+    for result in results:
+        if result['result'] is None:
+            result['result'] = UPDATED if result['name'] in existing else CREATED
+
+    if dry_run or any(result['result'] == INVALID for result in results) or not valid:
+        return results
+
+    _write(valid, existing)
+    return results
+
+
+@transaction.atomic
+def _write(valid, existing):
+    now = timezone.now()
+    # One write per set of columns given, so each existing meal only has those columns updated
+    groups = {}
+    for data, supplied in valid:
+        meal = Meal(**{field: value for field, value in data.items() if field != 'image_url'}, updated_at=now)
+        groups.setdefault(supplied, []).append(meal)
+
+    if connection.features.supports_update_conflicts_with_target:
+        for supplied, meals in groups.items():
+            Meal.objects.bulk_create(
+                meals, update_conflicts=True, unique_fields=['name'], update_fields=[*supplied, 'updated_at'],
+            )
+    else:
+        ids = dict(Meal.objects.filter(name__in=existing).values_list('name', 'id'))
+        new = []
+        for supplied, meals in groups.items():
+            for meal in meals:
+                meal.pk = ids.get(meal.name)
+            new.extend(meal for meal in meals if meal.pk is None)
+            Meal.objects.bulk_update([meal for meal in meals if meal.pk is not None], [*supplied, 'updated_at'])
+        Meal.objects.bulk_create(new)
+
+    # Bulk writes send no signals, so refresh the menu ourselves
+    transaction.on_commit(menu_cache.bump)
+
+    image_urls = {data['name']: data['image_url'] for data, _ in valid if data.get('image_url')}
+    if image_urls:
+        for meal_id, name in Meal.objects.filter(name__in=image_urls).values_list('id', 'name'):
+            enqueue('meals.attach_image', meal_id=meal_id, url=image_urls[name])
@@ -1,34 +1,39 @@
-from django.core.management.base import BaseCommand
-from meals.models import Meal
+import json
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from meals.categories import Categorizer, recategorize
+
 
 class Command(BaseCommand):
     help = 'Categorize existing meals based on their names'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Show the changes without saving them')
+        parser.add_argument('--keywords', help='JSON file of {category: [keywords]} to use instead of the configured lists')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Meals read and written at a time')
+
     def handle(self, *args, **options):
-        # Keywords for categories
-        category_keywords = {
-            'main_course': ['pizza', 'pasta', 'burger', 'steak', 'chicken', 'fish', 'rice', 'noodle', 'curry', 'grill'],
-            'desserts': ['cake', 'ice cream', 'pie', 'cookie', 'brownie', 'pudding', 'tart', 'mousse', 'sorbet'],
-            'drinks': ['soda', 'juice', 'water', 'coffee', 'tea', 'beer', 'wine', 'cocktail', 'smoothie', 'milkshake'],
-            'appetizers': ['salad', 'soup', 'fries', 'wings', 'nachos', 'spring roll', 'dumpling', 'bruschetta'],
-            'sides': ['bread', 'chips', 'sauce', 'dip', 'pickle', 'onion rings', 'coleslaw']
-        }
-
-        updated_count = 0
-        for meal in Meal.objects.all():
-            meal_name_lower = meal.name.lower()
-            categorized = False
-            for category, keywords in category_keywords.items():
-                if any(keyword in meal_name_lower for keyword in keywords):
-                    if meal.category != category:
-                        meal.category = category
-                        meal.save()
-                        self.stdout.write(f"Updated {meal.name} to {category}")
-                        updated_count += 1
-                    categorized = True
-                    break
-            if not categorized and meal.category == 'main_course':
-                # Keep as main_course if no match and already default
-                pass
-
-        self.stdout.write(self.style.SUCCESS(f'Successfully categorized {updated_count} meals'))
\ No newline at end of file
+        keywords = None
+        if options['keywords']:
+            try:
+                with open(options['keywords']) as keyword_file:
+                    keywords = json.load(keyword_file)
+            except (OSError, json.JSONDecodeError) as e:
+                raise CommandError(f"Can't read keywords from {options['keywords']}: {str(e)}")
+        try:
+            categorizer = Categorizer(keywords)
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+
+        def progress(meal, old, new):
+            self.stdout.write(f"{meal.name}: {old} -> {new}")
+
+        updated_count = recategorize(
+            categorizer=categorizer, dry_run=options['dry_run'], chunk_size=options['chunk_size'], progress=progress,
+        )
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Would categorize {updated_count} meals (dry run, nothing saved)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Successfully categorized {updated_count} meals'))
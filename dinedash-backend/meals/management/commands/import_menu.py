@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from meals import importer
+
+
+class Command(BaseCommand):
+    help = 'Create or update meals by name from a CSV or JSON menu file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Menu file (.csv, or .json with a list of meals)')
+        parser.add_argument('--format', choices=['csv', 'json'], dest='file_format',
+                            help='File format (default: from the file extension)')
+        parser.add_argument('--dry-run', action='store_true', help='Validate and report without writing anything')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['file_format'] or ('csv' if path.lower().endswith('.csv') else 'json')
+        try:
+            with open(path, 'rb') as menu:
+                results = importer.import_meals(importer.read_rows(menu, file_format), dry_run=options['dry_run'])
+        except OSError as e:
+            raise CommandError(f"Can't read {path}: {str(e)}")
+        except importer.MenuImportError as e:
+            raise CommandError(str(e))
+
+        invalid = [row for row in results if row['result'] == importer.INVALID]
+        for row in invalid:
+            errors = '; '.join(f"{field}: {' '.join(map(str, messages))}" for field, messages in row['errors'].items())
+            self.stderr.write(f"Row {row['row']} ({row['name'] or 'no name'}): {errors}")
+        if invalid:
+            raise CommandError(f"{len(invalid)} of {len(results)} rows are invalid; nothing was imported.")
+
+        created = sum(row['result'] == importer.CREATED for row in results)
+        updated = sum(row['result'] == importer.UPDATED for row in results)
+        prefix = 'Would import' if options['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(f'{prefix} {len(results)} meals: {created} new, {updated} updated'))
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meals', '0006_alter_meal_options_alter_meal_is_available_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='meal',
+            index=models.Index(fields=['name'], name='meals_meal_name_a0b94d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meal',
+            index=models.Index(fields=['category'], name='meals_meal_categor_000278_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meal',
+            index=models.Index(fields=['is_available'], name='meals_meal_is_avai_8c7846_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meal',
+            index=models.Index(fields=['created_at'], name='meals_meal_created_25f5ed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meal',
+            index=models.Index(fields=['is_veg'], name='meals_meal_is_veg_800664_idx'),
+        ),
+    ]
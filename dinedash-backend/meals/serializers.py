@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from .categories import default_categorizer
 from .models import Meal
 
 
@@ -16,6 +17,14 @@ class MealSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("A meal with this name already exists.")
         return value
 
+    def validate(self, attrs):
+        # New meals without a category get the one their name suggests
+        if not self.instance and not attrs.get('category'):
+            suggested = default_categorizer().categorize(attrs.get('name'))
+            if suggested:
+                attrs['category'] = suggested
+        return attrs
+
     def validate_price(self, value):
         if value <= 0:
             raise serializers.ValidationError("Price must be greater than 0.")
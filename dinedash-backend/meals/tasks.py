@@ -0,0 +1,133 @@
+"""
+Background jobs for meals, run by ``manage.py run_workers``.
+"""
+import io
+import ipaddress
+import logging
+import os
+import socket
+from urllib.parse import urljoin, urlparse
+
+import requests
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from jobs.queue import enqueue, task
+from .cache import menu_cache
+from .models import Meal
+
+logger = logging.getLogger(__name__)
+
+
+@task('meals.process_image')
+def process_image(meal_id, image_name):
+    """ Scales a freshly uploaded meal image down to MEAL_IMAGE_MAX_SIZE so the menu stays light. """
+    meal = Meal.objects.filter(pk=meal_id).first()
+    # The meal was deleted or got another image since the upload
+    if meal is None or meal.image.name != image_name:
+        return
+
+    limit = settings.MEAL_IMAGE_MAX_SIZE
+    with meal.image.open('rb') as source:
+        image = Image.open(source)
+        image.load()
+    if max(image.size) <= limit:
+        return
+
+    image_format = image.format or 'JPEG'
+    image.thumbnail((limit, limit))
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    output = io.BytesIO()
+    image.save(output, format=image_format, optimize=True, **({'quality': 85} if image_format == 'JPEG' else {}))
+
+    storage = meal.image.storage
+    storage.delete(image_name)
+    saved_name = storage.save(image_name, ContentFile(output.getvalue()))
+    if saved_name != image_name:
+        # update() skips signals and auto_now, so refresh the menu ourselves
+        Meal.objects.filter(pk=meal_id).update(image=saved_name, updated_at=timezone.now())
+        transaction.on_commit(menu_cache.bump)
+    logger.info(f"Resized image for meal {meal_id} to fit {limit}px")
+
+
+MAX_REDIRECTS = 3
+
+
+class ImageDownloadError(Exception):
+    """ The image URL can't be used; retrying won't help. """
+
+
+def check_image_url(url):
+    """ Only allows http(s) URLs whose host resolves to public addresses, so a menu
+        import can't make the worker fetch from localhost or the internal network. """
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        raise ImageDownloadError("only http and https URLs are allowed")
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(parsed.hostname, parsed.port or None)}
+    except (socket.gaierror, UnicodeError):
+        raise ImageDownloadError(f"can't resolve {parsed.hostname}")
+    for address in addresses:
+        # Drop any IPv6 zone id ("fe80::1%eth0") before parsing
+        if not ipaddress.ip_address(address.split('%')[0]).is_global:
+            raise ImageDownloadError(f"{parsed.hostname} is not a public address")
+
+
+def download_image(url):
+    """ Fetches an image of at most MEAL_IMAGE_MAX_DOWNLOAD_BYTES, checking every redirect
+        like the original URL. Returns the final URL and the content. """
+    limit = settings.MEAL_IMAGE_MAX_DOWNLOAD_BYTES
+    for _ in range(MAX_REDIRECTS + 1):
+        check_image_url(url)
+        with requests.get(url, timeout=settings.MEAL_IMAGE_DOWNLOAD_TIMEOUT, stream=True,
+                          allow_redirects=False) as response:
+            if response.is_redirect:
+                url = urljoin(url, response.headers['Location'])
+                continue
+            response.raise_for_status()
+
+            content_type = response.headers.get('Content-Type', '')
+            if not content_type.startswith('image/'):
+                raise ImageDownloadError(f"served as {content_type or 'no content type'}, not an image")
+            if int(response.headers.get('Content-Length') or 0) > limit:
+                raise ImageDownloadError(f"larger than {limit} bytes")
+
+            content = bytearray()
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                content += chunk
+                if len(content) > limit:
+                    raise ImageDownloadError(f"larger than {limit} bytes")
+            return url, bytes(content)
+    raise ImageDownloadError(f"more than {MAX_REDIRECTS} redirects")
+
+
+@task('meals.attach_image')
+def attach_image(meal_id, url):
+    """ Downloads an image for a meal (from a menu import) and attaches it, then queues the usual resize. """
+    meal = Meal.objects.filter(pk=meal_id).first()
+    if meal is None:
+        return
+
+    try:
+        url, content = download_image(url)
+        image = Image.open(io.BytesIO(content))
+        image.verify()
+    except ImageDownloadError as e:
+        # Not worth retrying: the same URL will give the same answer
+        logger.error(f"Not attaching {url} to meal {meal_id}: {str(e)}")
+        return
+    except requests.RequestException:
+        raise
+    except Exception:
+        logger.error(f"Not attaching {url} to meal {meal_id}: not an image")
+        return
+
+    filename = os.path.basename(urlparse(url).path) or f'meal-{meal_id}.{(image.format or "jpeg").lower()}'
+    meal.image.save(filename, ContentFile(content), save=False)
+    meal.save(update_fields=['image', 'updated_at'])
+    enqueue('meals.process_image', meal_id=meal.id, image_name=meal.image.name)
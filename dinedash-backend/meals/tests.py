@@ -1,3 +1,408 @@
-from django.test import TestCase
+import io
+import json
+import os
+import socket
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from jobs.models import Job
+from jobs.queue import Worker
+from users.models import User
+from dinedash.async_views import split_by_method
+from . import tasks
+from .cache import menu_cache
+from .categories import Categorizer, default_categorizer
+from .models import Meal
+from .views import MealDetailAsyncView, MealListAsyncView, MealViewSet
+
+
+class MenuCacheTests(APITestCase):
+    """ The menu list is served from the cache and invalidated by meal changes. """
+
+    def setUp(self):
+        caches['default'].clear()
+        menu_cache.clear_local()
+        self.meal = Meal.objects.create(name='Kelewele', price=Decimal('6.00'), prep_time=8)
+
+    def test_repeat_requests_skip_the_database(self):
+        first = self.client.get('/api/meals/')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['Content-Type'], 'application/json')
+
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/meals/')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second.data['results'][0]['name'], 'Kelewele')
+
+    def test_shared_cache_is_used_when_local_lru_is_cold(self):
+        first = self.client.get('/api/meals/')
+        menu_cache.clear_local()
+
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/meals/')
+        self.assertEqual(second.content, first.content)
+
+    def test_unknown_query_parameters_share_the_cached_page(self):
+        for number in range(25):
+            Meal.objects.create(name=f'Meal {number}', price=Decimal('5.00'), prep_time=5)
+        first = self.client.get('/api/meals/?page=01&utm_source=ad')
+        self.assertEqual(json.loads(first.content)['next'], 'http://testserver/api/meals/?page=2')
+
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/meals/?b=2&page=1&a=1')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(len(menu_cache._local), 1)
+
+    def test_meal_changes_invalidate_the_menu(self):
+        self.client.get('/api/meals/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.meal.price = Decimal('7.50')
+            self.meal.save()
+        self.assertEqual(self.client.get('/api/meals/').data['results'][0]['price'], '7.50')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Meal.objects.create(name='Waakye', price=Decimal('9.00'), prep_time=12)
+        self.assertEqual(self.client.get('/api/meals/').data['count'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.meal.delete()
+        self.assertEqual(self.client.get('/api/meals/').data['count'], 1)
+
+
+class MenuConditionalGetTests(APITestCase):
+    """ The menu answers conditional requests with 304 Not Modified. """
+
+    def setUp(self):
+        caches['default'].clear()
+        menu_cache.clear_local()
+        self.meal = Meal.objects.create(name='Kelewele', price=Decimal('6.00'), prep_time=8)
+
+    def test_matching_etag_gets_304_without_queries(self):
+        first = self.client.get('/api/meals/')
+        self.assertTrue(first['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', first)
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/meals/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        response = self.client.get('/api/meals/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_changed_menu_gets_a_new_etag(self):
+        first = self.client.get('/api/meals/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.meal.delete()
+
+        response = self.client.get('/api/meals/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+
+
+class MealAsyncViewTests(APITestCase):
+    """ The async menu views give the same pages as MealViewSet, and writes still reach the viewset. """
+
+    def setUp(self):
+        caches['default'].clear()
+        menu_cache.clear_local()
+        Meal.objects.bulk_create([Meal(name=f'Meal {i:02}', price=Decimal('5.00'), prep_time=5) for i in range(25)])
+        self.factory = APIRequestFactory()
+
+    def call(self, view, request, **kwargs):
+        return async_to_sync(view)(request, **kwargs)
+
+    def test_pages_match_the_viewset(self):
+        list_view = MealListAsyncView.as_view()
+        for query in ('', '?page=2', '?page=last'):
+            expected = self.client.get(f'/api/meals/{query}').content
+            caches['default'].clear()
+            menu_cache.clear_local()
+            response = self.call(list_view, self.factory.get(f'/api/meals/{query}'))
+            self.assertEqual(response.content, expected)
+        self.assertEqual(self.call(list_view, self.factory.get('/api/meals/?page=9')).status_code, 404)
+
+        with self.assertNumQueries(0):
+            cached = self.call(list_view, self.factory.get('/api/meals/?page=last'))
+        self.assertEqual(cached.content, expected)
+
+    def test_cache_is_used_through_its_async_api(self):
+        list_view = MealListAsyncView.as_view()
+        sync_calls = mock.Mock(side_effect=AssertionError('sync cache call on the event loop'))
+        with mock.patch.object(menu_cache, 'key_for', sync_calls), mock.patch.object(menu_cache, 'get', sync_calls), \
+                mock.patch.object(menu_cache, 'set', sync_calls), mock.patch.object(menu_cache, 'version', sync_calls):
+            first = self.call(list_view, self.factory.get('/api/meals/'))
+            menu_cache.clear_local()
+            second = self.call(list_view, self.factory.get('/api/meals/'))
+        self.assertEqual(second.content, first.content)
+
+    def test_detail_and_writes(self):
+        meal = Meal.objects.get(name='Meal 03')
+        detail = self.call(MealDetailAsyncView.as_view(), self.factory.get(f'/api/meals/{meal.pk}/'), pk=meal.pk)
+        self.assertEqual(detail.content, self.client.get(f'/api/meals/{meal.pk}/').content)
+        self.assertEqual(self.call(MealDetailAsyncView.as_view(), self.factory.get('/api/meals/0/'), pk=0).status_code, 404)
+
+        view = split_by_method(MealListAsyncView.as_view(), MealViewSet.as_view({'get': 'list', 'post': 'create'}))
+        request = self.factory.post('/api/meals/', {'name': 'Waakye', 'price': '9.00', 'prep_time': 12}, format='json')
+        self.assertEqual(self.call(view, request).status_code, 201)
+        self.assertTrue(Meal.objects.filter(name='Waakye').exists())
+
+
+class MealImageProcessingTests(APITestCase):
+    """ Uploaded images are resized by a background job, not in the request. """
+
+    def setUp(self):
+        caches['default'].clear()
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        self.staff = User.objects.create_user(username='chef', password='pass12345', is_staff=True)
+        self.client.force_authenticate(self.staff)
+
+    def upload(self, size):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'orange').save(buffer, format='JPEG')
+        return SimpleUploadedFile('kelewele.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def test_large_uploads_are_scaled_down_by_the_worker(self):
+        with self.settings(MEDIA_ROOT=self.media.name, MEAL_IMAGE_MAX_SIZE=100):
+            response = self.client.post('/api/meals/', {
+                'name': 'Kelewele', 'price': '6.00', 'prep_time': 8, 'image': self.upload((400, 200)),
+            }, format='multipart')
+            self.assertEqual(response.status_code, 201)
+            meal = Meal.objects.get()
+            self.assertEqual(Image.open(meal.image.path).size, (400, 200))
+
+            self.assertEqual(Worker().run_until_empty(), 1)
+            meal.refresh_from_db()
+            self.assertEqual(Image.open(meal.image.path).size, (100, 50))
+
+
+class MenuImportTests(APITestCase):
+    """ Menus are upserted by name in a fixed number of queries, with images attached afterwards. """
+
+    def setUp(self):
+        caches['default'].clear()
+        self.staff = User.objects.create_user(username='chef', password='pass12345', is_staff=True)
+        self.client.force_authenticate(self.staff)
+        Meal.objects.create(name='Kelewele', price=Decimal('6.00'), prep_time=8)
+
+    def menu(self, count):
+        return [{'name': 'Kelewele', 'price': '7.00', 'prep_time': 8, 'category': 'sides'}] + [
+            {'name': f'Special {i}', 'price': '10.00', 'prep_time': 15} for i in range(count)
+        ]
+
+    def test_upsert_by_name_in_a_fixed_number_of_queries(self):
+        with CaptureQueriesContext(connection) as small:
+            self.client.post('/api/meals/import/', self.menu(2), format='json')
+        with CaptureQueriesContext(connection) as large, self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post('/api/meals/import/', self.menu(50), format='json')
+
+        self.assertEqual(len(large), len(small))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['updated']), (48, 3))
+        self.assertEqual(response.data['results'][0], {'row': 1, 'name': 'Kelewele', 'result': 'updated'})
+        self.assertEqual(Meal.objects.count(), 51)
+        kelewele = Meal.objects.get(name='Kelewele')
+        self.assertEqual((kelewele.price, kelewele.category), (Decimal('7.00'), 'sides'))
+        self.assertEqual(len(callbacks), 1)
+
+    def test_columns_a_row_leaves_out_are_kept(self):
+        Meal.objects.filter(name='Kelewele').update(
+            category='sides', description='Spicy fried plantain', is_available=False, is_veg=False,
+        )
+        for supports_upsert in (True, False):
+            with self.subTest(supports_upsert=supports_upsert), mock.patch.object(
+                connection.features, 'supports_update_conflicts_with_target', supports_upsert,
+            ):
+                response = self.client.post('/api/meals/import/', [
+                    {'name': 'Kelewele', 'price': '7.50', 'prep_time': 9},
+                    {'name': f'Red Red {supports_upsert}', 'price': '9.00', 'prep_time': 12, 'is_veg': False},
+                ], format='json')
+                self.assertEqual(response.status_code, 200)
+
+                kelewele = Meal.objects.get(name='Kelewele')
+                self.assertEqual((kelewele.price, kelewele.prep_time), (Decimal('7.50'), 9))
+                self.assertEqual(
+                    (kelewele.category, kelewele.description, kelewele.is_available, kelewele.is_veg),
+                    ('sides', 'Spicy fried plantain', False, False),
+                )
+                self.assertFalse(Meal.objects.get(name=f'Red Red {supports_upsert}').is_veg)
+
+    def test_invalid_rows_are_reported_and_nothing_is_written(self):
+        menu = self.menu(1) + [{'name': 'Special 0', 'price': '5.00', 'prep_time': 5}, {'name': 'Free', 'price': '0'}]
+        response = self.client.post('/api/meals/import/', {'meals': menu}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([row['result'] for row in response.data['results']], ['updated', 'created', 'invalid', 'invalid'])
+        self.assertIn('price', response.data['results'][3]['errors'])
+        self.assertEqual(Meal.objects.count(), 1)
+
+        dry_run = self.client.post('/api/meals/import/?dry_run=1', self.menu(1), format='json')
+        self.assertEqual(dry_run.data['created'], 1)
+        self.assertEqual(Meal.objects.count(), 1)
+
+        self.client.force_authenticate(None)
+        self.assertIn(self.client.post('/api/meals/import/', self.menu(1), format='json').status_code, (401, 403))
+
+    def test_command_imports_a_csv_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as menu:
+            menu.write('name,price,prep_time,category,is_veg\nWaakye,9.00,12,,false\nKelewele,6.50,8,sides,\n')
+        self.addCleanup(os.unlink, menu.name)
+
+        out = StringIO()
+        call_command('import_menu', menu.name, stdout=out)
+        self.assertIn('2 meals: 1 new, 1 updated', out.getvalue())
+        waakye = Meal.objects.get(name='Waakye')
+        self.assertEqual((waakye.category, waakye.is_veg), ('main_course', False))
+
+        with open(menu.name, 'a') as broken:
+            broken.write('Banku,,10\n')
+        with self.assertRaises(CommandError):
+            call_command('import_menu', menu.name, stdout=StringIO(), stderr=StringIO())
+
+    def download(self, content, content_type='image/png', **headers):
+        response = mock.MagicMock(status_code=200, is_redirect=False,
+                                  headers={'Content-Type': content_type, **headers})
+        response.__enter__.return_value = response
+        response.iter_content.return_value = [content[:10], content[10:]]
+        return response
+
+    def attach(self, url, response, addresses=('93.184.216.34',)):
+        meal = Meal.objects.create(name='Waakye', price=Decimal('9.00'), prep_time=12)
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        resolved = [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (address, 443)) for address in addresses]
+        with self.settings(MEDIA_ROOT=media.name), \
+                mock.patch('meals.tasks.socket.getaddrinfo', return_value=resolved), \
+                mock.patch('meals.tasks.requests.get', return_value=response) as get:
+            tasks.attach_image(meal.id, url)
+        return Meal.objects.get(pk=meal.pk), get
+
+    def test_image_urls_are_attached_by_the_worker(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 40), 'orange').save(buffer, format='PNG')
+        download = self.download(buffer.getvalue())
+        menu = [{'name': 'Waakye', 'price': '9.00', 'prep_time': 12, 'image_url': 'https://cdn.example.com/waakye.png'}]
+
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        resolved = [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('93.184.216.34', 443))]
+        with self.settings(MEDIA_ROOT=media.name), \
+                mock.patch('meals.tasks.socket.getaddrinfo', return_value=resolved), \
+                mock.patch('meals.tasks.requests.get', return_value=download) as get:
+            self.assertEqual(self.client.post('/api/meals/import/', menu, format='json').status_code, 200)
+            self.assertEqual(Job.objects.get().name, 'meals.attach_image')
+            Worker().run_until_empty()
+
+        get.assert_called_once_with('https://cdn.example.com/waakye.png', timeout=20, stream=True, allow_redirects=False)
+        self.assertTrue(Meal.objects.get(name='Waakye').image.name.startswith('meal_images/waakye'))
+
+    def test_image_urls_on_internal_hosts_are_not_fetched(self):
+        for url, addresses in [('http://localhost/menu.png', ['127.0.0.1']),
+                               ('http://metadata.internal/latest', ['169.254.169.254']),
+                               ('https://cdn.example.com/a.png', ['93.184.216.34', '10.0.0.5']),
+                               ('file:///etc/passwd', [])]:
+            with self.subTest(url=url):
+                meal, get = self.attach(url, self.download(b''), addresses)
+                get.assert_not_called()
+                self.assertFalse(meal.image)
+                meal.delete()
+
+    def test_image_downloads_must_be_small_images(self):
+        with self.settings(MEAL_IMAGE_MAX_DOWNLOAD_BYTES=15):
+            meal, _ = self.attach('https://cdn.example.com/big.png', self.download(b'x' * 20))
+        self.assertFalse(meal.image)
+        meal.delete()
+
+        meal, _ = self.attach('https://cdn.example.com/page', self.download(b'<html></html>', 'text/html'))
+        self.assertFalse(meal.image)
+
+
+class MealCategorizationTests(APITestCase):
+    """ Meals are categorized by keyword in bulk, and new meals get a suggested category. """
+
+    def setUp(self):
+        caches['default'].clear()
+        for name in ['Iced Tea', 'Steak Frites', 'Apple Pies', 'Waakye']:
+            Meal.objects.create(name=name, price=Decimal('10.00'), prep_time=10)
+        Meal.objects.filter(name='Steak Frites').update(category=Meal.CATEGORY_SIDES)
+
+    def categories(self):
+        return dict(Meal.objects.values_list('name', 'category'))
+
+    def test_dry_run_shows_the_diff_without_saving(self):
+        out = StringIO()
+        call_command('categorize_meals', '--dry-run', stdout=out)
+        self.assertIn('Iced Tea: main_course -> drinks', out.getvalue())
+        self.assertIn('Would categorize 3 meals', out.getvalue())
+        self.assertEqual(set(self.categories().values()), {'main_course', 'sides'})
+
+    def test_changes_are_written_in_bulk_to_the_category_only(self):
+        updated_at = dict(Meal.objects.values_list('name', 'updated_at'))
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            call_command('categorize_meals', '--chunk-size', '2', stdout=StringIO())
+
+        self.assertEqual(self.categories(), {
+            'Iced Tea': 'drinks', 'Steak Frites': 'main_course', 'Apple Pies': 'desserts', 'Waakye': 'main_course',
+        })
+        writes = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE "meals_meal"')]
+        self.assertEqual(len(writes), 2)
+        self.assertTrue(all('updated_at' not in sql for sql in writes))
+        self.assertEqual(dict(Meal.objects.values_list('name', 'updated_at')), updated_at)
+
+    def test_keyword_lists_can_be_replaced(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as keywords:
+            keywords.write('{"sides": ["waakye"]}')
+        self.addCleanup(os.unlink, keywords.name)
+        call_command('categorize_meals', '--keywords', keywords.name, stdout=StringIO())
+        self.assertEqual(self.categories()['Waakye'], 'sides')
+        self.assertEqual(self.categories()['Iced Tea'], 'main_course')
+
+        with open(keywords.name, 'w') as broken:
+            broken.write('{"snacks": ["chin chin"]}')
+        with self.assertRaises(CommandError):
+            call_command('categorize_meals', '--keywords', keywords.name, stdout=StringIO())
+
+    def test_new_meals_get_a_suggested_category(self):
+        staff = User.objects.create_user(username='chef', password='pass12345', is_staff=True)
+        self.client.force_authenticate(staff)
+
+        suggested = self.client.post('/api/meals/', {'name': 'Mango Smoothie', 'price': '5.00', 'prep_time': 3})
+        chosen = self.client.post('/api/meals/', {
+            'name': 'Pineapple Juice', 'price': '5.00', 'prep_time': 3, 'category': 'desserts',
+        })
+        self.assertEqual(suggested.data['category'], 'drinks')
+        self.assertEqual(chosen.data['category'], 'desserts')
+
+    def test_keywords_match_inside_compound_names(self):
+        categorize = default_categorizer().categorize
+        self.assertEqual(
+            {name: categorize(name) for name in ['Cheeseburger', 'Pancakes', 'Cupcake', 'Fishcake', 'Milkshakes']},
+            {'Cheeseburger': 'main_course', 'Pancakes': 'desserts', 'Cupcake': 'desserts',
+             'Fishcake': 'main_course', 'Milkshakes': 'drinks'},
+        )
+
+    def test_a_keyword_inside_another_match_is_ignored(self):
+        # Drinks listed first: the "tea" in "Steak" would otherwise win
+        categorizer = Categorizer({'drinks': ['tea'], 'main_course': ['steak']})
+        self.assertEqual(categorizer.categorize('Steak Frites'), 'main_course')
+        self.assertEqual(categorizer.categorize('Beefsteak'), 'main_course')
+        self.assertEqual(categorizer.categorize('Iced Tea'), 'drinks')
+
+    def test_the_default_categorizer_is_built_once_per_keyword_setting(self):
+        self.assertIs(default_categorizer(), default_categorizer())
+        with self.settings(MEAL_CATEGORY_KEYWORDS={'sides': ['smoothie']}):
+            self.assertEqual(default_categorizer().categorize('Mango Smoothie'), 'sides')
+        self.assertEqual(default_categorizer().categorize('Mango Smoothie'), 'drinks')
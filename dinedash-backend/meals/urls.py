@@ -1,10 +1,24 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import MealViewSet
+from dinedash.async_views import split_by_method
+from .views import MealDetailAsyncView, MealListAsyncView, MealViewSet
 
 router = DefaultRouter()
 router.register(r'meals', MealViewSet, basename='meal')
 
 urlpatterns = [
     path('', include(router.urls)),
-]
\ No newline at end of file
+]
+
+if settings.ASYNC_READ_VIEWS:
+    # Reads go to the async views, writes still to MealViewSet
+    urlpatterns = [
+        path('meals/', split_by_method(
+            MealListAsyncView.as_view(), MealViewSet.as_view({'get': 'list', 'post': 'create'}),
+        )),
+        path('meals/<int:pk>/', split_by_method(
+            MealDetailAsyncView.as_view(),
+            MealViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}),
+        )),
+    ] + urlpatterns
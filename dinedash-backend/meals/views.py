@@ -1,5 +1,20 @@
+import hashlib
 import logging
-from rest_framework import viewsets, permissions, parsers
+import math
+from django.http import HttpResponse
+from rest_framework import exceptions, viewsets, permissions, parsers, status
+from rest_framework.decorators import action
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from dinedash.async_views import AsyncReadView, json_response
+from dinedash.utils import conditional_response, make_etag, set_validators
+from jobs.queue import enqueue
+from . import importer
+from .cache import PrerenderedJSONResponse, canonical_menu_url, menu_cache
 from .models import Meal
 from .serializers import MealSerializer
 
@@ -15,6 +30,19 @@ class IsStaffOrReadOnly(permissions.BasePermission):
             return True
         return request.user and request.user.is_staff
 
+class MenuPagination(PageNumberPagination):
+    """ Page links built from the canonical menu URL, so a cached page never
+        carries query parameters another client happened to send. """
+
+    def get_next_link(self):
+        link = super().get_next_link()
+        return canonical_menu_url(link) if link else None
+
+    def get_previous_link(self):
+        link = super().get_previous_link()
+        return canonical_menu_url(link) if link else None
+
+
 class MealViewSet(viewsets.ModelViewSet):
     """
     Staff can create/update/delete meals.
@@ -26,11 +54,13 @@ class MealViewSet(viewsets.ModelViewSet):
     - POST /meals/ : create a new meal (staff only)
     - PUT /meals/{id}/ : update meal (staff only)
     - DELETE /meals/{id}/ : delete meal (staff only)
+    - POST /meals/import/ : create or update many meals by name (staff only)
     """
     queryset = Meal.objects.all()
     serializer_class = MealSerializer
     permission_classes = [permissions.AllowAny]
     parser_classes = [parsers.MultiPartParser, parsers.FormParser, parsers.JSONParser]
+    pagination_class = MenuPagination
     throttle_scope = 'meals'
 
     def get_authenticators(self):
@@ -39,6 +69,70 @@ class MealViewSet(viewsets.ModelViewSet):
         """
         return super().get_authenticators()
 
+    def list(self, request, *args, **kwargs):
+        # The menu changes a few times a day, so serve it pre-rendered from the cache
+        # and only run the serializer on a miss
+        key = menu_cache.key_for(request)
+        entry = menu_cache.get(key)
+        if entry is None:
+            response = super().list(request, *args, **kwargs)
+            content = JSONRenderer().render(response.data)
+            last_modified = menu_cache.last_modified()
+            entry = (content, make_etag('menu', hashlib.sha1(content).hexdigest()), last_modified)
+            menu_cache.set(key, entry)
+
+        # Clients that already have this exact menu get a 304 with no body
+        content, etag, last_modified = entry
+        not_modified = conditional_response(request, etag, last_modified)
+        if not_modified:
+            return not_modified
+        return set_validators(PrerenderedJSONResponse(content), etag, last_modified)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        self.process_uploaded_image(serializer)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.process_uploaded_image(serializer)
+
+    def process_uploaded_image(self, serializer):
+        # Resizing large photos is slow, so it happens in a background job
+        if serializer.validated_data.get('image'):
+            enqueue('meals.process_image', meal_id=serializer.instance.id, image_name=serializer.instance.image.name)
+
+    @action(detail=False, methods=['post'], url_path='import', permission_classes=[permissions.IsAdminUser])
+    def import_menu(self, request, *args, **kwargs):
+        """
+        Upserts a whole menu by meal name. Send a JSON list of meals (or {"meals": [...]}),
+        or upload a CSV or JSON file as 'file'. Add ?dry_run=1 to only validate.
+
+        Returns a result per row (created, updated or invalid with errors). If any
+        row is invalid nothing is imported and the response is 400. Rows may give an
+        image_url, which is downloaded in the background after the import.
+        """
+        try:
+            upload = request.FILES.get('file')
+            if upload:
+                file_format = 'csv' if upload.name.lower().endswith('.csv') else 'json'
+                rows = importer.read_rows(upload, file_format)
+            else:
+                rows = request.data.get('meals') if isinstance(request.data, dict) else request.data
+                if not isinstance(rows, list):
+                    return Response({"error": "Send a list of meals or upload a CSV or JSON file as 'file'."},
+                                    status=status.HTTP_400_BAD_REQUEST)
+            results = importer.import_meals(rows, dry_run=request.query_params.get('dry_run') in ('1', 'true'))
+        except importer.MenuImportError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        counts = {result: sum(row['result'] == result for row in results)
+                  for result in (importer.CREATED, importer.UPDATED, importer.INVALID)}
+        logger.info(f"Menu import: {counts}")
+        return Response(
+            {"results": results, **counts},
+            status=status.HTTP_400_BAD_REQUEST if counts[importer.INVALID] else status.HTTP_200_OK,
+        )
+
     def create(self, request, *args, **kwargs):
         logger.info(f"Creating meal with data: {request.data}")
         logger.info(f"Request FILES: {request.FILES}")
@@ -73,3 +167,64 @@ class MealViewSet(viewsets.ModelViewSet):
             logger.error(f"Error deleting meal {meal_id}: {str(e)}")
             raise
 
+
+class MealListAsyncView(AsyncReadView):
+    """
+    Async version of GET /meals/ (see dinedash.async_views), with the same
+    cache, conditional responses and page-number pagination as MealViewSet.list.
+    """
+    throttle_scope = 'meals'
+
+    async def get(self, request, *args, **kwargs):
+        key = await menu_cache.akey_for(request)
+        entry = await menu_cache.aget(key)
+        if entry is None:
+            try:
+                content = JSONRenderer().render(await self.page(request))
+            except exceptions.NotFound as e:
+                return self.error_response(e, Request(request))
+            last_modified = await menu_cache.alast_modified()
+            entry = (content, make_etag('menu', hashlib.sha1(content).hexdigest()), last_modified)
+            await menu_cache.aset(key, entry)
+
+        content, etag, last_modified = entry
+        not_modified = conditional_response(request, etag, last_modified)
+        if not_modified:
+            return not_modified
+        return set_validators(HttpResponse(content, content_type='application/json'), etag, last_modified)
+
+    async def page(self, request):
+        """ The same page of meals, and links, that DRF's PageNumberPagination gives. """
+        page_size = api_settings.PAGE_SIZE
+        count = await Meal.objects.acount()
+        num_pages = max(math.ceil(count / page_size), 1)
+        number = request.GET.get('page') or 1
+        try:
+            number = num_pages if number == 'last' else int(number)
+        except ValueError:
+            number = 0
+        if not 1 <= number <= num_pages:
+            raise exceptions.NotFound('Invalid page.')
+
+        meals = [meal async for meal in Meal.objects.all()[(number - 1) * page_size:number * page_size]]
+        url = canonical_menu_url(request.build_absolute_uri())
+        previous = None
+        if number > 1:
+            previous = remove_query_param(url, 'page') if number == 2 else replace_query_param(url, 'page', number - 1)
+        return {
+            'count': count,
+            'next': replace_query_param(url, 'page', number + 1) if number < num_pages else None,
+            'previous': previous,
+            'results': MealSerializer(meals, many=True, context={'request': request}).data,
+        }
+
+
+class MealDetailAsyncView(AsyncReadView):
+    """ Async version of GET /meals/{id}/ (see dinedash.async_views). """
+    throttle_scope = 'meals'
+
+    async def get(self, request, pk, *args, **kwargs):
+        meal = await Meal.objects.filter(pk=pk).afirst()
+        if meal is None:
+            return self.error_response(exceptions.NotFound('No Meal matches the given query.'), Request(request))
+        return json_response(MealSerializer(meal, context={'request': request}).data)
@@ -0,0 +1,176 @@
+"""
+Dashboard analytics built from database aggregates.
+
+The grouping helpers take an already filtered ``Order`` queryset and push the
+grouping and summing into SQL, so the number of queries stays the same no
+matter how many orders or days are involved. ``build_report`` reads closed
+days from the daily rollups in ``orders.rollups`` and only computes the days
+after the rollup watermark (normally just today) live.
+"""
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import Order, OrderItem
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+ZERO = Value(Decimal('0.00'), output_field=MONEY)
+
+
+def day_start(day):
+    """ The aware datetime at which a calendar day starts in the current timezone. """
+    return timezone.make_aware(timezone.datetime.combine(day, timezone.datetime.min.time()))
+
+
+def orders_on(day):
+    """ Orders created on a given day, as a range filter that can use the created_at index. """
+    next_day = day + timezone.timedelta(days=1)
+    return Order.objects.filter(created_at__gte=day_start(day), created_at__lt=day_start(next_day))
+
+
+# Live aggregates over raw orders
+
+def totals(orders, today=None):
+    """ Order count and revenue (and today's revenue, when asked) in a single aggregate. """
+    aggregates = {
+        'order_count': Count('id'),
+        'revenue': Coalesce(Sum('total_amount'), ZERO),
+    }
+    if today is not None:
+        aggregates['today_revenue'] = Coalesce(Sum('total_amount', filter=Q(created_at__date=today)), ZERO)
+    return orders.aggregate(**aggregates)
+
+
+def revenue_by_day(orders):
+    """ {day: (order count, revenue)} for every day that has orders. """
+    rows = (
+        orders.annotate(day=TruncDate('created_at'))
+        .values('day')
+        .annotate(order_count=Count('id'), revenue=Sum('total_amount'))
+        .order_by()
+    )
+    return {row['day']: (row['order_count'], row['revenue']) for row in rows}
+
+
+def revenue_by_order_type(orders):
+    """ {order type: (order count, revenue)}. """
+    rows = orders.values('order_type').annotate(order_count=Count('id'), revenue=Sum('total_amount')).order_by()
+    return {row['order_type']: (row['order_count'], row['revenue']) for row in rows}
+
+
+def revenue_by_payment_method(orders):
+    """ {method: (order count, revenue)}, using each order's latest payment (cash if unpaid). """
+    from payments.models import Payment
+
+    latest_method = Payment.objects.filter(order=OuterRef('pk')).order_by('-created_at', '-id').values('method')[:1]
+    rows = (
+        orders.annotate(method=Coalesce(Subquery(latest_method), Value('cash')))
+        .values('method')
+        .annotate(order_count=Count('id'), revenue=Sum('total_amount'))
+        .order_by()
+    )
+    return {row['method']: (row['order_count'], row['revenue']) for row in rows}
+
+
+def _items_for(orders):
+    return OrderItem.objects.filter(order__in=orders.values('pk'), meal__isnull=False)
+
+
+def revenue_by_meal(orders):
+    """ {meal ID: (meal name, quantity, item revenue)}, joined with meal names in one query. """
+    rows = (
+        _items_for(orders)
+        .values('meal_id', 'meal__name')
+        .annotate(units=Sum('quantity'), revenue=Sum(F('unit_price') * F('quantity'), output_field=MONEY))
+        .order_by()
+    )
+    return {row['meal_id']: (row['meal__name'], row['units'], row['revenue']) for row in rows}
+
+
+def ordered_quantities(orders):
+    """ How many of each meal are on pending orders, keyed by meal ID. """
+    rows = (
+        _items_for(orders.filter(status=Order.STATUS_PENDING))
+        .values('meal_id')
+        .annotate(units=Sum('quantity'))
+        .order_by()
+    )
+    return {str(row['meal_id']): row['units'] for row in rows}
+
+
+# Report assembly
+
+def _merge(*breakdowns):
+    merged = {}
+    for breakdown in breakdowns:
+        for key, (count, revenue) in breakdown.items():
+            old_count, old_revenue = merged.get(key, (0, Decimal('0.00')))
+            merged[key] = (old_count + count, old_revenue + revenue)
+    return merged
+
+
+def build_report(start_date=None, end_date=None, today=None):
+    """ The full analytics payload for the dashboard.
+
+        start_date/end_date optionally bound the orders considered. The daily
+        chart covers start_date..end_date when both are given, otherwise the
+        last 7 days. """
+    from . import rollups
+
+    today = today or timezone.now().date()
+    chart_start, chart_end = (start_date, end_date) if start_date and end_date else (
+        today - timezone.timedelta(days=6), today
+    )
+
+    orders = Order.objects.all()
+    if start_date:
+        orders = orders.filter(created_at__date__gte=start_date)
+    if end_date:
+        orders = orders.filter(created_at__date__lte=end_date)
+
+    # Closed days up to the watermark come from the rollups, the rest is live
+    watermark = rollups.watermark()
+    rolled = rollups.RolledSales(start_date, end_date, watermark) if watermark else rollups.RolledSales.empty()
+    live_orders = orders.filter(created_at__gte=day_start(watermark + timezone.timedelta(days=1))) if watermark else orders
+    if end_date and watermark and end_date <= watermark:
+        live_orders = live_orders.none()
+
+    live_totals = totals(live_orders, today=today)
+    total_orders = rolled.order_count + live_totals['order_count']
+    total_revenue = float(rolled.revenue + live_totals['revenue'])
+
+    by_day = {**rolled.by_day(chart_start, chart_end), **revenue_by_day(
+        live_orders.filter(created_at__date__gte=chart_start, created_at__date__lte=chart_end)
+    )}
+    daily_revenue = []
+    current = chart_start
+    while current <= chart_end:
+        order_count, revenue = by_day.get(current, (0, Decimal('0.00')))
+        daily_revenue.append({'date': current.isoformat(), 'revenue': float(revenue), 'orders': order_count})
+        current += timezone.timedelta(days=1)
+
+    by_meal = dict(rolled.by_meal())
+    for meal_id, (name, quantity, revenue) in revenue_by_meal(live_orders).items():
+        _, old_quantity, old_revenue = by_meal.get(meal_id, (name, 0, Decimal('0.00')))
+        by_meal[meal_id] = (name, old_quantity + quantity, old_revenue + revenue)
+    top_meals = sorted(by_meal.values(), key=lambda meal: meal[2], reverse=True)[:5]
+
+    return {
+        'total_revenue': total_revenue,
+        'total_orders': total_orders,
+        'avg_order_value': total_revenue / total_orders if total_orders > 0 else 0,
+        'today_revenue': float(live_totals['today_revenue']),
+        'daily_revenue': daily_revenue,
+        'payment_breakdown': {
+            method: float(revenue)
+            for method, (_, revenue) in _merge(rolled.by_payment_method(), revenue_by_payment_method(live_orders)).items()
+        },
+        'order_type_breakdown': {
+            order_type: float(revenue)
+            for order_type, (_, revenue) in _merge(rolled.by_order_type(), revenue_by_order_type(live_orders)).items()
+        },
+        'most_profitable': [{'name': name, 'revenue': float(revenue)} for name, _, revenue in top_meals],
+        'ordered_quantities': ordered_quantities(orders),
+    }
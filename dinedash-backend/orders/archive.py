@@ -0,0 +1,241 @@
+"""
+Cold storage for old orders.
+
+Orders past the retention period are moved out of the hot tables into
+compressed files, one set per day:
+
+    orders/<YYYY>/<MM>/<YYYY-MM-DD>.<run timestamp>.parquet   (or .jsonl.gz)
+
+Each file holds one record per order with its items and payments nested
+inside. Parquet is used when pyarrow is installed, gzip JSONL otherwise;
+readers handle both. Files go to ``settings.ORDER_ARCHIVE_STORAGE``: local
+disk by default, or S3 through django-storages.
+
+Archiving a day streams its orders in chunks into a temporary file, uploads
+it, reads it back to check the row count, and only then deletes the rows in
+small batches. Every run writes a new file, so a run that dies between the
+upload and the deletes never overwrites earlier files; readers merge a
+day's files and drop repeated orders.
+"""
+import gzip
+import io
+import json
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.module_loading import import_string
+
+from dinedash.utils import delete_in_batches
+from .analytics import day_start, orders_on
+from .models import Order
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+ORDER_FIELDS = [
+    'id', 'tracking_code', 'user_id', 'customer_name', 'customer_email', 'contact_phone', 'table_number',
+    'order_type', 'status', 'total_amount', 'delivery_fee', 'delivery_address', 'delivery_instructions',
+    'pickup_time', 'created_at', 'updated_at',
+]
+ITEM_FIELDS = ['meal_id', 'item_name', 'unit_price', 'quantity']
+PAYMENT_FIELDS = ['id', 'method', 'status', 'amount', 'transaction_id', 'transaction_ref', 'provider', 'created_at']
+
+EXTENSIONS = {'parquet': '.parquet', 'jsonl': '.jsonl.gz'}
+
+
+class ArchiveError(Exception):
+    """ An archive file did not contain what was written to it. """
+
+
+def storage():
+    """ The storage archive files are written to, built from settings.ORDER_ARCHIVE_STORAGE. """
+    config = settings.ORDER_ARCHIVE_STORAGE
+    return import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+
+
+def default_format():
+    return 'parquet' if pyarrow is not None else 'jsonl'
+
+
+def order_record(order):
+    """ An order with its items and payments, as stored in the archive. """
+    record = {field: getattr(order, field) for field in ORDER_FIELDS}
+    record['items'] = [{field: getattr(item, field) for field in ITEM_FIELDS} for item in order.items.all()]
+    record['payments'] = [{field: getattr(payment, field) for field in PAYMENT_FIELDS} for payment in order.payments.all()]
+    return record
+
+
+def _parquet_schema():
+    money = pyarrow.decimal128(10, 2)
+    timestamp = pyarrow.timestamp('us', tz='UTC')
+    types = {
+        'id': pyarrow.int64(), 'user_id': pyarrow.int64(), 'total_amount': money, 'delivery_fee': money,
+        'pickup_time': timestamp, 'created_at': timestamp, 'updated_at': timestamp,
+    }
+    item = pyarrow.struct([
+        ('meal_id', pyarrow.int64()), ('item_name', pyarrow.string()),
+        ('unit_price', money), ('quantity', pyarrow.int64()),
+    ])
+    payment = pyarrow.struct([
+        ('id', pyarrow.int64()), ('method', pyarrow.string()), ('status', pyarrow.string()),
+        ('amount', money), ('transaction_id', pyarrow.string()), ('transaction_ref', pyarrow.string()),
+        ('provider', pyarrow.string()), ('created_at', timestamp),
+    ])
+    return pyarrow.schema(
+        [(field, types.get(field, pyarrow.string())) for field in ORDER_FIELDS]
+        + [('items', pyarrow.list_(item)), ('payments', pyarrow.list_(payment))]
+    )
+
+
+class _JSONLinesWriter:
+    def __init__(self, fileobj):
+        self.stream = gzip.GzipFile(fileobj=fileobj, mode='wb')
+
+    def write(self, records):
+        for record in records:
+            self.stream.write(json.dumps(record, cls=DjangoJSONEncoder).encode() + b'\n')
+
+    def close(self):
+        self.stream.close()
+
+
+class _ParquetWriter:
+    def __init__(self, fileobj):
+        self.schema = _parquet_schema()
+        self.writer = pyarrow.parquet.ParquetWriter(fileobj, self.schema, compression='zstd')
+
+    def write(self, records):
+        self.writer.write_table(pyarrow.Table.from_pylist(records, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def _read_file(name, archive):
+    with archive.open(name, 'rb') as stored:
+        data = stored.read()
+    if name.endswith(EXTENSIONS['parquet']):
+        if pyarrow is None:
+            raise ArchiveError(f"Reading {name} needs pyarrow installed.")
+        return pyarrow.parquet.read_table(io.BytesIO(data)).to_pylist()
+    return [json.loads(line) for line in gzip.decompress(data).splitlines() if line]
+
+
+def _jsonable(record):
+    """ The same plain JSON types whichever format the record came from. """
+    return json.loads(json.dumps(record, cls=DjangoJSONEncoder))
+
+
+def partition_files(day, archive=None):
+    """ Names of the files holding a day's archived orders. """
+    archive = archive or storage()
+    directory = f'orders/{day:%Y}/{day:%m}'
+    try:
+        _, files = archive.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(f'{directory}/{name}' for name in files if name.startswith(f'{day.isoformat()}.'))
+
+
+def archived_days(start, end):
+    """ The days in start..end (dates) that have archive files, listing each month's directory once. """
+    archive = storage()
+    days = set()
+    month = start.replace(day=1)
+    while month <= end:
+        try:
+            _, files = archive.listdir(f'orders/{month:%Y}/{month:%m}')
+        except FileNotFoundError:
+            files = []
+        for name in files:
+            day = parse_date(name[:10])
+            if day and start <= day <= end:
+                days.add(day)
+        month = (month + timezone.timedelta(days=32)).replace(day=1)
+    return days
+
+
+def read_partition(day, tracking_code=None):
+    """ The archived orders of a day, optionally only the one with a tracking code. """
+    archive = storage()
+    orders = {}
+    for name in partition_files(day, archive):
+        for record in _read_file(name, archive):
+            if tracking_code is None or record['tracking_code'] == tracking_code:
+                orders[record['id']] = _jsonable(record)
+    return [orders[order_id] for order_id in sorted(orders)]
+
+
+def archive_day(day, file_format=None, chunk_size=500, batch_size=1000, sleep=0):
+    """ Moves one day's orders into an archive file, then deletes them. Returns (orders archived, file name). """
+    file_format = file_format or default_format()
+    orders = orders_on(day)
+    # Orders are not created in the past, but cap the set anyway so the deletes match what was written
+    last_pk = orders.aggregate(last=Max('pk'))['last']
+    if last_pk is None:
+        return 0, None
+    orders = orders.filter(pk__lte=last_pk)
+
+    archive = storage()
+    written = 0
+    with tempfile.TemporaryFile() as buffer:
+        writer = _ParquetWriter(buffer) if file_format == 'parquet' else _JSONLinesWriter(buffer)
+        chunk = []
+        rows = orders.order_by('pk').prefetch_related('items', 'payments').iterator(chunk_size=chunk_size)
+        for order in rows:
+            chunk.append(order_record(order))
+            if len(chunk) == chunk_size:
+                writer.write(chunk)
+                written += len(chunk)
+                chunk = []
+        if chunk:
+            writer.write(chunk)
+            written += len(chunk)
+        writer.close()
+
+        buffer.seek(0)
+        stamp = timezone.now().strftime('%Y%m%dT%H%M%S%f')
+        name = archive.save(
+            f'orders/{day:%Y}/{day:%m}/{day.isoformat()}.{stamp}{EXTENSIONS[file_format]}', File(buffer),
+        )
+
+    stored = _read_file(name, archive)
+    expected = orders.count()
+    if len(stored) != written or written != expected:
+        archive.delete(name)
+        raise ArchiveError(
+            f"Archive for {day} has {len(stored)} orders, wrote {written}, database has {expected}; nothing deleted."
+        )
+
+    delete_in_batches(orders, batch_size=batch_size, sleep=sleep)
+    return written, name
+
+
+def days_before(cutoff):
+    """ The days before ``cutoff`` (a date) that still have orders in the database. """
+    return list(Order.objects.filter(created_at__lt=day_start(cutoff)).dates('created_at', 'day'))
+
+
+def archive_before(cutoff, dry_run=False, progress=None, **options):
+    """ Archives every day before ``cutoff``, oldest first. Returns how many orders were (or would be) archived.
+
+        ``progress`` is called with (day, order count, file name) after each day;
+        the file name is None on a dry run. """
+    total = 0
+    for day in days_before(cutoff):
+        if dry_run:
+            count, name = orders_on(day).count(), None
+        else:
+            count, name = archive_day(day, **options)
+        total += count
+        if progress:
+            progress(day, count, name)
+    return total
@@ -0,0 +1,216 @@
+"""
+Order change events for live dashboards.
+
+Views publish an event when an order is created or changes status (after the
+transaction commits). Events go through a backplane, which fans them out to
+the event hub of every process; each hub keeps a short backlog and pushes
+events to its connected Server-Sent Events streams.
+
+The default LocalBackplane only reaches streams in the same process. With
+several workers, set ORDER_EVENTS_BACKPLANE to a backplane that crosses
+processes, such as RedisBackplane.
+
+Every event gets an id of the form "<hub id>:<sequence>". Clients send the
+last id they saw (the standard Last-Event-ID header) when reconnecting and
+only get what they missed; if the hub cannot tell (restarted, different
+process or backlog exhausted) it sends a "reset" event so the client
+reloads the order list instead.
+"""
+import asyncio
+import json
+import logging
+import threading
+import uuid
+from collections import deque
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.module_loading import import_string
+from rest_framework.utils.encoders import JSONEncoder
+
+logger = logging.getLogger(__name__)
+
+ORDER_CREATED = 'order.created'
+ORDER_STATUS_CHANGED = 'order.status_changed'
+RESET = 'reset'
+
+
+class LocalBackplane:
+    """ Delivers events to the hub in this process only. """
+
+    def __init__(self, deliver):
+        self.deliver = deliver
+
+    def publish(self, event):
+        self.deliver(event)
+
+    def publish_many(self, events):
+        for event in events:
+            self.publish(event)
+
+
+class RedisBackplane(LocalBackplane):
+    """ Delivers events to the hubs of every process through Redis pub/sub.
+
+        Needs the redis package and ORDER_EVENTS_REDIS_URL. """
+    channel = 'dinedash:order-events'
+
+    def __init__(self, deliver):
+        super().__init__(deliver)
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured("RedisBackplane needs the 'redis' package installed.")
+        self.client = redis.Redis.from_url(settings.ORDER_EVENTS_REDIS_URL)
+        self.listener = threading.Thread(target=self._listen, name='order-events-redis', daemon=True)
+        self.listener.start()
+
+    def publish(self, event):
+        self.client.publish(self.channel, json.dumps(event, cls=JSONEncoder))
+
+    def publish_many(self, events):
+        # One round trip for the whole batch
+        pipeline = self.client.pipeline(transaction=False)
+        for event in events:
+            pipeline.publish(self.channel, json.dumps(event, cls=JSONEncoder))
+        pipeline.execute()
+
+    def _listen(self):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        for message in pubsub.listen():
+            try:
+                self.deliver(json.loads(message['data']))
+            except Exception as e:
+                logger.error(f"Dropping malformed order event: {str(e)}")
+
+
+class Subscription:
+    """ One connected stream: an asyncio queue fed from any thread. """
+
+    def __init__(self, loop, max_pending):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self.overflowed = False
+
+    def push(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too slow to keep up: tell the client to reload instead of buffering forever
+            self.overflowed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait({'event': RESET, 'data': {}})
+
+
+class EventHub:
+    """ In-process fan-out of order events to subscribed streams, with a resumable backlog. """
+
+    def __init__(self, backlog_size=None, max_pending=None):
+        self.hub_id = uuid.uuid4().hex[:8]
+        self.backlog = deque(maxlen=backlog_size or getattr(settings, 'ORDER_EVENTS_BACKLOG', 500))
+        self.max_pending = max_pending or getattr(settings, 'ORDER_EVENTS_MAX_PENDING', 1000)
+        self.subscriptions = set()
+        self.sequence = 0
+        self.lock = threading.Lock()
+        self._backplane = None
+
+    @property
+    def backplane(self):
+        if self._backplane is None:
+            backplane_class = import_string(
+                getattr(settings, 'ORDER_EVENTS_BACKPLANE', 'orders.events.LocalBackplane')
+            )
+            self._backplane = backplane_class(self.deliver)
+        return self._backplane
+
+    def publish(self, event_type, data):
+        """ Sends an event to every process's streams. """
+        self.backplane.publish({'event': event_type, 'data': data})
+
+    def publish_many(self, event_type, items):
+        """ Sends one event per item of data, as a single batch. """
+        self.backplane.publish_many([{'event': event_type, 'data': data} for data in items])
+
+    def deliver(self, event):
+        """ Called by the backplane for every event: number it, remember it and push it to our streams. """
+        with self.lock:
+            self.sequence += 1
+            event = {**event, 'id': f'{self.hub_id}:{self.sequence}'}
+            self.backlog.append(event)
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            subscription.push(event)
+
+    def subscribe(self, last_event_id=None):
+        """ Returns (subscription, missed events) for a stream that has seen up to last_event_id. """
+        subscription = Subscription(asyncio.get_running_loop(), self.max_pending)
+        with self.lock:
+            self.subscriptions.add(subscription)
+            missed = self._missed_since(last_event_id)
+        return subscription, missed
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def _missed_since(self, last_event_id):
+        if not last_event_id:
+            return []
+        hub_id, _, sequence = last_event_id.partition(':')
+        try:
+            sequence = int(sequence)
+        except ValueError:
+            sequence = -1
+        if hub_id != self.hub_id or sequence > self.sequence:
+            return [{'event': RESET, 'data': {}}]
+        missed = [event for event in self.backlog if int(event['id'].partition(':')[2]) > sequence]
+        oldest = int(self.backlog[0]['id'].partition(':')[2]) if self.backlog else self.sequence + 1
+        if sequence + 1 < oldest:
+            # Some of what the client missed already fell out of the backlog
+            return [{'event': RESET, 'data': {}}]
+        return missed
+
+
+hub = EventHub()
+
+
+def format_sse(event):
+    """ Encodes an event in the text/event-stream wire format. """
+    lines = []
+    if event.get('id'):
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {event['event']}")
+    lines.append(f"data: {json.dumps(event['data'], cls=JSONEncoder)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def publish_order_event(order, event_type):
+    """ Publishes the order's current state once the surrounding transaction commits.
+        The order is reloaded with its items and latest payment prefetched. """
+    publish_order_events([order.pk], event_type)
+
+
+def publish_order_events(order_ids, event_type):
+    """ Publishes the current state of many orders as one batch once the surrounding
+        transaction commits. The orders are loaded together, in a few queries. """
+    order_ids = list(order_ids)
+
+    def _publish():
+        from .models import Order
+        from .serializers import OrderSerializer
+
+        try:
+            orders = Order.objects.for_read().filter(pk__in=order_ids).order_by('pk')
+            hub.publish_many(event_type, OrderSerializer(orders, many=True).data)
+        except Exception as e:
+            logger.error(f"Publishing {event_type} for {len(order_ids)} orders failed: {str(e)}")
+
+    if order_ids:
+        transaction.on_commit(_publish)
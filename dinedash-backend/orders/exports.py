@@ -0,0 +1,38 @@
+"""
+Order export rows for dinedash.exports.
+
+JSON Lines exports have one record per order with its items and payments
+nested, the same shape as the archive. CSV exports have one row per order
+item, with the order's columns repeated and its latest payment alongside.
+"""
+from .archive import ITEM_FIELDS, ORDER_FIELDS, order_record
+
+LATEST_PAYMENT_FIELDS = ['method', 'status', 'amount', 'transaction_ref']
+
+CSV_COLUMNS = (
+    ORDER_FIELDS
+    + [f'item_{field}' for field in ITEM_FIELDS]
+    + [f'payment_{field}' for field in LATEST_PAYMENT_FIELDS]
+)
+
+
+def export_queryset(queryset):
+    """ Orders in creation order, with what the rows need prefetched for each chunk. """
+    return queryset.order_by('created_at', 'pk').prefetch_related('items', 'payments')
+
+
+def order_rows(queryset, file_format, chunk_size=1000):
+    """ Rows for an export of the given orders, read chunk_size orders at a time. """
+    for order in export_queryset(queryset).iterator(chunk_size=chunk_size):
+        record = order_record(order)
+        if file_format == 'jsonl':
+            yield record
+            continue
+
+        row = {field: record[field] for field in ORDER_FIELDS}
+        payments = sorted(order.payments.all(), key=lambda payment: (payment.created_at, payment.pk))
+        if payments:
+            row.update({f'payment_{field}': getattr(payments[-1], field) for field in LATEST_PAYMENT_FIELDS})
+        # Orders without items still get a row
+        for item in record['items'] or [{}]:
+            yield {**row, **{f'item_{field}': value for field, value in item.items()}}
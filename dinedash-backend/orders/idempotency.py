@@ -0,0 +1,125 @@
+"""
+Idempotency keys for POST endpoints.
+
+A client that retries a request sends the same ``Idempotency-Key`` header
+each time. The first request with a key runs normally and its response is
+stored with the key; later requests with the key get the stored response
+back without running the view again.
+
+The key row is inserted in the same transaction as the view's writes, so:
+
+* an order is never committed without its stored response, and vice versa;
+* a duplicate that arrives while the first request is still running blocks
+  on the key's unique index until that transaction ends, then replays its
+  response (or runs itself, if the first one rolled back);
+* 5xx responses are not stored, so a retry after a server error runs again.
+
+Keys expire after ``IDEMPOTENCY_KEY_TTL`` seconds and are removed by the
+``purge_idempotency_keys`` command.
+"""
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(request):
+    """ Hash of everything that makes two requests "the same request". """
+    digest = hashlib.sha256()
+    for part in (request.method, request.path, str(request.user.pk or '')):
+        digest.update(part.encode())
+        digest.update(b'\0')
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def replay(record):
+    return Response(record.response_body, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
+
+
+def idempotent(handler):
+    """ Decorator for APIView handlers that honours the Idempotency-Key header. """
+
+    @functools.wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return handler(view, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {"error": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        fingerprint = request_fingerprint(request)
+        # Retries of completed requests (the common case) are answered with one query
+        record = IdempotencyKey.objects.filter(key=key, expires_at__gt=timezone.now()).first()
+
+        # Bounded: each pass either replays, runs the handler or clears an expired key
+        for _ in range(3):
+            if record is not None:
+                if record.request_hash != fingerprint:
+                    return Response(
+                        {"error": f"This {HEADER} was already used for a different request."},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    )
+                return replay(record)
+
+            with transaction.atomic():
+                try:
+                    with transaction.atomic():
+                        claimed = IdempotencyKey.objects.create(
+                            key=key,
+                            request_hash=fingerprint,
+                            expires_at=timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+                        )
+                except IntegrityError:
+                    # Another request holds (or held) this key; its transaction has ended by now
+                    claimed = None
+
+                if claimed is not None:
+                    response = handler(view, request, *args, **kwargs)
+                    if response.status_code >= 500:
+                        transaction.set_rollback(True)
+                    else:
+                        claimed.status_code = response.status_code
+                        # Stored as rendered, so a replay sends exactly the same JSON
+                        claimed.response_body = json.loads(JSONRenderer().render(response.data))
+                        claimed.save(update_fields=['status_code', 'response_body'])
+                    return response
+
+            record = IdempotencyKey.objects.filter(key=key).first()
+            if record is not None and record.expires_at <= timezone.now():
+                IdempotencyKey.objects.filter(pk=record.pk, expires_at__lte=timezone.now()).delete()
+                record = None
+
+        return Response(
+            {"error": "A request with this key is still being processed. Please retry shortly."},
+            status=status.HTTP_409_CONFLICT,
+        )
+
+    return wrapper
+
+
+def purge_expired(batch_size=1000):
+    """ Deletes expired keys in batches and returns how many were removed. """
+    removed = 0
+    while True:
+        batch = list(
+            IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).values_list('pk', flat=True)[:batch_size]
+        )
+        if not batch:
+            return removed
+        removed += IdempotencyKey.objects.filter(pk__in=batch).delete()[0]
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from orders import archive
+
+
+class Command(BaseCommand):
+    help = 'Move old orders, with their items and payments, into compressed daily archive files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=730, help='Archive orders older than this')
+        parser.add_argument('--before', help='Archive orders created before this day (YYYY-MM-DD) instead')
+        parser.add_argument('--format', choices=sorted(archive.EXTENSIONS), help='Default: parquet if pyarrow is installed')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Orders read from the database at a time')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Orders deleted per transaction')
+        parser.add_argument('--sleep', type=float, default=0, help='Seconds to pause between delete batches')
+        parser.add_argument('--dry-run', action='store_true', help='List the days and order counts without archiving')
+
+    def handle(self, *args, **options):
+        if options['before']:
+            try:
+                cutoff = parse_date(options['before'])
+            except ValueError:
+                cutoff = None
+            if cutoff is None:
+                raise CommandError('--before must be a date in YYYY-MM-DD format.')
+        else:
+            cutoff = timezone.localdate() - timezone.timedelta(days=options['older_than_days'])
+        if options['format'] == 'parquet' and archive.pyarrow is None:
+            raise CommandError('Parquet archives need pyarrow installed.')
+
+        def progress(day, count, name):
+            if name:
+                self.stdout.write(f"{day}: archived {count} orders to {name}")
+            else:
+                self.stdout.write(f"{day}: {count} orders")
+
+        try:
+            total = archive.archive_before(
+                cutoff, dry_run=options['dry_run'], progress=progress,
+                file_format=options['format'], chunk_size=options['chunk_size'],
+                batch_size=options['batch_size'], sleep=options['sleep'],
+            )
+        except archive.ArchiveError as e:
+            raise CommandError(str(e))
+        verb = 'Would archive' if options['dry_run'] else 'Archived'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {total} orders created before {cutoff}'))
+
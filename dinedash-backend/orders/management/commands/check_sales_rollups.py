@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_date
+
+from orders import rollups
+
+
+class Command(BaseCommand):
+    help = 'Compare the daily sales rollups against the raw order data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to check (YYYY-MM-DD), defaults to the first order')
+        parser.add_argument('--end', help='Last day to check (YYYY-MM-DD), defaults to the watermark')
+        parser.add_argument('--fix', action='store_true', help='Recompute every day that does not match')
+
+    def handle(self, *args, **options):
+        start = parse_date(options['start'] or '') or rollups.first_order_day()
+        end = parse_date(options['end'] or '') or rollups.watermark()
+        if not start or not end:
+            self.stdout.write('No rolled-up days to check')
+            return
+
+        mismatches = rollups.check(start, end)
+        for day, table, expected, actual in mismatches:
+            self.stdout.write(self.style.WARNING(f"{day} {table}: expected {expected}, rollup has {actual}"))
+
+        if mismatches and options['fix']:
+            for day in sorted({day for day, *_ in mismatches}):
+                rollups.refresh_day(day)
+                self.stdout.write(f"Recomputed {day}")
+
+        if mismatches:
+            self.stdout.write(self.style.ERROR(f'Found {len(mismatches)} mismatches between {start} and {end}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Rollups match the raw data between {start} and {end}'))
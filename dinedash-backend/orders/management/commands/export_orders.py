@@ -0,0 +1,64 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from dinedash import exports
+from dinedash.utils import filter_by_params
+from orders.exports import CSV_COLUMNS, order_rows
+from orders.models import Order
+from payments.exports import PAYMENT_COLUMNS, payment_rows
+from payments.models import Payment
+
+
+class Command(BaseCommand):
+    help = 'Stream orders (with their items and payments) or payments to a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-', help='File to write, or - for standard output')
+        parser.add_argument('--format', choices=sorted(exports.FORMATS), default='csv', dest='file_format')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output')
+        parser.add_argument('--payments', action='store_true', help='Export payments instead of orders')
+        parser.add_argument('--status', help='Only orders (or payments) with this status')
+        parser.add_argument('--order-type', help='Only orders of this type')
+        parser.add_argument('--method', help='Only payments made with this method')
+        parser.add_argument('--start-date', help='First day to include (YYYY-MM-DD)')
+        parser.add_argument('--end-date', help='Last day to include (YYYY-MM-DD)')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows read from the database at a time')
+
+    def handle(self, *args, **options):
+        params = {
+            param: options[option] for param, option in (
+                ('status', 'status'), ('order_type', 'order_type'), ('method', 'method'),
+                ('start_date', 'start_date'), ('end_date', 'end_date'),
+            ) if options[option]
+        }
+        file_format = options['file_format']
+        try:
+            if options['payments']:
+                payments = filter_by_params(Payment.objects.all(), params, {
+                    'status': [choice[0] for choice in Payment.PAYMENT_STATUS_CHOICES],
+                    'method': [choice[0] for choice in Payment.PAYMENT_METHOD_CHOICES],
+                })
+                rows, columns = payment_rows(payments, chunk_size=options['chunk_size']), PAYMENT_COLUMNS
+            else:
+                orders = filter_by_params(Order.objects.all(), params, {
+                    'status': [choice[0] for choice in Order.STATUS_CHOICES],
+                    'order_type': [choice[0] for choice in Order.ORDER_TYPE_CHOICES],
+                })
+                rows, columns = order_rows(orders, file_format, chunk_size=options['chunk_size']), CSV_COLUMNS
+        except ValidationError as e:
+            raise CommandError(str(e.detail))
+
+        chunks = exports.encode(rows, file_format, columns)
+        chunks = exports.gzipped(chunks) if options['gzip'] else (chunk.encode() for chunk in chunks)
+
+        output = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+        if options['output'] != '-':
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
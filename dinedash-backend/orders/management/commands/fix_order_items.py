@@ -1,38 +1,94 @@
+import time
+
 from django.core.management.base import BaseCommand
-from orders.models import OrderItem, Order
-import random
+from django.db import connection, transaction
+from django.db.models import Max, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from meals.models import Meal
+from orders.models import CHANGE_SEQUENCE, ChangeSequence, Order, OrderItem
+from orders.tracking import tracking_code_for
+
+# Items that lost their name or price but still point at a meal
+BROKEN_ITEMS = Q(meal__isnull=False) & (Q(item_name='Unknown Item') | Q(unit_price=0))
+
 
 class Command(BaseCommand):
     help = 'Fix OrderItem item_name and unit_price fields based on related Meal and fix Orders with temporary tracking_code'
 
-    def generate_human_readable_code(self, length=8):
-        # Generate a memorable, human-readable code (e.g., alternating consonants and vowels)
-        consonants = "BCDFGHJKLMNPQRSTVWXYZ"
-        vowels = "AEIOU"
-        code = ""
-        for i in range(length):
-            if i % 2 == 0:
-                code += random.choice(consonants)
-            else:
-                code += random.choice(vowels)
-        return code
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Count what would be fixed without changing anything')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Item IDs covered by each UPDATE')
+        parser.add_argument('--sleep', type=float, default=0, help='Seconds to pause between batches')
+        parser.add_argument('--after', type=int, default=0,
+                            help='Resume after this item ID (printed with the progress of an earlier run)')
 
     def handle(self, *args, **options):
-        order_items = OrderItem.objects.all()
-        updated_count = 0
-        for item in order_items:
-            if item.meal:
-                if item.item_name == 'Unknown Item' or item.unit_price == 0:
-                    item.item_name = item.meal.name
-                    item.unit_price = item.meal.price
-                    item.save()
-                    updated_count += 1
+        if options['dry_run']:
+            items = OrderItem.objects.filter(BROKEN_ITEMS, pk__gt=options['after']).count()
+            orders = Order.objects.filter(tracking_code__startswith='temp').count()
+            self.stdout.write(f'Would update {items} OrderItem records')
+            self.stdout.write(f'Would fix {orders} Orders with temporary tracking_code')
+            return
+
+        updated_count = self.fix_items(options['after'], options['batch_size'], options['sleep'])
         self.stdout.write(self.style.SUCCESS(f'Updated {updated_count} OrderItem records'))
 
-        temp_orders = Order.objects.filter(tracking_code__startswith='temp')
-        fixed_count = 0
-        for order in temp_orders:
-            order.tracking_code = self.generate_human_readable_code()
-            order.save()
-            fixed_count += 1
+        fixed_count = self.fix_tracking_codes(options['batch_size'])
         self.stdout.write(self.style.SUCCESS(f'Fixed {fixed_count} Orders with temporary tracking_code'))
+
+    def fix_items(self, after, batch_size, sleep):
+        """ Copies the meal's name and price onto broken items, one ID range per UPDATE and transaction.
+
+            Ranges are walked by ID, so nothing is read first and an interrupted run
+            can carry on with --after; each range is committed on its own. """
+        last_pk = OrderItem.objects.aggregate(last=Max('pk'))['last'] or 0
+        updated = 0
+        start = after
+        while start < last_pk:
+            end = min(start + batch_size, last_pk)
+            with transaction.atomic():
+                updated += self.fix_item_range(start, end)
+            self.stdout.write(f'  ...items up to ID {end}: {updated} updated (resume with --after {end})')
+            start = end
+            if sleep:
+                time.sleep(sleep)
+        return updated
+
+    def fix_item_range(self, start, end):
+        """ Fixes the broken items with start < ID <= end. Returns how many were updated. """
+        if connection.vendor == 'postgresql':
+            # A join instead of a subquery per row and column
+            item_table, meal_table = OrderItem._meta.db_table, Meal._meta.db_table
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'UPDATE {item_table} AS item SET item_name = meal.name, unit_price = meal.price '
+                    f'FROM {meal_table} AS meal '
+                    f'WHERE item.meal_id = meal.id AND item.id > %s AND item.id <= %s '
+                    f"AND (item.item_name = 'Unknown Item' OR item.unit_price = 0)",
+                    [start, end],
+                )
+                return cursor.rowcount
+
+        meal = Meal.objects.filter(pk=OuterRef('meal_id'))
+        return OrderItem.objects.filter(BROKEN_ITEMS, pk__gt=start, pk__lte=end).update(
+            item_name=Subquery(meal.values('name')[:1]),
+            unit_price=Subquery(meal.values('price')[:1]),
+        )
+
+    def fix_tracking_codes(self, batch_size):
+        """ Gives orders with a temporary tracking code their real one, a batch per bulk_update. """
+        fixed = 0
+        while True:
+            with transaction.atomic():
+                # Same ID-derived generator as Order.save(), so no collision check is needed
+                orders = list(Order.objects.filter(tracking_code__startswith='temp').only('pk')[:batch_size])
+                if not orders:
+                    return fixed
+                now = timezone.now()
+                for order, change_seq in zip(orders, ChangeSequence.reserve(CHANGE_SEQUENCE, len(orders))):
+                    order.tracking_code = tracking_code_for(order.pk)
+                    order.change_seq = change_seq
+                    order.updated_at = now
+                Order.objects.bulk_update(orders, ['tracking_code', 'change_seq', 'updated_at'])
+            fixed += len(orders)
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from orders import rollups
+
+
+class Command(BaseCommand):
+    help = 'Roll up closed days into the daily sales tables (incrementally, or rebuild a date range for backfills)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Recompute the rollups for --start..--end')
+        parser.add_argument('--start', help='First day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--end', help='Last day to rebuild (YYYY-MM-DD), defaults to yesterday')
+
+    def handle(self, *args, **options):
+        def progress(day):
+            self.stdout.write(f"Rolled up {day}")
+
+        if options['rebuild']:
+            start = parse_date(options['start'] or '') or rollups.first_order_day()
+            end = parse_date(options['end'] or '') or rollups.timezone.localdate()
+            if not start:
+                raise CommandError('Nothing to rebuild: pass --start or create some orders first.')
+            refreshed = rollups.rebuild(start, end, progress=progress)
+        else:
+            refreshed = rollups.refresh(progress=progress)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed {len(refreshed)} days, rollups now cover up to {rollups.watermark()}'
+        ))
@@ -0,0 +1,120 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from dinedash.utils import delete_in_batches, estimate_count
+from meals.models import Meal
+from orders import archive
+from orders.analytics import day_start
+from orders.models import Order, OrderItem
+from payments.models import Payment
+from payments.tasks import expire_pending_payments
+
+TASKS = ['cleanup', 'payments', 'meals', 'report']
+
+
+class Command(BaseCommand):
+    help = 'Run regular maintenance: archive old orders, expire stale payments and report on the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', nargs='+', choices=TASKS, help='Run only these tasks (default: all)')
+        parser.add_argument('--dry-run', action='store_true', help='Show estimated row counts without changing anything')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows deleted per transaction')
+        parser.add_argument('--sleep', type=float, default=0, help='Seconds to pause between delete batches')
+        parser.add_argument('--order-retention-days', type=int, default=730, help='Archive orders older than this')
+        parser.add_argument('--payment-retention-days', type=int,
+                            help='Also delete completed payments older than this (default: keep them with their order)')
+        parser.add_argument('--pending-timeout-hours', type=float,
+                            default=settings.PAYMENT_PENDING_TIMEOUT / 3600,
+                            help='Mark payments pending for longer than this as failed')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.stdout.write("Starting DineDash maintenance tasks" + (" (dry run)" if options['dry_run'] else "") + "...")
+        for name in options['only'] or TASKS:
+            getattr(self, name)()
+        self.stdout.write(self.style.SUCCESS("Maintenance tasks completed successfully!"))
+
+    def cleanup(self):
+        """ Archives old orders (with their items and payments) and, if asked, deletes old completed payments.
+
+            Orders are kept for accounting in the archive (see orders.archive) rather
+            than deleted; both steps work in small batches. """
+        retention = self.options['order_retention_days']
+        cutoff = timezone.localdate() - timezone.timedelta(days=retention)
+        old_orders = Order.objects.filter(created_at__lt=day_start(cutoff))
+        old_payments = None
+        if self.options['payment_retention_days'] is not None:
+            old_payments = Payment.objects.filter(
+                created_at__lt=timezone.now() - timezone.timedelta(days=self.options['payment_retention_days']),
+                status=Payment.STATUS_COMPLETED,
+            )
+
+        if self.options['dry_run']:
+            self.stdout.write(
+                f"Would archive about {estimate_count(old_orders)} orders older than {retention} days, with about "
+                f"{estimate_count(OrderItem.objects.filter(order__in=old_orders))} items"
+            )
+            if old_payments is not None:
+                self.stdout.write(f"Would delete about {estimate_count(old_payments)} completed payments older than "
+                                  f"{self.options['payment_retention_days']} days")
+            return
+
+        self.stdout.write("Archiving old orders...")
+        archived = archive.archive_before(
+            cutoff,
+            batch_size=self.options['batch_size'],
+            sleep=self.options['sleep'],
+            progress=lambda day, count, name: self.stdout.write(f"  ...{day}: archived {count} orders to {name}"),
+        )
+        self.stdout.write(f"Archived {archived} orders older than {retention} days")
+
+        if old_payments is not None:
+            deleted = delete_in_batches(
+                old_payments,
+                batch_size=self.options['batch_size'],
+                sleep=self.options['sleep'],
+                progress=lambda totals: self.stdout.write(
+                    f"  ...deleted {totals[Payment._meta.label]} completed payments so far"
+                ),
+            )
+            self.stdout.write(f"Deleted {deleted[Payment._meta.label]} completed payments older than "
+                              f"{self.options['payment_retention_days']} days")
+
+    def payments(self):
+        """ Marks payments that have been pending too long as failed, in one UPDATE. """
+        timeout = self.options['pending_timeout_hours'] * 3600
+        if self.options['dry_run']:
+            stale = Payment.objects.filter(
+                status=Payment.STATUS_PENDING,
+                created_at__lt=timezone.now() - timezone.timedelta(seconds=timeout),
+            )
+            self.stdout.write(f"Would mark about {estimate_count(stale)} timed-out pending payments as failed")
+            return
+
+        self.stdout.write("Processing pending payments...")
+        expired = expire_pending_payments(older_than=timeout)
+        self.stdout.write(f"Marked {expired} pending payments as failed due to timeout")
+
+    def meals(self):
+        """ Reports seasonal meals whose availability needs reviewing. """
+        seasonal = Meal.objects.filter(category__icontains='seasonal', is_available=True)
+        self.stdout.write(f"Found {seasonal.count()} seasonal meals to review")
+
+    def report(self):
+        """ Prints a summary of the database, counting all order statuses in one query. """
+        orders = Order.objects.aggregate(
+            total_orders=Count('id'),
+            pending_orders=Count('id', filter=Q(status=Order.STATUS_PENDING)),
+            completed_orders=Count('id', filter=Q(status=Order.STATUS_COMPLETED)),
+        )
+        report = {
+            'timestamp': timezone.now(),
+            'total_meals': Meal.objects.count(),
+            'total_payments': Payment.objects.count(),
+            **orders,
+        }
+        self.stdout.write("Maintenance Report:")
+        for key, value in report.items():
+            self.stdout.write(f"  {key}: {value}")
@@ -0,0 +1,127 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from meals.cache import menu_cache
+from meals.models import Meal
+from orders import rollups
+from orders.models import CHANGE_SEQUENCE, ChangeSequence, Order, OrderItem
+from orders.tracking import tracking_code_for
+from payments.models import Payment
+
+# Everything seeded is marked with these, so a later run can clear it
+MEAL_PREFIX = 'Bench Meal '
+CUSTOMER_EMAIL = 'bench@dinedash.invalid'
+# Pending card payments waiting for mock-verify use this reference prefix
+TRANSACTION_REF_PREFIX = 'BENCH-'
+
+SETTLED_STATUSES = [
+    Order.STATUS_IN_PROGRESS, Order.STATUS_READY, Order.STATUS_DELIVERED, Order.STATUS_COMPLETED,
+    Order.STATUS_COMPLETED, Order.STATUS_COMPLETED, Order.STATUS_CANCELLED,
+]
+
+
+class Command(BaseCommand):
+    help = 'Seed synthetic meals, orders, items and payments for the benchmarks (see benchmarks/hot_paths.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--meals', type=int, default=50, help='Meals on the menu')
+        parser.add_argument('--orders', type=int, default=5000, help='Orders to create')
+        parser.add_argument('--days', type=int, default=30, help='Spread the orders over this many past days')
+        parser.add_argument('--pending', type=float, default=0.2,
+                            help='Share of orders left pending with a card payment awaiting mock-verify')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Orders written per transaction')
+        parser.add_argument('--clear', action='store_true', help='Delete previously seeded data first')
+        parser.add_argument('--random-seed', type=int, default=42, help='Seed for the random generator')
+
+    def handle(self, *args, **options):
+        if options['meals'] < 1 or options['days'] < 1 or not 0 <= options['pending'] <= 1:
+            raise CommandError('--meals and --days must be at least 1 and --pending between 0 and 1.')
+        rng = random.Random(options['random_seed'])
+
+        if options['clear']:
+            deleted, _ = Order.objects.filter(customer_email=CUSTOMER_EMAIL).delete()
+            Meal.objects.filter(name__startswith=MEAL_PREFIX).delete()
+            self.stdout.write(f'Deleted {deleted} previously seeded rows')
+
+        meals = self.seed_meals(options['meals'], rng)
+
+        created = 0
+        while created < options['orders']:
+            count = min(options['batch_size'], options['orders'] - created)
+            self.seed_orders(count, meals, options['days'], options['pending'], rng)
+            created += count
+            self.stdout.write(f'  ...{created} orders')
+
+        # The analytics report reads closed days from the rollups
+        first_day = timezone.localdate() - timedelta(days=options['days'])
+        rollups.rebuild(first_day, timezone.localdate())
+
+        self.stdout.write(self.style.SUCCESS(f'Seeded {len(meals)} meals and {created} orders'))
+
+    def seed_meals(self, count, rng):
+        categories = [choice[0] for choice in Meal.CATEGORY_CHOICES]
+        Meal.objects.bulk_create(
+            [
+                Meal(
+                    name=f'{MEAL_PREFIX}{number:04d}',
+                    description='Synthetic meal for benchmarking',
+                    category=rng.choice(categories),
+                    price=Decimal(rng.randrange(300, 4000)) / 100,
+                    prep_time=rng.randrange(5, 40),
+                )
+                for number in range(1, count + 1)
+            ],
+            ignore_conflicts=True,
+        )
+        transaction.on_commit(menu_cache.bump)
+        return list(Meal.objects.filter(name__startswith=MEAL_PREFIX).order_by('pk')[:count])
+
+    def seed_orders(self, count, meals, days, pending_share, rng):
+        """ Writes ``count`` orders with their items and a payment each, in bulk. """
+        now = timezone.now()
+        with transaction.atomic():
+            orders = []
+            baskets = []
+            for _ in range(count):
+                basket = {meal: rng.randint(1, 3) for meal in rng.sample(meals, rng.randint(1, min(4, len(meals))))}
+                pending = rng.random() < pending_share
+                orders.append(Order(
+                    customer_name='Bench Customer',
+                    customer_email=CUSTOMER_EMAIL,
+                    order_type=rng.choice(Order.ORDER_TYPE_CHOICES)[0],
+                    table_number='B1',
+                    status=Order.STATUS_PENDING if pending else rng.choice(SETTLED_STATUSES),
+                    total_amount=sum(meal.price * quantity for meal, quantity in basket.items()),
+                ))
+                baskets.append(basket)
+            Order.objects.bulk_create(orders)
+
+            # bulk_create skips save(): stamp the tracking codes, change feed and creation times here
+            for order, change_seq in zip(orders, ChangeSequence.reserve(CHANGE_SEQUENCE, len(orders))):
+                order.tracking_code = tracking_code_for(order.pk)
+                order.change_seq = change_seq
+                order.created_at = now - timedelta(days=rng.randrange(days), seconds=rng.randrange(86400))
+            Order.objects.bulk_update(orders, ['tracking_code', 'change_seq', 'created_at'])
+
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, meal=meal, item_name=meal.name, unit_price=meal.price, quantity=quantity)
+                for order, basket in zip(orders, baskets)
+                for meal, quantity in basket.items()
+            ])
+            Payment.objects.bulk_create([
+                Payment(
+                    order=order,
+                    amount=order.total_amount,
+                    method='card',
+                    status=Payment.STATUS_PENDING,
+                    transaction_ref=f'{TRANSACTION_REF_PREFIX}{order.pk}',
+                )
+                if order.status == Order.STATUS_PENDING else
+                Payment(order=order, amount=order.total_amount, method='cash', status=Payment.STATUS_COMPLETED)
+                for order in orders
+            ])
@@ -0,0 +1,106 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meals', '0007_meal_indexes'),
+        ('orders', '0008_alter_orderitem_options_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyMealSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('meal_name', models.CharField(max_length=255)),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+            ],
+            options={
+                'ordering': ['day', 'meal_name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyOrderTypeSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('order_type', models.CharField(choices=[('dine in', 'Dine In'), ('takeaway', 'Takeaway'), ('delivery', 'Delivery'), ('pickup', 'Pickup')], max_length=10)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+            ],
+            options={
+                'ordering': ['day', 'order_type'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyPaymentMethodSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('method', models.CharField(max_length=10)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+            ],
+            options={
+                'ordering': ['day', 'method'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SalesRollupDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['day'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['tracking_code'], name='orders_orde_trackin_252782_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status'], name='orders_orde_status_c6dd84_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['order_type'], name='orders_orde_order_t_d697ad_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], name='orders_orde_created_0e92de_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user'], name='orders_orde_user_id_a87c6f_idx'),
+        ),
+        migrations.AddField(
+            model_name='dailymealsales',
+            name='meal',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='daily_sales', to='meals.meal'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyordertypesales',
+            constraint=models.UniqueConstraint(fields=('day', 'order_type'), name='unique_daily_order_type_sales'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailypaymentmethodsales',
+            constraint=models.UniqueConstraint(fields=('day', 'method'), name='unique_daily_payment_method_sales'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailymealsales',
+            constraint=models.UniqueConstraint(fields=('day', 'meal'), name='unique_daily_meal_sales'),
+        ),
+    ]
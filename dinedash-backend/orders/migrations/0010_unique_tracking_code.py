@@ -0,0 +1,63 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:09
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Q
+
+from orders.tracking import tracking_code_for
+
+
+def backfill_tracking_codes(apps, schema_editor):
+    """ Give new codes to orders whose code is missing, a 'temp' placeholder or a duplicate.
+
+        The first order to use a duplicated code keeps it, so codes customers
+        already have keep working wherever possible. """
+    Order = apps.get_model('orders', 'Order')
+
+    duplicates = (
+        Order.objects.exclude(Q(tracking_code='') | Q(tracking_code__isnull=True))
+        .values('tracking_code')
+        .annotate(copies=Count('id'), keep=Min('id'))
+        .filter(copies__gt=1)
+    )
+    keep_ids = {row['keep'] for row in duplicates}
+    duplicate_codes = [row['tracking_code'] for row in duplicates]
+
+    to_fix = Order.objects.filter(
+        Q(tracking_code='') | Q(tracking_code__isnull=True) | Q(tracking_code__startswith='temp')
+        | (Q(tracking_code__in=duplicate_codes) & ~Q(id__in=keep_ids))
+    ).only('id')
+
+    batch = []
+    for order in to_fix.iterator(chunk_size=1000):
+        order.tracking_code = tracking_code_for(order.id)
+        batch.append(order)
+        if len(batch) == 1000:
+            Order.objects.bulk_update(batch, ['tracking_code'])
+            batch = []
+    if batch:
+        Order.objects.bulk_update(batch, ['tracking_code'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='orders_orde_trackin_252782_idx',
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='tracking_code',
+            field=models.CharField(editable=False, max_length=12, null=True),
+        ),
+        migrations.RunPython(backfill_tracking_codes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='order',
+            name='tracking_code',
+            field=models.CharField(editable=False, max_length=12, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def stamp_existing_orders(apps, schema_editor):
+    """ Number existing orders in the order they last changed and start the counter after them. """
+    Order = apps.get_model('orders', 'Order')
+    ChangeSequence = apps.get_model('orders', 'ChangeSequence')
+
+    value = 0
+    batch = []
+    for order in Order.objects.order_by('updated_at', 'id').only('id').iterator(chunk_size=1000):
+        value += 1
+        order.change_seq = value
+        batch.append(order)
+        if len(batch) == 1000:
+            Order.objects.bulk_update(batch, ['change_seq'])
+            batch = []
+    if batch:
+        Order.objects.bulk_update(batch, ['change_seq'])
+
+    ChangeSequence.objects.create(name='orders', value=value)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_order_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='change_seq',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(stamp_existing_orders, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['change_seq'], name='orders_orde_change__380a2a_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:02
+
+from django.db import migrations
+from django.db.models import Max
+
+SEQUENCE = 'orders_changesequence_orders'
+
+
+def create_sequence(apps, schema_editor):
+    """ On PostgreSQL, move the 'orders' counter to a database sequence starting after every stamped order. """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Order = apps.get_model('orders', 'Order')
+    ChangeSequence = apps.get_model('orders', 'ChangeSequence')
+
+    counter = ChangeSequence.objects.filter(name='orders').values_list('value', flat=True).first() or 0
+    stamped = Order.objects.aggregate(highest=Max('change_seq'))['highest'] or 0
+    schema_editor.execute(f'CREATE SEQUENCE IF NOT EXISTS {SEQUENCE} START WITH {max(counter, stamped) + 1}')
+
+
+def drop_sequence(apps, schema_editor):
+    """ Carry the sequence's position back to the counter row before dropping it. """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    ChangeSequence = apps.get_model('orders', 'ChangeSequence')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'SELECT last_value FROM {SEQUENCE}')
+        value = cursor.fetchone()[0]
+    ChangeSequence.objects.update_or_create(name='orders', defaults={'value': value})
+    schema_editor.execute(f'DROP SEQUENCE IF EXISTS {SEQUENCE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0013_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_sequence, drop_sequence),
+    ]
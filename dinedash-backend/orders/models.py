@@ -1,8 +1,76 @@
-from django.db import models
+from django.db import connections, models, router, transaction
 import uuid
-import random
 from meals.models import Meal 
 from django.conf import settings 
+from .tracking import tracking_code_for
+
+
+CHANGE_SEQUENCE = 'orders'
+
+
+def read_prefetches():
+    """ The prefetches OrderSerializer relies on: the items and only the latest payment. """
+    from payments.models import Payment
+
+    latest_payment = Payment.objects.order_by('-created_at', '-id')[:1]
+    return [
+        'items',
+        models.Prefetch('payments', queryset=latest_payment, to_attr='latest_payments'),
+    ]
+
+
+class ChangeSequence(models.Model):
+    """ A named counter for change feeds.
+
+        On PostgreSQL the values come from a database sequence (created by
+        migration 0014), which hands them out without locking anything, so
+        concurrent order writes don't queue behind each other. Values are unique
+        and increase in the order they were handed out, but a transaction may
+        commit after one that took a later value, and rolled back values leave
+        gaps. Readers of the feed allow for that with a visibility lag (see
+        OrderChangesAPIView).
+
+        Other databases use the ``value`` column of this row, locked until the
+        caller's transaction ends (SQLite only runs one writer at a time anyway). """
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    @classmethod
+    def sequence_name(cls, name):
+        return f'{cls._meta.db_table}_{name}'
+
+    @classmethod
+    def next_value(cls, name):
+        return cls.reserve(name, 1)[0]
+
+    @classmethod
+    def reserve(cls, name, count):
+        """ Hands out ``count`` increasing values at once and returns them as a list. """
+        connection = connections[router.db_for_write(cls)]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT nextval(%s) FROM generate_series(1, %s)', [cls.sequence_name(name), count]
+                )
+                return sorted(value for value, in cursor.fetchall())
+
+        with transaction.atomic():
+            sequence, _ = cls.objects.select_for_update().get_or_create(name=name)
+            first = sequence.value + 1
+            sequence.value += count
+            sequence.save(update_fields=['value'])
+            return list(range(first, sequence.value + 1))
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class OrderQuerySet(models.QuerySet):
+    def for_read(self):
+        """ Loads everything OrderSerializer needs up front: the items and only the
+            latest payment, so a page of orders costs the same few queries at any size. """
+        return self.prefetch_related(*read_prefetches())
+
 
 class Order(models.Model):
     STATUS_PENDING = 'pending'
@@ -21,6 +89,16 @@ class Order(models.Model):
         (STATUS_CANCELLED, 'Cancelled'),
     ]
 
+    # The statuses an order may move to from each status
+    TRANSITIONS = {
+        STATUS_PENDING: {STATUS_IN_PROGRESS, STATUS_READY, STATUS_CANCELLED},
+        STATUS_IN_PROGRESS: {STATUS_READY, STATUS_COMPLETED, STATUS_CANCELLED},
+        STATUS_READY: {STATUS_DELIVERED, STATUS_COMPLETED, STATUS_CANCELLED},
+        STATUS_DELIVERED: {STATUS_COMPLETED},
+        STATUS_COMPLETED: set(),
+        STATUS_CANCELLED: set(),
+    }
+
     TYPE_DINE_IN = 'dine in'
     TYPE_TAKE_OUT = 'takeaway'
     TYPE_DELIVERY = 'delivery'
@@ -42,7 +120,7 @@ class Order(models.Model):
     )
 
     customer_identifier = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
-    tracking_code = models.CharField(max_length=12, editable=False)
+    tracking_code = models.CharField(max_length=12, editable=False, unique=True, null=True)
     customer_name = models.CharField(max_length=200, blank=True, null=True)
     customer_email = models.EmailField(blank=True, null=True)
     contact_phone = models.CharField(max_length=20, blank=True, null=True)
@@ -55,28 +133,66 @@ class Order(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Stamped from ChangeSequence on every write, for the "changed since" feed
+    change_seq = models.BigIntegerField(default=0, editable=False)
+
+    objects = OrderQuerySet.as_manager()
 
     class Meta:
         ordering = ['-created_at']
         verbose_name = "Order"
         verbose_name_plural = "Orders"
         indexes = [
-            models.Index(fields=['tracking_code']),
             models.Index(fields=['status']),
             models.Index(fields=['order_type']),
             models.Index(fields=['created_at']),
             models.Index(fields=['user']),
+            models.Index(fields=['change_seq']),
         ]
 
     def save(self, *args, **kwargs):
-        # Generate tracking code if not already set
-        if not self.tracking_code:
-            while True:
-                code = f"ORD{random.randint(10000, 99999)}"
-                if not Order.objects.filter(tracking_code=code).exists():
-                    self.tracking_code = code
-                    break
-        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'change_seq', 'updated_at'}
+
+        self.change_seq = ChangeSequence.next_value(CHANGE_SEQUENCE)
+        # The tracking code is derived from the ID, so it is unique without checking the table.
+        # Where the ID can be taken from the database sequence first, the code goes in with the INSERT
+        if self._state.adding and self.pk is None and not self.tracking_code:
+            self.pk = self.reserve_pk()
+            if self.pk is not None:
+                self.tracking_code = tracking_code_for(self.pk)
+                kwargs['force_insert'] = True
+
+        if self.tracking_code:
+            super().save(*args, **kwargs)
+            return
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.tracking_code = tracking_code_for(self.pk)
+            Order.objects.filter(pk=self.pk).update(tracking_code=self.tracking_code)
+
+    @classmethod
+    def reserve_pk(cls):
+        """ The next ID from the table's sequence on PostgreSQL; None elsewhere. """
+        connection = connections[router.db_for_write(cls)]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT nextval(pg_get_serial_sequence(%s, %s))', [cls._meta.db_table, cls._meta.pk.column])
+            return cursor.fetchone()[0]
+
+    @classmethod
+    def can_transition(cls, from_status, to_status):
+        return to_status in cls.TRANSITIONS.get(from_status, ())
+
+    @property
+    def latest_payment(self):
+        """ The most recent payment for this order, read from the for_read() prefetch when present. """
+        if not hasattr(self, 'latest_payments'):
+            self.latest_payments = list(self.payments.order_by('-created_at', '-id')[:1])
+        return self.latest_payments[0] if self.latest_payments else None
 
     def __str__(self):
         return f"{self.tracking_code} - {self.customer_name or self.customer_identifier}"
@@ -95,3 +211,76 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f"{self.quantity} x {self.item_name}"
+
+
+class IdempotencyKey(models.Model):
+    """ A client-chosen key and the response stored for it, see orders.idempotency. """
+    key = models.CharField(max_length=255, unique=True)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response_body = models.JSONField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.key} ({self.status_code})"
+
+
+# Pre-aggregated daily sales, maintained by orders.rollups
+
+class SalesRollupDay(models.Model):
+    """ One row per closed day that has been rolled up, with that day's totals.
+        Days are rolled up contiguously, so the latest row is the rollup watermark. """
+    day = models.DateField(unique=True)
+    order_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['day']
+
+    def __str__(self):
+        return f"{self.day}: {self.order_count} orders, {self.revenue}"
+
+
+class DailyOrderTypeSales(models.Model):
+    """ Daily order count and revenue for each order type. """
+    day = models.DateField()
+    order_type = models.CharField(max_length=10, choices=Order.ORDER_TYPE_CHOICES)
+    order_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+
+    class Meta:
+        ordering = ['day', 'order_type']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'order_type'], name='unique_daily_order_type_sales'),
+        ]
+
+
+class DailyPaymentMethodSales(models.Model):
+    """ Daily order count and revenue by the method of each order's latest payment. """
+    day = models.DateField()
+    method = models.CharField(max_length=10)
+    order_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+
+    class Meta:
+        ordering = ['day', 'method']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'method'], name='unique_daily_payment_method_sales'),
+        ]
+
+
+class DailyMealSales(models.Model):
+    """ Daily quantity sold and item revenue for each meal. """
+    day = models.DateField()
+    meal = models.ForeignKey(Meal, on_delete=models.SET_NULL, null=True, related_name='daily_sales')
+    meal_name = models.CharField(max_length=255)
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+
+    class Meta:
+        ordering = ['day', 'meal_name']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'meal'], name='unique_daily_meal_sales'),
+        ]
@@ -0,0 +1,230 @@
+"""
+Daily sales rollups.
+
+Closed days are summarised into SalesRollupDay, DailyOrderTypeSales,
+DailyPaymentMethodSales and DailyMealSales so the dashboard never has to
+scan the full order history. Days are rolled up contiguously from the first
+order up to yesterday; the latest rolled day is the watermark, and anything
+after it is computed live by ``orders.analytics``.
+
+Once a day's orders are archived (``orders.archive``) its rollup is the only
+summary left in the database, so rebuilds and checks leave archived days alone.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Max, Min, Sum
+from django.utils import timezone
+
+from jobs.queue import enqueue
+from . import analytics, archive
+from .models import (
+    DailyMealSales,
+    DailyOrderTypeSales,
+    DailyPaymentMethodSales,
+    Order,
+    SalesRollupDay,
+)
+
+
+def watermark():
+    """ The latest day that has been rolled up, or None before the first refresh. """
+    return SalesRollupDay.objects.aggregate(last=Max('day'))['last']
+
+
+@transaction.atomic
+def refresh_day(day):
+    """ Recomputes every rollup row for one day from the raw orders. """
+    orders = analytics.orders_on(day)
+    day_totals = analytics.totals(orders)
+
+    DailyOrderTypeSales.objects.filter(day=day).delete()
+    DailyPaymentMethodSales.objects.filter(day=day).delete()
+    DailyMealSales.objects.filter(day=day).delete()
+
+    DailyOrderTypeSales.objects.bulk_create([
+        DailyOrderTypeSales(day=day, order_type=order_type, order_count=count, revenue=revenue)
+        for order_type, (count, revenue) in analytics.revenue_by_order_type(orders).items()
+    ])
+    DailyPaymentMethodSales.objects.bulk_create([
+        DailyPaymentMethodSales(day=day, method=method, order_count=count, revenue=revenue)
+        for method, (count, revenue) in analytics.revenue_by_payment_method(orders).items()
+    ])
+    DailyMealSales.objects.bulk_create([
+        DailyMealSales(day=day, meal_id=meal_id, meal_name=name, quantity=quantity, revenue=revenue)
+        for meal_id, (name, quantity, revenue) in analytics.revenue_by_meal(orders).items()
+    ])
+    SalesRollupDay.objects.update_or_create(
+        day=day,
+        defaults={'order_count': day_totals['order_count'], 'revenue': day_totals['revenue']},
+    )
+
+
+def _days(start, end):
+    current = start
+    while current <= end:
+        yield current
+        current += timezone.timedelta(days=1)
+
+
+def first_order_day():
+    first = Order.objects.aggregate(first=Min('created_at'))['first']
+    return timezone.localdate(first) if first else None
+
+
+def refresh(until=None, progress=None):
+    """ Rolls up every closed day after the watermark, up to yesterday. Returns the days refreshed. """
+    yesterday = timezone.localdate() - timezone.timedelta(days=1)
+    until = min(until or yesterday, yesterday)
+    last = watermark()
+    start = last + timezone.timedelta(days=1) if last else first_order_day()
+    return rebuild(start, until, progress=progress) if start else []
+
+
+def rebuild(start, end, progress=None):
+    """ Recomputes the rollups for start..end (capped at yesterday), e.g. for a backfill.
+
+        Rollups must stay contiguous, so a range that starts past the watermark is
+        extended back to the day after it. Archived days are skipped: their orders
+        are no longer in the database, and recomputing them would zero them. """
+    yesterday = timezone.localdate() - timezone.timedelta(days=1)
+    end = min(end, yesterday)
+    last = watermark()
+    if last and start > last + timezone.timedelta(days=1):
+        start = last + timezone.timedelta(days=1)
+    elif not last:
+        start = min(start, first_order_day() or start)
+
+    archived = archive.archived_days(start, end)
+    refreshed = []
+    for day in _days(start, end):
+        if day in archived:
+            continue
+        refresh_day(day)
+        refreshed.append(day)
+        if progress:
+            progress(day)
+    return refreshed
+
+
+def check(start, end):
+    """ Compares rolled-up days in start..end against the raw orders.
+
+        Archived days are not compared, as their raw orders have left the database.
+        Returns a list of (day, table, expected, actual) for every mismatch. """
+    mismatches = []
+    archived = archive.archived_days(start, end)
+    rolled_days = {
+        rollup.day: rollup
+        for rollup in SalesRollupDay.objects.filter(day__gte=start, day__lte=end)
+        if rollup.day not in archived
+    }
+    for day, rollup in sorted(rolled_days.items()):
+        orders = analytics.orders_on(day)
+        day_totals = analytics.totals(orders)
+
+        expected = (day_totals['order_count'], day_totals['revenue'])
+        actual = (rollup.order_count, rollup.revenue)
+        if expected != actual:
+            mismatches.append((day, 'totals', expected, actual))
+
+        for table, expected, actual in (
+            ('order_type', analytics.revenue_by_order_type(orders), {
+                row.order_type: (row.order_count, row.revenue)
+                for row in DailyOrderTypeSales.objects.filter(day=day)
+            }),
+            ('payment_method', analytics.revenue_by_payment_method(orders), {
+                row.method: (row.order_count, row.revenue)
+                for row in DailyPaymentMethodSales.objects.filter(day=day)
+            }),
+            ('meal', {
+                meal_id: (quantity, revenue)
+                for meal_id, (_, quantity, revenue) in analytics.revenue_by_meal(orders).items()
+            }, {
+                row.meal_id: (row.quantity, row.revenue)
+                for row in DailyMealSales.objects.filter(day=day, meal__isnull=False)
+            }),
+        ):
+            if expected != actual:
+                mismatches.append((day, table, expected, actual))
+    return mismatches
+
+
+def schedule_refresh(order):
+    """ Queues a refresh of the order's day if that day may already be rolled up.
+
+        Orders placed today are picked up by the next incremental refresh, so the
+        checkout path normally costs nothing here. The job only recomputes the
+        day if it has been rolled up by the time it runs. """
+    day = timezone.localdate(order.created_at)
+    if day < timezone.localdate():
+        enqueue('orders.refresh_sales_rollup_day', day=day.isoformat())
+
+
+def schedule_refresh_days(created_ats):
+    """ schedule_refresh for a batch of orders, given their created_at: one job per past day. """
+    today = timezone.localdate()
+    for day in sorted({timezone.localdate(created_at) for created_at in created_ats}):
+        if day < today:
+            enqueue('orders.refresh_sales_rollup_day', day=day.isoformat())
+
+
+class RolledSales:
+    """ Reads the rollups for the closed days in start..end that are at or before the watermark. """
+
+    def __init__(self, start, end, last_day):
+        self.start = start
+        self.end = min(end, last_day) if end else last_day
+        self._days = SalesRollupDay.objects.filter(day__lte=self.end)
+        if start:
+            self._days = self._days.filter(day__gte=start)
+        totals = self._days.aggregate(order_count=Sum('order_count'), revenue=Sum('revenue'))
+        self.order_count = totals['order_count'] or 0
+        self.revenue = totals['revenue'] or Decimal('0.00')
+
+    @classmethod
+    def empty(cls):
+        rolled = cls.__new__(cls)
+        rolled.start = rolled.end = None
+        rolled.order_count = 0
+        rolled.revenue = Decimal('0.00')
+        return rolled
+
+    def _filter(self, queryset):
+        queryset = queryset.filter(day__lte=self.end)
+        return queryset.filter(day__gte=self.start) if self.start else queryset
+
+    def by_day(self, start, end):
+        if self.end is None or start > self.end:
+            return {}
+        rows = self._filter(SalesRollupDay.objects.filter(day__gte=start, day__lte=end))
+        return {row.day: (row.order_count, row.revenue) for row in rows}
+
+    def _grouped(self, model, key):
+        if self.end is None:
+            return {}
+        rows = (
+            self._filter(model.objects.all())
+            .values(key)
+            .annotate(total_orders=Sum('order_count'), total_revenue=Sum('revenue'))
+            .order_by()
+        )
+        return {row[key]: (row['total_orders'], row['total_revenue']) for row in rows}
+
+    def by_order_type(self):
+        return self._grouped(DailyOrderTypeSales, 'order_type')
+
+    def by_payment_method(self):
+        return self._grouped(DailyPaymentMethodSales, 'method')
+
+    def by_meal(self):
+        """ {meal ID: (current meal name, quantity, revenue)} across the rolled days. """
+        if self.end is None:
+            return {}
+        rows = (
+            self._filter(DailyMealSales.objects.filter(meal__isnull=False))
+            .values('meal_id', 'meal__name')
+            .annotate(total_quantity=Sum('quantity'), total_revenue=Sum('revenue'))
+            .order_by()
+        )
+        return {row['meal_id']: (row['meal__name'], row['total_quantity'], row['total_revenue']) for row in rows}
@@ -24,11 +24,11 @@ class OrderSerializer(serializers.ModelSerializer):
 
     def get_payment_method(self, obj):
         # Find out how this order was paid for
-        payment = obj.payments.first()
+        payment = obj.latest_payment
         return payment.method if payment else None
 
     def get_payment_tx_ref(self, obj):
-        payment = obj.payments.first()
+        payment = obj.latest_payment
         return payment.transaction_ref if payment else None
 
     class Meta:
@@ -50,8 +50,9 @@ class OrderSerializer(serializers.ModelSerializer):
             'items',
             'payment_method',
             'payment_tx_ref',
+            'change_seq',
         ]
-        read_only_fields = ['tracking_code', 'status', 'total_amount', 'created_at']
+        read_only_fields = ['tracking_code', 'status', 'total_amount', 'created_at', 'change_seq']
 
 
 # UPDATE SERIALIZERS
@@ -90,22 +91,41 @@ class OrderCreateSerializer(serializers.Serializer):
         if not items_data:
             raise serializers.ValidationError({"items": "Order must contain at least one item."})
 
-        calculated_total = Decimal('0.00')
-        delivery_fee = data.get('delivery_fee') or Decimal('0.00')
-        processed_items = []
-
+        # Merge repeated lines for the same meal so each meal is priced once
+        quantities = {}
         for item_data in items_data:
             meal_id = item_data['meal_id']
-            quantity = item_data['quantity']
+            quantities[meal_id] = quantities.get(meal_id, 0) + item_data['quantity']
 
-            try:
-                meal = Meal.objects.get(pk=meal_id)
-            except Meal.DoesNotExist:
-                raise serializers.ValidationError(f"Meal with ID {meal_id} does not exist.")
+        # Look up the whole basket in a single query
+        meals = Meal.objects.in_bulk(list(quantities))
 
-            if not getattr(meal, 'is_available', True):
-                raise serializers.ValidationError(f"Meal '{meal.name}' is currently unavailable.")
+        # Report every problem with the basket at once instead of stopping at the first
+        missing = [meal_id for meal_id in quantities if meal_id not in meals]
+        unavailable = [
+            meal_id for meal_id in quantities
+            if meal_id in meals and not getattr(meals[meal_id], 'is_available', True)
+        ]
+        if missing or unavailable:
+            errors = {}
+            if missing:
+                errors['missing_meals'] = [
+                    {"meal_id": meal_id, "error": f"Meal with ID {meal_id} does not exist."}
+                    for meal_id in missing
+                ]
+            if unavailable:
+                errors['unavailable_meals'] = [
+                    {"meal_id": meal_id, "error": f"Meal '{meals[meal_id].name}' is currently unavailable."}
+                    for meal_id in unavailable
+                ]
+            raise serializers.ValidationError({"items": errors})
+
+        calculated_total = Decimal('0.00')
+        delivery_fee = data.get('delivery_fee') or Decimal('0.00')
+        processed_items = []
 
+        for meal_id, quantity in quantities.items():
+            meal = meals[meal_id]
             item_price = meal.price * quantity
             calculated_total += item_price
 
@@ -0,0 +1,65 @@
+"""
+Background jobs for orders, run by ``manage.py run_workers``.
+"""
+import uuid
+
+from django.utils.dateparse import parse_date
+
+from jobs.models import Job
+from jobs.queue import task
+from payments.models import Payment
+from . import events, rollups
+from .models import SalesRollupDay
+
+
+def initiate_payment(payment):
+    """ Starts a non-cash payment with the (mock) gateway by giving it a transaction reference.
+
+        As in testing before, references containing "fail" simulate a declined payment. """
+    payment.transaction_ref = f"MOCK-PAY-{payment.order_id}-{uuid.uuid4().hex[:6]}"
+    if "fail" not in payment.transaction_ref.lower():
+        payment.status = Payment.STATUS_PENDING
+    else:
+        payment.status = Payment.STATUS_FAILED
+    payment.save()
+
+
+def payment_link(payment):
+    """ Where the customer completes a pending mock payment. """
+    return (
+        f"/api/payments/mock-verify/?tx_ref={payment.transaction_ref}"
+        f"&order_id={payment.order_id}&status=successful"
+    )
+
+
+def checkout_job_failed(payment):
+    """ Whether the job starting this payment failed for good (its error is kept on the job). """
+    return Job.objects.filter(
+        name='orders.initiate_checkout_payment', status=Job.STATUS_FAILED, payload__payment_id=payment.pk,
+    ).exists()
+
+
+@task('orders.initiate_checkout_payment')
+def initiate_checkout_payment(payment_id):
+    """ The part of an asynchronous checkout that runs after the order is committed. """
+    payment = Payment.objects.select_related('order').get(pk=payment_id)
+    # Safe to run twice: a payment that already has a reference was initiated before
+    if payment.method != 'cash' and not payment.transaction_ref:
+        initiate_payment(payment)
+
+    rollups.schedule_refresh(payment.order)
+    events.publish_order_event(payment.order, events.ORDER_CREATED)
+
+
+@task('orders.refresh_sales_rollup_day')
+def refresh_sales_rollup_day(day):
+    """ Recomputes one already rolled-up day after one of its orders changed. """
+    day = parse_date(day)
+    if SalesRollupDay.objects.filter(day=day).exists():
+        rollups.refresh_day(day)
+
+
+@task('orders.refresh_sales_rollups')
+def refresh_sales_rollups():
+    """ Rolls up the days closed since the last run. """
+    rollups.refresh()
@@ -1,3 +1,1278 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import io
+import json
+import logging
+import tempfile
+from collections import Counter
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test import AsyncClient, AsyncRequestFactory, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from prometheus_client import REGISTRY
+from rest_framework.test import APITestCase, force_authenticate
+from rest_framework.throttling import AnonRateThrottle
+
+from dinedash.instrumentation import RequestMetrics, _current, fingerprint, timed_section
+from dinedash.logs import JSONFormatter
+from jobs.models import Job
+from jobs.queue import Worker
+from meals.models import Meal
+from payments.models import Payment
+from users.models import User
+from . import archive, events, rollups, transitions
+from .analytics import day_start
+from .models import ChangeSequence, DailyMealSales, IdempotencyKey, Order, OrderItem, SalesRollupDay
+from .serializers import OrderCreateSerializer
+from .views import AnalyticsAsyncView, OrderExportAPIView, OrderRetrieveAsyncView
+from .tracking import has_valid_check_character, tracking_code_for
+
+
+def create_order(meal, **kwargs):
+    """ Creates an order with two line items and a cash payment, like a normal checkout. """
+    order = Order.objects.create(total_amount=meal.price * 3, **kwargs)
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, meal=meal, item_name=meal.name, unit_price=meal.price, quantity=1),
+        OrderItem(order=order, meal=meal, item_name=meal.name, unit_price=meal.price, quantity=2),
+    ])
+    Payment.objects.create(order=order, amount=order.total_amount, method='cash', status='completed')
+    return order
+
+
+class OrderReadQueryTests(APITestCase):
+    """ The order read endpoints must cost a fixed number of queries, whatever the page size. """
+
+    def setUp(self):
+        self.meal = Meal.objects.create(name='Jollof Rice', price=Decimal('12.50'), prep_time=15)
+
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/orders/')
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_list_query_count_does_not_grow_with_page_size(self):
+        create_order(self.meal)
+        single_count, _ = self.count_list_queries()
+
+        for _ in range(19):
+            create_order(self.meal)
+        full_count, response = self.count_list_queries()
+
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertEqual(single_count, full_count)
+        # The orders, their items and their latest payments (keyset pages need no COUNT)
+        self.assertEqual(full_count, 3)
+
+    def test_detail_endpoints_use_prefetched_data(self):
+        order = create_order(self.meal)
+
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/orders/staff/{order.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['items']), 2)
+
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/orders/{order.tracking_code}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_payment_fields_come_from_latest_payment(self):
+        order = create_order(self.meal)
+        Payment.objects.create(
+            order=order, amount=order.total_amount, method='momo',
+            status='pending', transaction_ref='MOCK-PAY-LATEST',
+        )
+
+        response = self.client.get(f'/api/orders/staff/{order.id}/')
+        self.assertEqual(response.data['payment_method'], 'momo')
+        self.assertEqual(response.data['payment_tx_ref'], 'MOCK-PAY-LATEST')
+
+
+class AnalyticsTests(APITestCase):
+    """ Analytics are computed in SQL with a constant number of queries. """
+
+    def setUp(self):
+        self.rice = Meal.objects.create(name='Jollof Rice', price=Decimal('12.50'), prep_time=15)
+        self.soup = Meal.objects.create(name='Light Soup', price=Decimal('8.00'), prep_time=10)
+
+    def test_metrics_match_raw_orders(self):
+        create_order(self.rice)
+        pending = create_order(self.soup)
+        Payment.objects.create(order=pending, amount=pending.total_amount, method='momo', status='pending')
+        create_order(self.rice, status=Order.STATUS_COMPLETED)
+
+        response = self.client.get('/api/orders/analytics/')
+        self.assertEqual(response.status_code, 200)
+        data = response.data
+
+        self.assertEqual(data['total_orders'], 3)
+        self.assertAlmostEqual(data['total_revenue'], 37.5 * 2 + 24.0)
+        self.assertAlmostEqual(data['today_revenue'], data['total_revenue'])
+        self.assertEqual(len(data['daily_revenue']), 7)
+        self.assertEqual(data['daily_revenue'][-1]['orders'], 3)
+        self.assertEqual(data['payment_breakdown'], {'cash': 75.0, 'momo': 24.0})
+        self.assertEqual(data['most_profitable'][0], {'name': 'Jollof Rice', 'revenue': 75.0})
+        self.assertEqual(data['ordered_quantities'], {str(self.rice.id): 3, str(self.soup.id): 3})
+
+    def test_query_count_is_independent_of_range_and_volume(self):
+        create_order(self.rice)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get('/api/orders/analytics/')
+
+        for _ in range(10):
+            create_order(self.soup)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get('/api/orders/analytics/?start_date=2020-01-01&end_date=2030-12-31')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['daily_revenue']), 4018)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        self.assertLessEqual(len(large.captured_queries), 8)
+
+
+class SalesRollupTests(APITestCase):
+    """ Closed days are served from the rollups and match what the raw orders say. """
+
+    def setUp(self):
+        self.rice = Meal.objects.create(name='Jollof Rice', price=Decimal('12.50'), prep_time=15)
+        self.today = timezone.localdate()
+        for days_ago, meal in ((3, self.rice), (2, self.rice), (2, self.rice), (0, self.rice)):
+            order = create_order(meal, order_type=Order.TYPE_DELIVERY if days_ago == 2 else Order.TYPE_DINE_IN)
+            Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timezone.timedelta(days=days_ago))
+
+    def get_report(self):
+        response = self.client.get('/api/orders/analytics/')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_refresh_rolls_up_closed_days_only(self):
+        refreshed = rollups.refresh()
+
+        self.assertEqual(refreshed[0], self.today - timezone.timedelta(days=3))
+        self.assertEqual(rollups.watermark(), self.today - timezone.timedelta(days=1))
+        self.assertFalse(SalesRollupDay.objects.filter(day=self.today).exists())
+        self.assertEqual(SalesRollupDay.objects.get(day=self.today - timezone.timedelta(days=2)).order_count, 2)
+        self.assertEqual(rollups.refresh(), [])
+
+    def test_report_is_the_same_with_and_without_rollups(self):
+        live = self.get_report()
+        rollups.refresh()
+        rolled = self.get_report()
+
+        self.assertEqual(live, rolled)
+        self.assertEqual(rolled['total_orders'], 4)
+        self.assertEqual(rolled['order_type_breakdown'], {'dine in': 75.0, 'delivery': 75.0})
+        self.assertEqual(rolled['daily_revenue'][-3]['orders'], 2)
+
+    def test_status_change_on_closed_day_refreshes_its_rollup(self):
+        rollups.refresh()
+        order = Order.objects.filter(created_at__date=self.today - timezone.timedelta(days=3)).get()
+
+        Payment.objects.create(order=order, amount=order.total_amount, method='card', status='completed')
+        Order.objects.filter(pk=order.pk).update(status=Order.STATUS_IN_PROGRESS)
+        response = self.client.patch(f'/api/orders/{order.id}/status/', {'status': 'completed'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Job.objects.get().name, 'orders.refresh_sales_rollup_day')
+
+        Worker().run_until_empty()
+        self.assertEqual(self.get_report()['payment_breakdown'], {'card': 37.5, 'cash': 112.5})
+
+    def test_checker_reports_and_fixes_drift(self):
+        rollups.refresh()
+        self.assertEqual(rollups.check(self.today - timezone.timedelta(days=3), self.today), [])
+
+        DailyMealSales.objects.update(quantity=99)
+        out = StringIO()
+        call_command('check_sales_rollups', '--fix', stdout=out)
+
+        self.assertIn('meal', out.getvalue())
+        self.assertEqual(rollups.check(self.today - timezone.timedelta(days=3), self.today), [])
+
+
+class OrderListPaginationTests(APITestCase):
+    """ The order list pages with keyset cursors and supports filters. """
+
+    def setUp(self):
+        self.meal = Meal.objects.create(name='Jollof Rice', price=Decimal('12.50'), prep_time=15)
+        self.orders = [create_order(self.meal) for _ in range(25)]
+        # Give some orders identical timestamps so the id tie-breaker matters
+        Order.objects.filter(pk__in=[order.pk for order in self.orders[5:15]]).update(
+            created_at=self.orders[5].created_at
+        )
+
+    def test_cursor_walks_every_order_once_without_counting(self):
+        seen = []
+        url = '/api/orders/?page_size=7'
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            self.assertFalse(any('COUNT(' in query['sql'] for query in ctx.captured_queries))
+            seen.extend(order['id'] for order in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(set(seen), {order.id for order in self.orders})
+
+    def test_previous_link_returns_the_same_page(self):
+        first = self.client.get('/api/orders/?page_size=10').data
+        second = self.client.get(first['next']).data
+        back = self.client.get(second['previous']).data
+
+        self.assertIsNone(first['previous'])
+        self.assertEqual([o['id'] for o in back['results']], [o['id'] for o in first['results']])
+
+    def test_page_number_mode_is_opt_in(self):
+        response = self.client.get('/api/orders/?page=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_filters(self):
+        Order.objects.filter(pk=self.orders[0].pk).update(status=Order.STATUS_READY)
+        response = self.client.get('/api/orders/?status=ready')
+        self.assertEqual([o['id'] for o in response.data['results']], [self.orders[0].id])
+
+        today = timezone.localdate()
+        response = self.client.get(f'/api/orders/?start_date={today}&end_date={today}&order_type=dine in')
+        self.assertEqual(len(response.data['results']), 20)
+
+        response = self.client.get('/api/orders/?end_date=2000-01-01')
+        self.assertEqual(response.data['results'], [])
+
+        self.assertEqual(self.client.get('/api/orders/?status=lost').status_code, 400)
+        self.assertEqual(self.client.get('/api/orders/?start_date=yesterday').status_code, 400)
+        self.assertEqual(self.client.get('/api/orders/?cursor=garbage').status_code, 404)
+
+
+class TrackingCodeTests(APITestCase):
+    """ Tracking codes are derived from the order ID: unique, unguessable-looking and typo-checked. """
+
+    def test_codes_are_unique_and_need_no_existence_query(self):
+        codes = {tracking_code_for(pk) for pk in range(1, 20001)}
+        self.assertEqual(len(codes), 20000)
+        self.assertTrue(all(len(code) == 11 and code.startswith('ORD') for code in codes))
+
+        with CaptureQueriesContext(connection) as ctx:
+            order = Order.objects.create()
+        self.assertEqual(order.tracking_code, tracking_code_for(order.pk))
+        self.assertFalse(any(
+            query['sql'].startswith('SELECT') and 'tracking_code' in query['sql'] for query in ctx.captured_queries
+        ))
+
+    def test_check_character_catches_typos(self):
+        code = tracking_code_for(12345)
+        self.assertTrue(has_valid_check_character(code))
+        typo = code[:5] + ('X' if code[5] != 'X' else 'Y') + code[6:]
+        self.assertFalse(has_valid_check_character(typo))
+        self.assertTrue(has_valid_check_character('ORD12345'))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/api/orders/{typo}/')
+        self.assertEqual(response.status_code, 404)
+
+
+class OrderCreateValidationTests(APITestCase):
+    """ Basket validation looks up every meal in one query and reports all problems together. """
+
+    def setUp(self):
+        self.meals = [
+            Meal.objects.create(name=f'Meal {i}', price=Decimal('5.00') + i, prep_time=10)
+            for i in range(15)
+        ]
+
+    def validate(self, items):
+        serializer = OrderCreateSerializer(data={'customer_name': 'Ama', 'items': items})
+        return serializer, serializer.is_valid()
+
+    def test_query_count_is_independent_of_basket_size(self):
+        for size in (1, 15):
+            items = [{'meal_id': meal.id, 'quantity': 1} for meal in self.meals[:size]]
+            with self.assertNumQueries(1):
+                serializer, valid = self.validate(items)
+            self.assertTrue(valid)
+            self.assertEqual(len(serializer.validated_data['items_processed']), size)
+
+    def test_duplicate_lines_are_merged(self):
+        meal = self.meals[0]
+        serializer, valid = self.validate([
+            {'meal_id': meal.id, 'quantity': 2},
+            {'meal_id': meal.id, 'quantity': 3},
+        ])
+        self.assertTrue(valid)
+        self.assertEqual(len(serializer.validated_data['items_processed']), 1)
+        self.assertEqual(serializer.validated_data['items_processed'][0]['quantity'], 5)
+        self.assertEqual(serializer.validated_data['total_amount'], meal.price * 5)
+
+    def test_every_missing_and_unavailable_meal_is_reported(self):
+        Meal.objects.filter(pk__in=[self.meals[1].pk, self.meals[2].pk]).update(is_available=False)
+        serializer, valid = self.validate([
+            {'meal_id': self.meals[0].id, 'quantity': 1},
+            {'meal_id': self.meals[1].id, 'quantity': 1},
+            {'meal_id': self.meals[2].id, 'quantity': 1},
+            {'meal_id': 9998, 'quantity': 1},
+            {'meal_id': 9999, 'quantity': 1},
+        ])
+        self.assertFalse(valid)
+        errors = serializer.errors['items']
+        self.assertEqual([int(e['meal_id']) for e in errors['missing_meals']], [9998, 9999])
+        self.assertEqual(
+            [int(e['meal_id']) for e in errors['unavailable_meals']],
+            [self.meals[1].id, self.meals[2].id],
+        )
+
+
+class OrderTrackingConditionalGetTests(APITestCase):
+    """ Tracking lookups answer 304 until the order or one of its payments changes. """
+
+    def setUp(self):
+        self.meal = Meal.objects.create(name='Jollof Rice', price=Decimal('12.50'), prep_time=15)
+        self.order = create_order(self.meal)
+        self.url = f'/api/orders/{self.order.tracking_code}/'
+
+    def test_unchanged_order_gets_304_in_one_query(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], first['ETag'])
+
+    def test_status_and_payment_changes_change_the_etag(self):
+        first = self.client.get(self.url)
+
+        self.order.status = Order.STATUS_READY
+        self.order.save()
+        second = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data['status'], Order.STATUS_READY)
+
+        payment = self.order.payments.get()
+        payment.status = 'failed'
+        payment.save()
+        third = self.client.get(self.url, HTTP_IF_NONE_MATCH=second['ETag'])
+        self.assertEqual(third.status_code, 200)
+        self.assertNotEqual(third['ETag'], second['ETag'])
+
+
+class AsyncReadViewTests(APITestCase):
+    """ The async tracking and analytics views answer exactly like the DRF ones. """
+
+    def setUp(self):
+        caches['default'].clear()
+        self.meal = Meal.objects.create(name='Jollof Rice', price=Decimal('12.50'), prep_time=15)
+        self.order = create_order(self.meal)
+        self.factory = RequestFactory()
+
+    def call(self, view, path, **kwargs):
+        return async_to_sync(view.as_view())(self.factory.get(path, headers=kwargs.pop('headers', None)), **kwargs)
+
+    def test_tracking_matches_the_sync_view(self):
+        url = f'/api/orders/{self.order.tracking_code}/'
+        expected = self.client.get(url)
+        response = self.call(OrderRetrieveAsyncView, url, tracking_code=self.order.tracking_code)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), json.loads(expected.content))
+        self.assertEqual(response['ETag'], expected['ETag'])
+
+        with self.assertNumQueries(1):
+            cached = self.call(OrderRetrieveAsyncView, url, tracking_code=self.order.tracking_code,
+                               headers={'If-None-Match': response['ETag']})
+        self.assertEqual(cached.status_code, 304)
+        missing = self.call(OrderRetrieveAsyncView, '/api/orders/X/', tracking_code=tracking_code_for(999999))
+        self.assertEqual(missing.status_code, 404)
+
+    def test_analytics_matches_the_sync_view(self):
+        expected = self.client.get('/api/orders/analytics/?start_date=2020-01-01')
+        response = self.call(AnalyticsAsyncView, '/api/orders/analytics/?start_date=2020-01-01')
+        self.assertEqual(json.loads(response.content), json.loads(expected.content))
+        self.assertEqual(self.call(AnalyticsAsyncView, '/api/orders/analytics/?end_date=2020-13-01').status_code, 400)
+
+    def test_default_throttles_apply(self):
+        with mock.patch.dict(AnonRateThrottle.THROTTLE_RATES, {'anon': '1/hour'}):
+            self.call(AnalyticsAsyncView, '/api/orders/analytics/')
+            throttled = self.call(AnalyticsAsyncView, '/api/orders/analytics/')
+        self.assertEqual(throttled.status_code, 429)
+        self.assertIn('Retry-After', throttled)
+        self.assertTrue(json.loads(throttled.content)['error'])
+
+
+class RequestMetricsTests(APITestCase):
+    """ Every request reports its query count and timings in Server-Timing; slow ones are also logged. """
+
+    def setUp(self):
+        caches['default'].clear()
+        self.meal = Meal.objects.create(name='Jollof Rice', price=Decimal('12.50'), prep_time=15)
+        self.order = create_order(self.meal)
+        self.url = f'/api/orders/{self.order.tracking_code}/'
+
+    def test_server_timing_and_log_fields(self):
+        with CaptureQueriesContext(connection) as queries, self.assertLogs('dinedash.requests', 'DEBUG') as logs:
+            response = self.client.get(self.url)
+        timing = response['Server-Timing']
+        for metric in ('db;', 'render;', 'serializer;', 'view;', 'total;'):
+            self.assertIn(metric, timing)
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+
+        record = logs.records[-1]
+        self.assertEqual(record.levelno, logging.DEBUG)
+        self.assertEqual(record.view, 'orders:order-detail')
+        self.assertEqual(record.db_queries, len(queries))
+        self.assertEqual(record.status_code, 200)
+        self.assertGreater(record.render_ms, 0)
+        self.assertGreater(record.serializer_ms, 0)
+        self.assertGreaterEqual(record.view_ms, record.serializer_ms)
+        self.assertGreaterEqual(record.duration_ms, record.view_ms)
+
+    def test_serializer_time_covers_list_and_checkout(self):
+        with self.assertLogs('dinedash.requests', 'DEBUG') as logs:
+            self.client.get('/api/orders/')
+            checkout = self.client.post('/api/orders/checkout/', {
+                'order': {'customer_name': 'Ama', 'items': [{'meal_id': self.meal.id, 'quantity': 1}]},
+                'payment': {'method': 'cash'},
+            }, format='json')
+        self.assertEqual(checkout.status_code, 201)
+        self.assertTrue(all(record.serializer_ms > 0 for record in logs.records))
+
+    def test_nested_sections_are_counted_once(self):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        # Only the outer section reads the clock
+        try:
+            with mock.patch('dinedash.instrumentation.time.perf_counter', side_effect=[10.0, 12.5]):
+                with timed_section('serializer'):
+                    with timed_section('serializer'):
+                        pass
+        finally:
+            _current.reset(token)
+        self.assertEqual(metrics.sections['serializer'], 2.5)
+
+    def test_only_slow_requests_are_logged_above_debug(self):
+        with self.assertNoLogs('dinedash.requests', 'INFO'):
+            self.client.get(self.url)
+        with self.settings(SLOW_REQUEST_THRESHOLD_MS=0), self.assertLogs('dinedash.requests', 'WARNING') as logs:
+            self.client.get(self.url)
+        self.assertTrue(logs.records[-1].getMessage().startswith('Slow request: GET'))
+
+    @override_settings(REQUEST_METRICS_SERVER_TIMING=False)
+    def test_server_timing_can_be_turned_off(self):
+        self.assertNotIn('Server-Timing', self.client.get(self.url))
+
+    def test_async_requests_are_counted(self):
+        response = async_to_sync(AsyncClient().get)(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('desc="0 queries"', response['Server-Timing'])
+
+    @override_settings(SLOW_QUERY_LOG=True, SLOW_QUERY_THRESHOLD_MS=0)
+    def test_slow_queries_are_logged_with_fingerprints(self):
+        with self.assertLogs('dinedash.slow_queries', 'WARNING') as logs:
+            self.client.get(self.url)
+        record = logs.records[0]
+        self.assertEqual(record.view, 'orders:order-detail')
+        self.assertNotIn(self.order.tracking_code, record.fingerprint)
+        self.assertEqual(len(record.fingerprint_id), 12)
+
+    def test_fingerprints_group_queries_of_the_same_shape(self):
+        self.assertEqual(
+            fingerprint('SELECT "orders_order"."id" FROM "orders_order"\n WHERE "id" IN (%s, %s, %s) '
+                        "AND name = 'it''s' LIMIT 21"),
+            'SELECT "orders_order"."id" FROM "orders_order" WHERE "id" IN (...) AND name = ? LIMIT ?',
+        )
+        self.assertEqual(fingerprint('SELECT 1 FROM t WHERE a = %s'), fingerprint('SELECT 2 FROM t WHERE a = %s'))
+
+    def test_json_log_lines_include_extra_fields(self):
+        record = logging.makeLogRecord({'msg': 'GET / 200', 'levelname': 'INFO', 'db_queries': 3})
+        line = json.loads(JSONFormatter().format(record))
+        self.assertEqual((line['message'], line['db_queries']), ('GET / 200', 3))
+
+
+class PrometheusMetricsTests(APITestCase):
+    """ /metrics reports request latencies, throttling, checkouts and status transitions. """
+
+    def setUp(self):
+        caches['default'].clear()
+        self.meal = Meal.objects.create(name='Jollof Rice', price=Decimal('12.50'), prep_time=15)
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def checkout(self, method, **headers):
+        return self.client.post('/api/orders/checkout/', {
+            'order': {'customer_name': 'Ama', 'items': [{'meal_id': self.meal.id, 'quantity': 1}]},
+            'payment': {'method': method},
+        }, format='json', headers=headers)
+
+    def test_requests_are_timed_per_url_name(self):
+        before = self.sample('dinedash_request_duration_seconds_count', url_name='analytics', method='GET')
+        self.client.get('/api/orders/analytics/')
+        self.client.get('/no-such-page/')
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn(b'dinedash_request_duration_seconds_bucket{le="0.005",method="GET",url_name="analytics"}',
+                      response.content)
+        self.assertEqual(self.sample('dinedash_request_duration_seconds_count', url_name='analytics', method='GET'),
+                         before + 1)
+        self.assertGreater(self.sample('dinedash_request_db_queries_sum', url_name='analytics'), 0)
+        self.assertGreater(self.sample('dinedash_requests_total', url_name='unmatched', method='GET', status='404'), 0)
+
+    def test_throttle_rejections_are_counted(self):
+        before = self.sample('dinedash_throttled_requests_total', url_name='analytics')
+        with mock.patch.dict(AnonRateThrottle.THROTTLE_RATES, {'anon': '1/hour'}):
+            self.client.get('/api/orders/analytics/')
+            self.assertEqual(self.client.get('/api/orders/analytics/').status_code, 429)
+        self.assertEqual(self.sample('dinedash_throttled_requests_total', url_name='analytics'), before + 1)
+
+    def test_checkout_outcomes_by_method(self):
+        def count(method, outcome):
+            return self.sample('dinedash_checkouts_total', method=method, outcome=outcome)
+
+        before = [count('cash', 'completed'), count('card', 'pending_payment'), count('unknown', 'invalid')]
+        self.checkout('cash', **{'Idempotency-Key': 'metrics-1'})
+        self.checkout('cash', **{'Idempotency-Key': 'metrics-1'})
+        self.checkout('card')
+        self.checkout('bitcoin')
+        self.assertEqual(
+            [count('cash', 'completed'), count('card', 'pending_payment'), count('unknown', 'invalid')],
+            [before[0] + 1, before[1] + 1, before[2] + 1],
+        )
+
+    def test_committed_status_transitions_are_counted(self):
+        def count(from_status, to_status):
+            return self.sample('dinedash_order_status_transitions_total', from_status=from_status, to_status=to_status)
+
+        orders = [create_order(self.meal) for _ in range(3)]
+        before = [count('pending', 'ready'), count('ready', 'delivered')]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/orders/{orders[0].id}/status/', {'status': 'ready'}, format='json')
+        self.client.force_authenticate(User.objects.create_user(username='kitchen', password='pass12345', is_staff=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/orders/bulk-status/', {
+                'updates': [{'id': orders[0].id, 'status': 'delivered'}, {'id': orders[1].id, 'status': 'ready'},
+                            {'id': orders[2].id, 'status': 'ready'}],
+            }, format='json')
+        self.assertEqual([count('pending', 'ready'), count('ready', 'delivered')], [before[0] + 3, before[1] + 1])
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_token_protects_the_endpoint(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer s3cret'}).status_code, 200)
+
+
+class OrderEventTests(APITestCase):
+    """ Order changes are pushed to subscribed streams, and reconnecting streams can resume. """
+
+    def setUp(self):
+        self.meal = Meal.objects.create(name='Jollof Rice', price=Decimal('12.50'), prep_time=15)
+        self.hub = events.EventHub(backlog_size=3)
+
+    def test_resume_returns_only_missed_events(self):
+        async def scenario():
+            first, _ = self.hub.subscribe()
+            self.hub.deliver({'event': events.ORDER_CREATED, 'data': {'id': 1}})
+            seen = await first.queue.get()
+            self.hub.deliver({'event': events.ORDER_STATUS_CHANGED, 'data': {'id': 1}})
+            self.hub.unsubscribe(first)
+
+            _, missed = self.hub.subscribe(seen['id'])
+            _, unknown = self.hub.subscribe('elsewhere:4')
+            return missed, unknown
+
+        missed, unknown = asyncio.run(scenario())
+        self.assertEqual([event['event'] for event in missed], [events.ORDER_STATUS_CHANGED])
+        self.assertEqual([event['event'] for event in unknown], [events.RESET])
+
+    def test_resume_past_the_backlog_resets(self):
+        async def scenario():
+            for i in range(5):
+                self.hub.deliver({'event': events.ORDER_CREATED, 'data': {'id': i}})
+            _, missed = self.hub.subscribe(f'{self.hub.hub_id}:1')
+            return missed
+
+        self.assertEqual([event['event'] for event in asyncio.run(scenario())], [events.RESET])
+
+    def test_checkout_and_status_updates_publish_after_commit(self):
+        published = []
+        with mock.patch.object(events.hub, 'publish_many', lambda event_type, items: published.extend((event_type, data) for data in items)):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/orders/checkout/', {
+                    'order': {'customer_name': 'Ama', 'items': [{'meal_id': self.meal.id, 'quantity': 1}]},
+                    'payment': {'method': 'cash'},
+                }, format='json')
+            order_id = response.data['order']['id']
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.patch(f'/api/orders/{order_id}/status/', {'status': 'ready'}, format='json')
+
+        self.assertEqual([event_type for event_type, _ in published], [events.ORDER_CREATED, events.ORDER_STATUS_CHANGED])
+        self.assertEqual(published[1][1]['status'], 'ready')
+
+    @override_settings(ORDER_EVENT_STREAM=True)
+    def test_stream_sends_missed_events_as_sse(self):
+        async def scenario():
+            client = AsyncClient()
+            events.hub.deliver({'event': events.ORDER_CREATED, 'data': {'id': 7}})
+            last_id = f'{events.hub.hub_id}:{events.hub.sequence - 1}'
+            response = await client.get('/api/orders/stream/', headers={'Last-Event-ID': last_id})
+            chunks = []
+            async for chunk in response.streaming_content:
+                chunks.append(chunk.decode() if isinstance(chunk, bytes) else chunk)
+                if len(chunks) == 2:
+                    break
+            return response, ''.join(chunks)
+
+        response, body = asyncio.run(scenario())
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertIn('event: order.created', body)
+        self.assertIn('data: {"id": 7}', body)
+
+    @override_settings(ORDER_EVENT_STREAM=False)
+    def test_stream_is_not_found_when_disabled(self):
+        response = asyncio.run(AsyncClient().get('/api/orders/stream/'))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(ORDER_CHANGES_VISIBILITY_LAG=0)
+class OrderChangesFeedTests(APITestCase):
+    """ The changes feed returns only orders written after the token. """
+
+    def setUp(self):
+        self.meal = Meal.objects.create(name='Jollof Rice', price=Decimal('12.50'), prep_time=15)
+        self.orders = [create_order(self.meal) for _ in range(3)]
+
+    def test_every_save_gets_a_higher_sequence(self):
+        first, second, third = self.orders
+        self.assertLess(first.change_seq, second.change_seq)
+        self.assertLess(second.change_seq, third.change_seq)
+
+        first.status = Order.STATUS_READY
+        first.save(update_fields=['status'])
+        first.refresh_from_db()
+        self.assertGreater(first.change_seq, third.change_seq)
+
+    def test_only_changes_after_the_token_are_returned(self):
+        initial = self.client.get('/api/orders/changes/').data
+        self.assertEqual(len(initial['changes']), 3)
+
+        self.assertEqual(self.client.get(f"/api/orders/changes/?since={initial['token']}").data['changes'], [])
+
+        self.client.patch(f'/api/orders/{self.orders[1].id}/status/', {'status': 'ready'}, format='json')
+        with self.assertNumQueries(3):
+            delta = self.client.get(f"/api/orders/changes/?since={initial['token']}").data
+        self.assertEqual([order['id'] for order in delta['changes']], [self.orders[1].id])
+        self.assertEqual(delta['changes'][0]['status'], 'ready')
+        self.assertGreater(int(delta['token']), int(initial['token']))
+
+    def test_the_order_list_gives_the_starting_token(self):
+        listed = self.client.get('/api/orders/').data
+        listed = listed.get('results', listed)
+        token = max(order['change_seq'] for order in listed)
+        self.assertEqual(self.client.get(f'/api/orders/changes/?since={token}').data['changes'], [])
+
+        create_order(self.meal)
+        self.assertEqual(len(self.client.get(f'/api/orders/changes/?since={token}').data['changes']), 1)
+
+    def test_large_backlogs_are_paged(self):
+        with mock.patch('orders.views.OrderChangesAPIView.max_changes', 2):
+            page = self.client.get('/api/orders/changes/').data
+            self.assertTrue(page['has_more'])
+            rest = self.client.get(f"/api/orders/changes/?since={page['token']}").data
+        self.assertFalse(rest['has_more'])
+        self.assertEqual(len(page['changes']) + len(rest['changes']), 3)
+
+    def test_recent_changes_wait_for_the_visibility_lag(self):
+        Order.objects.filter(pk=self.orders[0].pk).update(updated_at=timezone.now() - timezone.timedelta(minutes=1))
+        with self.settings(ORDER_CHANGES_VISIBILITY_LAG=30):
+            page = self.client.get('/api/orders/changes/').data
+        # The second order is too recent, so the third waits behind it too
+        self.assertEqual([order['id'] for order in page['changes']], [self.orders[0].id])
+        self.assertEqual(page['token'], str(self.orders[0].change_seq))
+        self.assertFalse(page['has_more'])
+
+
+class OrderStatusTransitionTests(APITestCase):
+    """ Status changes follow Order.TRANSITIONS and never overwrite a concurrent change. """
+
+    def setUp(self):
+        self.meal = Meal.objects.create(name='Jollof Rice', price=Decimal('12.50'), prep_time=15)
+        self.order = create_order(self.meal)
+
+    def patch(self, **data):
+        return self.client.patch(f'/api/orders/{self.order.id}/status/', data, format='json')
+
+    def test_allowed_changes_only_write_the_status(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.patch(status='in progress')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'in progress')
+        update = next(q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE "orders_order"'))
+        self.assertNotIn('total_amount', update)
+        self.assertIn('"orders_order"."status" = \'pending\'', update)
+
+        # Repeating a change is harmless
+        self.assertEqual(self.patch(status='in progress').status_code, 200)
+
+    def test_disallowed_changes_are_rejected(self):
+        response = self.patch(status='completed')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['current_status'], 'pending')
+        self.assertEqual(self.patch(status='eaten').status_code, 400)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, 'pending')
+
+    def test_stale_expected_status_is_a_conflict(self):
+        Order.objects.filter(pk=self.order.pk).update(status=Order.STATUS_CANCELLED)
+        response = self.patch(status='ready', expected_status='pending')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['current_status'], 'cancelled')
+
+    def test_concurrent_change_is_not_overwritten(self):
+        kitchen_view = Order.objects.get(pk=self.order.pk)
+        staff_view = Order.objects.get(pk=self.order.pk)
+        self.assertTrue(transitions.transition(kitchen_view, Order.STATUS_IN_PROGRESS))
+
+        with self.assertRaises(transitions.StatusConflict) as conflict:
+            transitions.transition(staff_view, Order.STATUS_CANCELLED)
+        self.assertEqual(conflict.exception.current_status, Order.STATUS_IN_PROGRESS)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, Order.STATUS_IN_PROGRESS)
+
+
+class OrderBulkStatusUpdateTests(APITestCase):
+    """ Batches of status changes are validated and written with one UPDATE per (current, target) status pair. """
+
+    def setUp(self):
+        self.meal = Meal.objects.create(name='Jollof Rice', price=Decimal('12.50'), prep_time=15)
+        self.orders = [create_order(self.meal, status=Order.STATUS_IN_PROGRESS) for _ in range(6)]
+        self.staff = User.objects.create_user(username='kitchen', password='pass12345', is_staff=True)
+        self.client.force_authenticate(self.staff)
+
+    def bump(self, updates):
+        return self.client.post('/api/orders/bulk-status/', {
+            'updates': [{'id': order_id, 'status': order_status} for order_id, order_status in updates],
+        }, format='json')
+
+    def test_only_staff_can_change_statuses_in_bulk(self):
+        self.client.force_authenticate(None)
+        self.assertIn(self.bump([(self.orders[0].id, 'ready')]).status_code, (401, 403))
+        self.client.force_authenticate(User.objects.create_user(username='diner', password='pass12345'))
+        self.assertEqual(self.bump([(self.orders[0].id, 'ready')]).status_code, 403)
+        self.assertEqual(Order.objects.get(pk=self.orders[0].pk).status, Order.STATUS_IN_PROGRESS)
+
+    def test_each_order_gets_its_own_result(self):
+        first, second, third = self.orders[:3]
+        Order.objects.filter(pk=third.pk).update(status=Order.STATUS_COMPLETED)
+        response = self.bump([
+            (first.id, 'ready'), (second.id, 'in progress'), (third.id, 'ready'), (999999, 'ready'),
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], {
+            str(first.id): 'updated', str(second.id): 'unchanged',
+            str(third.id): 'invalid_transition', '999999': 'not_found',
+        })
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(Order.objects.get(pk=third.pk).status, Order.STATUS_COMPLETED)
+
+    def test_query_count_depends_on_target_statuses_not_orders(self):
+        updates = [(order.id, 'ready') for order in self.orders[:3]] + [(order.id, 'cancelled') for order in self.orders[3:]]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.bump(updates)
+        self.assertEqual(response.data['updated'], 6)
+        order_updates = [q for q in queries.captured_queries if q['sql'].startswith('UPDATE "orders_order"')]
+        self.assertEqual(len(order_updates), 2)
+
+        # The changes feed sees every order once, each with its own sequence value
+        sequences = list(Order.objects.values_list('change_seq', flat=True))
+        self.assertEqual(len(set(sequences)), 6)
+        with mock.patch('orders.views.OrderChangesAPIView.max_changes', 4), self.settings(ORDER_CHANGES_VISIBILITY_LAG=0):
+            page = self.client.get('/api/orders/changes/').data
+            rest = self.client.get(f"/api/orders/changes/?since={page['token']}").data
+        self.assertEqual(len(page['changes']) + len(rest['changes']), 6)
+
+    def changed_meanwhile(self, order, new_status):
+        """ Patches the batch to see order moved to new_status after its statuses were read. """
+        reserve = ChangeSequence.reserve
+
+        def kitchen_moves_order(name, count):
+            Order.objects.filter(pk=order.pk).update(status=new_status)
+            return reserve(name, count)
+
+        return mock.patch.object(ChangeSequence, 'reserve', side_effect=kitchen_moves_order)
+
+    def test_orders_changed_meanwhile_are_conflicts(self):
+        first, second = self.orders[:2]
+        with self.changed_meanwhile(second, Order.STATUS_CANCELLED):
+            response = self.bump([(first.id, 'ready'), (second.id, 'ready')])
+
+        self.assertEqual(response.data['results'], {str(first.id): 'updated', str(second.id): 'conflict'})
+        self.assertEqual(Order.objects.get(pk=second.pk).status, Order.STATUS_CANCELLED)
+
+    def test_a_change_still_allowed_from_the_new_status_is_a_conflict_too(self):
+        first, second = self.orders[:2]
+        # 'ready' -> 'cancelled' is allowed, but the cancellation was decided on 'in progress'
+        with (
+            self.changed_meanwhile(second, Order.STATUS_READY),
+            mock.patch('orders.transitions.metrics.observe_transitions') as observe,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            response = self.bump([(first.id, 'cancelled'), (second.id, 'cancelled')])
+
+        self.assertEqual(response.data['results'], {str(first.id): 'updated', str(second.id): 'conflict'})
+        self.assertEqual(Order.objects.get(pk=second.pk).status, Order.STATUS_READY)
+        observe.assert_called_once_with(Counter({(Order.STATUS_IN_PROGRESS, Order.STATUS_CANCELLED): 1}))
+
+    def test_filter_and_target_status(self):
+        Order.objects.filter(pk=self.orders[0].pk).update(status=Order.STATUS_PENDING)
+        response = self.client.post('/api/orders/bulk-status/', {
+            'filter': {'status': 'in progress'}, 'status': 'ready',
+        }, format='json')
+        self.assertEqual(response.data['updated'], 5)
+        self.assertEqual(Order.objects.filter(status=Order.STATUS_READY).count(), 5)
+
+        with mock.patch('orders.views.OrderBulkStatusUpdateAPIView.max_orders', 2):
+            too_many = self.client.post('/api/orders/bulk-status/', {
+                'filter': {'status': 'ready'}, 'status': 'completed',
+            }, format='json')
+        self.assertEqual(too_many.status_code, 400)
+        self.assertEqual(self.client.post('/api/orders/bulk-status/', {'filter': {}, 'status': 'ready'},
+                                          format='json').status_code, 400)
+        self.assertEqual(self.bump([(self.orders[1].id, 'eaten')]).status_code, 400)
+        self.assertEqual(self.bump([(self.orders[1].id, 'ready'), (self.orders[1].id, 'cancelled')]).status_code, 400)
+
+    def test_events_are_published_in_one_batch_after_commit(self):
+        batches = []
+        with mock.patch.object(events.hub, 'publish_many', lambda event_type, items: batches.append((event_type, items))):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.bump([(order.id, 'ready') for order in self.orders[:4]])
+
+        self.assertEqual(len(batches), 1)
+        event_type, items = batches[0]
+        self.assertEqual(event_type, events.ORDER_STATUS_CHANGED)
+        self.assertEqual(sorted(item['id'] for item in items), sorted(order.id for order in self.orders[:4]))
+        self.assertTrue(all(item['status'] == 'ready' for item in items))
+
+
+class CheckoutIdempotencyTests(APITestCase):
+    """ Checkout retries with the same Idempotency-Key replay the first response. """
+
+    def setUp(self):
+        caches['default'].clear()
+        self.meal = Meal.objects.create(name='Jollof Rice', price=Decimal('12.50'), prep_time=15)
+        self.body = {
+            'order': {'customer_name': 'Ama', 'items': [{'meal_id': self.meal.id, 'quantity': 2}]},
+            'payment': {'method': 'cash'},
+        }
+
+    def checkout(self, key, body=None):
+        return self.client.post('/api/orders/checkout/', body or self.body, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_without_touching_order_tables(self):
+        first = self.checkout('retry-1')
+        self.assertEqual(first.status_code, 201)
+
+        with CaptureQueriesContext(connection) as ctx:
+            retry = self.checkout('retry-1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        # The same body; PostgreSQL's jsonb may store the keys in another order
+        self.assertEqual(json.loads(retry.content), json.loads(first.content))
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_key_reused_for_a_different_request_is_rejected(self):
+        self.checkout('retry-2')
+        other = {**self.body, 'order': {**self.body['order'], 'customer_name': 'Kofi'}}
+        self.assertEqual(self.checkout('retry-2', other).status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_server_errors_are_not_stored(self):
+        with mock.patch('orders.views.Payment.objects.create', side_effect=RuntimeError('db down')):
+            self.assertEqual(self.checkout('retry-3').status_code, 500)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.checkout('retry-3').status_code, 201)
+
+    def test_expired_keys_run_again_and_are_purged(self):
+        self.checkout('retry-4')
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timezone.timedelta(seconds=1))
+        self.assertNotIn('Idempotent-Replayed', self.checkout('retry-4'))
+        self.assertEqual(Order.objects.count(), 2)
+
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timezone.timedelta(seconds=1))
+        out = StringIO()
+        call_command('purge_idempotency_keys', stdout=out)
+        self.assertIn('Deleted 1', out.getvalue())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class AsyncCheckoutTests(APITestCase):
+    """ With "Prefer: respond-async" checkout commits the order and leaves payment start-up to a job. """
+
+    def setUp(self):
+        caches['default'].clear()
+        self.meal = Meal.objects.create(name='Jollof Rice', price=Decimal('12.50'), prep_time=15)
+
+    def checkout(self, method):
+        return self.client.post('/api/orders/checkout/', {
+            'order': {'customer_name': 'Ama', 'items': [{'meal_id': self.meal.id, 'quantity': 2}]},
+            'payment': {'method': method, 'phone': '0241234567', 'provider': 'MTN'},
+        }, format='json', HTTP_PREFER='respond-async')
+
+    def test_payment_is_started_by_the_worker(self):
+        response = self.checkout('momo')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'PROCESSING')
+        self.assertEqual(response['Location'], response.data['status_url'])
+        self.assertEqual(Job.objects.get().name, 'orders.initiate_checkout_payment')
+        self.assertEqual(self.client.get(response.data['status_url']).data['status'], 'PROCESSING')
+
+        published = []
+        with mock.patch.object(events.hub, 'publish_many', lambda event_type, items: published.extend(event_type for _ in items)):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(Worker().run_until_empty(), 1)
+
+        checkout_status = self.client.get(response.data['status_url']).data
+        self.assertEqual(checkout_status['status'], 'PENDING_PAYMENT_REDIRECT')
+        self.assertIn(Payment.objects.get().transaction_ref, checkout_status['payment_link'])
+        self.assertEqual(published, [events.ORDER_CREATED])
+
+    @override_settings(JOB_MAX_ATTEMPTS=1)
+    def test_a_failed_job_ends_the_checkout(self):
+        response = self.checkout('momo')
+        with mock.patch('orders.tasks.initiate_payment', side_effect=RuntimeError('gateway down')):
+            self.assertEqual(Worker().run_until_empty(), 1)
+        self.assertEqual(Job.objects.get().status, Job.STATUS_FAILED)
+
+        checkout_status = self.client.get(response.data['status_url']).data
+        self.assertEqual(checkout_status['status'], 'FAILED')
+        self.assertIn('error', checkout_status)
+
+    def test_cash_orders_are_complete_straight_away(self):
+        response = self.checkout('cash')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.client.get(response.data['status_url']).data['status'], 'COMPLETED')
+        self.assertEqual(Order.objects.get().total_amount, Decimal('25.00'))
+
+
+class MaintenanceCommandTests(APITestCase):
+    """ run_maintenance deletes old data in small batches and expires stale payments in bulk. """
+
+    def setUp(self):
+        self.meal = Meal.objects.create(name='Jollof Rice', price=Decimal('12.50'), prep_time=15)
+        self.old = [create_order(self.meal) for _ in range(5)]
+        self.recent = create_order(self.meal)
+        self.old_day = timezone.localdate() - timezone.timedelta(days=800)
+        Order.objects.filter(pk__in=[order.pk for order in self.old]).update(created_at=day_start(self.old_day))
+        self.stale = Payment.objects.create(order=self.recent, amount=Decimal('1.00'), method='momo', status='pending')
+        Payment.objects.filter(pk=self.stale.pk).update(created_at=timezone.now() - timezone.timedelta(days=2))
+
+    def maintain(self, *args):
+        out = StringIO()
+        call_command('run_maintenance', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_changes_nothing(self):
+        if connection.vendor == 'postgresql':
+            # Dry runs use the planner's estimates, which need fresh statistics to be exact on tiny tables
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        output = self.maintain('--dry-run')
+        self.assertIn('Would archive about 5 orders', output)
+        self.assertIn('with about 10 items', output)
+        self.assertIn('Would mark about 1 timed-out pending payments', output)
+        self.assertEqual(Order.objects.count(), 6)
+        self.assertEqual(Payment.objects.filter(status='pending').count(), 1)
+
+    def test_old_orders_are_archived_and_stale_payments_expired(self):
+        with tempfile.TemporaryDirectory() as location:
+            with self.settings(ORDER_ARCHIVE_STORAGE={
+                'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': location},
+            }):
+                output = self.maintain('--only', 'cleanup', 'payments', '--batch-size', '2')
+                archived = archive.read_partition(self.old_day)
+
+        self.assertIn('Archived 5 orders', output)
+        self.assertEqual(len(archived), 5)
+        self.assertEqual(list(Order.objects.values_list('pk', flat=True)), [self.recent.pk])
+        self.assertFalse(OrderItem.objects.exclude(order=self.recent).exists())
+        self.assertFalse(Payment.objects.exclude(order=self.recent).exists())
+        self.assertIn('Marked 1 pending payments as failed', output)
+        self.stale.refresh_from_db()
+        self.assertEqual(self.stale.status, 'failed')
+
+    def test_old_payments_are_deleted_in_batches_only_when_asked(self):
+        old_payments = [
+            Payment.objects.create(order=self.recent, amount=Decimal('1.00'), method='cash', status='completed')
+            for _ in range(3)
+        ]
+        Payment.objects.filter(pk__in=[payment.pk for payment in old_payments]).update(
+            created_at=timezone.now() - timezone.timedelta(days=400)
+        )
+        with tempfile.TemporaryDirectory() as location:
+            with self.settings(ORDER_ARCHIVE_STORAGE={
+                'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': location},
+            }):
+                self.maintain('--only', 'cleanup')
+                self.assertEqual(Payment.objects.filter(pk__in=[payment.pk for payment in old_payments]).count(), 3)
+
+                output = self.maintain('--only', 'cleanup', '--payment-retention-days', '365', '--batch-size', '2')
+        self.assertEqual(output.count('...deleted'), 2)
+        self.assertIn('Deleted 3 completed payments', output)
+        self.assertFalse(Payment.objects.filter(pk__in=[payment.pk for payment in old_payments]).exists())
+
+
+class FixOrderItemsCommandTests(APITestCase):
+    """ fix_order_items repairs items by ID range and can be resumed. """
+
+    def setUp(self):
+        self.meal = Meal.objects.create(name='Jollof Rice', price=Decimal('12.50'), prep_time=15)
+        self.order = Order.objects.create(total_amount=Decimal('50.00'))
+        OrderItem.objects.bulk_create(
+            [OrderItem(order=self.order, meal=self.meal) for _ in range(6)]
+            + [OrderItem(order=self.order, meal=None), OrderItem(order=self.order, meal=self.meal, item_name='Kept',
+                                                                  unit_price=Decimal('9.00'))]
+        )
+        self.items = list(OrderItem.objects.order_by('pk'))
+
+    def fixed(self):
+        return OrderItem.objects.filter(item_name='Jollof Rice', unit_price=Decimal('12.50')).count()
+
+    def test_dry_run_counts_without_changing_anything(self):
+        Order.objects.filter(pk=self.order.pk).update(tracking_code='temp-1')
+        out = StringIO()
+        call_command('fix_order_items', '--dry-run', stdout=out)
+        self.assertIn('Would update 6 OrderItem records', out.getvalue())
+        self.assertIn('Would fix 1 Orders', out.getvalue())
+        self.assertEqual(self.fixed(), 0)
+
+    def test_items_are_fixed_one_range_per_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            call_command('fix_order_items', '--batch-size', '3', stdout=StringIO())
+        self.assertEqual(self.fixed(), 6)
+        self.assertEqual(OrderItem.objects.get(item_name='Kept').unit_price, Decimal('9.00'))
+        self.assertEqual(OrderItem.objects.get(meal=None).item_name, 'Unknown Item')
+        item_updates = [q for q in queries.captured_queries if q['sql'].startswith('UPDATE "orders_orderitem"')]
+        self.assertLessEqual(len(item_updates), 3)
+
+    def test_resume_after_an_item(self):
+        out = StringIO()
+        call_command('fix_order_items', '--after', str(self.items[2].pk), stdout=out)
+        self.assertEqual(self.fixed(), 3)
+        self.assertIn(f'resume with --after {self.items[-1].pk}', out.getvalue())
+
+    def test_temporary_tracking_codes_are_replaced(self):
+        Order.objects.filter(pk=self.order.pk).update(tracking_code='temp-1')
+        before = Order.objects.get(pk=self.order.pk).change_seq
+        call_command('fix_order_items', stdout=StringIO())
+        order = Order.objects.get(pk=self.order.pk)
+        self.assertEqual(order.tracking_code, tracking_code_for(order.pk))
+        self.assertGreater(order.change_seq, before)
+
+
+class SeedBenchmarkDataCommandTests(APITestCase):
+    """ seed_benchmark_data writes realistic orders in bulk, and can clear them again. """
+
+    def seed(self, *args):
+        call_command('seed_benchmark_data', '--meals', '5', '--orders', '30', '--batch-size', '10', *args,
+                     stdout=StringIO())
+
+    def test_orders_are_complete_and_trackable(self):
+        self.seed('--pending', '0.5')
+        self.assertEqual(Meal.objects.count(), 5)
+        self.assertEqual(Order.objects.count(), 30)
+        self.assertFalse(Order.objects.filter(items__isnull=True).exists())
+        for order in Order.objects.all():
+            self.assertEqual(order.tracking_code, tracking_code_for(order.pk))
+        self.assertEqual(len(set(Order.objects.values_list('change_seq', flat=True))), 30)
+
+        pending = Order.objects.filter(status=Order.STATUS_PENDING)
+        self.assertTrue(pending.exists())
+        self.assertEqual(
+            Payment.objects.filter(transaction_ref__startswith='BENCH-', status=Payment.STATUS_PENDING).count(),
+            pending.count(),
+        )
+        self.assertTrue(SalesRollupDay.objects.exists())
+
+        order = pending.first()
+        response = self.client.get(
+            f'/api/payments/mock-verify/?tx_ref=BENCH-{order.pk}&order_id={order.pk}&status=successful'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_clear_replaces_earlier_seeded_data(self):
+        create_order(Meal.objects.create(name='Jollof Rice', price=Decimal('12.50'), prep_time=15))
+        self.seed()
+        self.seed('--clear')
+        self.assertEqual(Order.objects.count(), 31)
+        self.assertEqual(Meal.objects.count(), 6)
+
+
+class OrderArchiveTests(APITestCase):
+    """ Old orders are moved to compressed daily files, verified, deleted and still readable. """
+
+    def setUp(self):
+        self.location = tempfile.TemporaryDirectory()
+        self.addCleanup(self.location.cleanup)
+        storage = override_settings(ORDER_ARCHIVE_STORAGE={
+            'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': self.location.name},
+        })
+        storage.enable()
+        self.addCleanup(storage.disable)
+
+        self.meal = Meal.objects.create(name='Jollof Rice', price=Decimal('12.50'), prep_time=15)
+        self.days = [timezone.localdate() - timezone.timedelta(days=days_ago) for days_ago in (900, 800)]
+        self.orders = []
+        for day in self.days:
+            for _ in range(3):
+                order = create_order(self.meal)
+                Order.objects.filter(pk=order.pk).update(created_at=day_start(day) + timezone.timedelta(hours=12))
+                self.orders.append(order)
+        self.recent = create_order(self.meal)
+
+    def archive(self, *args):
+        out = StringIO()
+        call_command('archive_orders', '--format', 'jsonl', '--chunk-size', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_lists_days_without_archiving(self):
+        output = self.archive('--dry-run')
+        self.assertIn(f'{self.days[0]}: 3 orders', output)
+        self.assertIn('Would archive 6 orders', output)
+        self.assertEqual(Order.objects.count(), 7)
+
+    def test_orders_are_archived_by_day_and_readable(self):
+        output = self.archive()
+        self.assertIn('Archived 6 orders', output)
+        self.assertEqual(list(Order.objects.values_list('pk', flat=True)), [self.recent.pk])
+        self.assertEqual(len(archive.partition_files(self.days[0])), 1)
+
+        admin = User.objects.create_user(username='auditor', password='pass12345', is_staff=True)
+        self.client.force_authenticate(admin)
+        response = self.client.get(f'/api/orders/archive/?date={self.days[1]}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([order['id'] for order in response.data['results']], [order.id for order in self.orders[3:]])
+        first = response.data['results'][0]
+        self.assertEqual(first['total_amount'], '37.50')
+        self.assertEqual([item['quantity'] for item in first['items']], [1, 2])
+        self.assertEqual(first['payments'][0]['status'], 'completed')
+
+        code = self.orders[4].tracking_code
+        response = self.client.get(f'/api/orders/archive/?date={self.days[1]}&tracking_code={code}')
+        self.assertEqual([order['tracking_code'] for order in response.data['results']], [code])
+        self.assertEqual(self.client.get('/api/orders/archive/?date=yesterday').status_code, 400)
+
+    def test_nothing_is_deleted_when_the_file_does_not_verify(self):
+        with mock.patch('orders.archive._read_file', return_value=[]):
+            with self.assertRaises(CommandError):
+                self.archive()
+        self.assertEqual(Order.objects.count(), 7)
+        self.assertEqual(archive.partition_files(self.days[0]), [])
+
+    def test_archive_needs_staff(self):
+        self.assertIn(self.client.get(f'/api/orders/archive/?date={self.days[0]}').status_code, (401, 403))
+
+    def test_rollups_of_archived_days_are_kept(self):
+        for day in self.days:
+            rollups.refresh_day(day)
+        self.archive()
+
+        out = StringIO()
+        call_command('check_sales_rollups', '--fix', '--start', str(self.days[0]), '--end', str(self.days[1]), stdout=out)
+        self.assertIn('Rollups match', out.getvalue())
+        self.assertEqual(rollups.rebuild(self.days[0], self.days[0]), [])
+        self.assertEqual(list(SalesRollupDay.objects.order_by('day').values_list('order_count', flat=True)), [3, 3])
+
+
+class OrderExportTests(APITestCase):
+    """ Staff can stream every order as CSV or JSONL, optionally gzipped, with a fixed number of queries. """
+
+    def setUp(self):
+        self.meal = Meal.objects.create(name='Jollof Rice', price=Decimal('12.50'), prep_time=15)
+        self.orders = [create_order(self.meal, status=Order.STATUS_COMPLETED) for _ in range(3)]
+        self.pending = create_order(self.meal)
+        self.admin = User.objects.create_user(username='finance', password='pass12345', is_staff=True)
+        self.client.force_authenticate(self.admin)
+
+    def download(self, query=''):
+        response = self.client.get(f'/api/orders/export/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_has_a_row_per_item_with_the_latest_payment(self):
+        response, content = self.download('?status=completed')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('attachment; filename="orders-', response['Content-Disposition'])
+
+        rows = list(csv.DictReader(io.StringIO(content.decode())))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual({row['id'] for row in rows}, {str(order.id) for order in self.orders})
+        self.assertEqual([row['item_quantity'] for row in rows[:2]], ['1', '2'])
+        self.assertEqual(rows[0]['payment_method'], 'cash')
+
+    def test_csv_cells_cannot_inject_formulas(self):
+        Order.objects.filter(pk=self.orders[0].pk).update(
+            customer_name='=HYPERLINK("http://evil.example","x")', delivery_address='@SUM(A1)',
+        )
+        _, content = self.download('?status=completed')
+        row = next(row for row in csv.DictReader(io.StringIO(content.decode())) if row['id'] == str(self.orders[0].id))
+        self.assertEqual(row['customer_name'], '\'=HYPERLINK("http://evil.example","x")')
+        self.assertEqual(row['delivery_address'], "'@SUM(A1)")
+
+        _, content = self.download('?status=completed&output=jsonl')
+        self.assertIn('"=HYPERLINK', content.decode())
+
+    def test_jsonl_nests_items_and_payments_and_can_be_gzipped(self):
+        response, content = self.download('?output=jsonl&gzip=1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertTrue(response['Content-Disposition'].endswith('.jsonl.gz"'))
+
+        records = [json.loads(line) for line in gzip.decompress(content).splitlines()]
+        self.assertEqual([record['id'] for record in records], [order.id for order in self.orders + [self.pending]])
+        self.assertEqual(len(records[0]['items']), 2)
+        self.assertEqual(records[0]['payments'][0]['amount'], '37.50')
+
+    def test_asgi_requests_get_an_async_body(self):
+        request = AsyncRequestFactory().get('/api/orders/export/?output=jsonl')
+        force_authenticate(request, self.admin)
+        response = OrderExportAPIView.as_view()(request)
+        self.assertTrue(response.is_async)
+
+        async def read():
+            return b''.join([chunk async for chunk in response.streaming_content])
+
+        _, expected = self.download('?output=jsonl')
+        self.assertEqual(async_to_sync(read)(), expected)
+
+    def test_query_count_does_not_grow_with_the_export(self):
+        def count_queries():
+            with CaptureQueriesContext(connection) as ctx:
+                self.download('?output=jsonl')
+            return len(ctx.captured_queries)
+
+        before = count_queries()
+        for _ in range(5):
+            create_order(self.meal)
+        self.assertEqual(count_queries(), before)
+
+    def test_export_is_staff_only_and_validates_filters(self):
+        self.assertEqual(self.client.get('/api/orders/export/?output=xml').status_code, 400)
+        self.assertEqual(self.client.get('/api/orders/export/?status=lost').status_code, 400)
+        self.client.force_authenticate(None)
+        self.assertIn(self.client.get('/api/orders/export/').status_code, (401, 403))
+
+    def test_command_writes_a_gzipped_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/orders.csv.gz'
+            call_command('export_orders', '--output', path, '--gzip', '--status', 'pending', stdout=StringIO())
+            with gzip.open(path, 'rt') as exported:
+                rows = list(csv.DictReader(exported))
+        self.assertEqual({row['id'] for row in rows}, {str(self.pending.id)})
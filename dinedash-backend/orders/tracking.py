@@ -0,0 +1,78 @@
+"""
+Tracking code generation.
+
+A tracking code is derived from the order's primary key, so it is unique by
+construction and never needs an existence query:
+
+    pk -> 34-bit Feistel permutation -> 7 base-32 characters -> check character
+
+The Feistel step makes consecutive orders get unrelated-looking codes, so
+customers cannot guess each other's codes by counting. The alphabet leaves
+out 0/O and 1/I, and the Luhn mod N check character catches typos before we
+hit the database. 32^7 codes cover tens of billions of orders.
+
+TRACKING_CODE_KEY must never change once codes have been issued, or new
+codes could collide with old ones (the unique index would then reject them).
+"""
+import hashlib
+
+from django.conf import settings
+
+PREFIX = 'ORD'
+ALPHABET = '23456789ABCDEFGHJKLMNPQRSTUVWXYZ'
+BODY_LENGTH = 7
+CODE_LENGTH = len(PREFIX) + BODY_LENGTH + 1
+
+HALF_BITS = 17
+HALF_MASK = (1 << HALF_BITS) - 1
+MAX_ID = (1 << (2 * HALF_BITS)) - 1
+ROUNDS = 4
+
+
+def _round(key, round_number, value):
+    digest = hashlib.blake2b(f'{round_number}:{value}'.encode(), key=key, digest_size=8).digest()
+    return int.from_bytes(digest, 'big') & HALF_MASK
+
+
+def _permute(number):
+    key = settings.TRACKING_CODE_KEY.encode()[:64]
+    left, right = number >> HALF_BITS, number & HALF_MASK
+    for round_number in range(ROUNDS):
+        left, right = right, left ^ _round(key, round_number, right)
+    return (left << HALF_BITS) | right
+
+
+def _check_character(body):
+    """ Luhn mod N over the code alphabet. """
+    base = len(ALPHABET)
+    total = 0
+    factor = 2
+    for char in reversed(body):
+        addend = factor * ALPHABET.index(char)
+        total += addend // base + addend % base
+        factor = 1 if factor == 2 else 2
+    return ALPHABET[(base - total % base) % base]
+
+
+def tracking_code_for(pk):
+    """ The tracking code for an order's primary key. """
+    if not 0 < pk <= MAX_ID:
+        raise ValueError(f"Order id {pk} is outside the tracking code range.")
+    number = _permute(pk)
+    body = ''
+    for _ in range(BODY_LENGTH):
+        number, remainder = divmod(number, len(ALPHABET))
+        body = ALPHABET[remainder] + body
+    return f'{PREFIX}{body}{_check_character(body)}'
+
+
+def has_valid_check_character(code):
+    """ False for codes in the current format whose check character is wrong.
+
+        Codes issued before this format (e.g. ORD12345) are always accepted. """
+    if len(code) != CODE_LENGTH or not code.startswith(PREFIX):
+        return True
+    body, check = code[len(PREFIX):-1], code[-1]
+    if any(char not in ALPHABET for char in body):
+        return False
+    return _check_character(body) == check
@@ -0,0 +1,165 @@
+"""
+Order status changes, checked against ``Order.TRANSITIONS``.
+
+Every change is a conditional UPDATE that only touches the status columns:
+
+    UPDATE orders_order SET status = 'ready', updated_at = ..., change_seq = ...
+     WHERE id = 12 AND status = 'in progress'
+
+so two people changing the same order at once can't silently overwrite
+each other: the second write matches no row and gets a StatusConflict,
+without either of them holding a row lock while they decide.
+
+A batch of changes is applied with one UPDATE per (status read, target
+status) pair, on the same condition:
+
+    UPDATE orders_order SET status = 'ready', ...
+     WHERE id IN (...) AND status = 'in progress'
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+
+from dinedash import metrics
+from . import events, rollups
+from .models import CHANGE_SEQUENCE, ChangeSequence, Order
+
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+NOT_FOUND = 'not_found'
+INVALID_TRANSITION = 'invalid_transition'
+CONFLICT = 'conflict'
+
+
+class InvalidTransition(Exception):
+    """ Order.TRANSITIONS does not allow the change. """
+
+    def __init__(self, from_status, to_status):
+        self.from_status = from_status
+        self.to_status = to_status
+        super().__init__(f"An order can't go from '{from_status}' to '{to_status}'.")
+
+
+class StatusConflict(Exception):
+    """ The order's status is not the one the change was based on. """
+
+    def __init__(self, expected_status, current_status):
+        self.expected_status = expected_status
+        self.current_status = current_status
+        super().__init__(f"The order is now '{current_status}', not '{expected_status}'.")
+
+
+@transaction.atomic
+def transition(order, to_status, expected_status=None):
+    """
+    Moves one order to a new status if it is still in the status it was read with.
+
+    Args:
+        order: The order, as read by the caller
+        to_status: Target status
+        expected_status: The status the caller based the change on (defaults to order.status)
+
+    Returns:
+        True if the order changed, False if it was already in to_status
+
+    Raises:
+        InvalidTransition: Order.TRANSITIONS does not allow the change
+        StatusConflict: The order is no longer in expected_status
+
+    On success the order instance is updated, its day's rollup is refreshed,
+    and a status change event is published and counted after commit.
+    """
+    expected_status = expected_status or order.status
+    if order.status != expected_status:
+        raise StatusConflict(expected_status, order.status)
+    if to_status == expected_status:
+        return False
+    if not Order.can_transition(expected_status, to_status):
+        raise InvalidTransition(expected_status, to_status)
+
+    change_seq = ChangeSequence.next_value(CHANGE_SEQUENCE)
+    now = timezone.now()
+    updated = Order.objects.filter(pk=order.pk, status=expected_status).update(
+        status=to_status, updated_at=now, change_seq=change_seq,
+    )
+    if not updated:
+        current_status = Order.objects.filter(pk=order.pk).values_list('status', flat=True).first()
+        raise StatusConflict(expected_status, current_status)
+
+    order.status, order.updated_at, order.change_seq = to_status, now, change_seq
+    rollups.schedule_refresh(order)
+    events.publish_order_event(order, events.ORDER_STATUS_CHANGED)
+    transaction.on_commit(lambda: metrics.observe_transitions({(expected_status, to_status): 1}))
+    return True
+
+
+@transaction.atomic
+def apply_status_updates(updates):
+    """
+    Moves many orders to new statuses.
+
+    Args:
+        updates: Dict of order id -> target status (valid Order statuses)
+
+    Returns:
+        Dict of order id -> UPDATED, UNCHANGED (already in that status),
+        NOT_FOUND, INVALID_TRANSITION or CONFLICT (changed by someone else meanwhile)
+
+    Updated orders get new change_seq values for the changes feed, their
+    past days' rollups are refreshed, and one batch of status change events
+    is published (and the changes counted) after the transaction commits.
+    """
+    current = {
+        pk: (order_status, created_at)
+        for pk, order_status, created_at in Order.objects.filter(pk__in=updates).values_list(
+            'pk', 'status', 'created_at',
+        )
+    }
+
+    results = {}
+    # Grouped by the status each order was read in, which its UPDATE checks is unchanged
+    by_change = {}
+    for pk, target in updates.items():
+        if pk not in current:
+            results[pk] = NOT_FOUND
+        elif current[pk][0] == target:
+            results[pk] = UNCHANGED
+        elif not Order.can_transition(current[pk][0], target):
+            results[pk] = INVALID_TRANSITION
+        else:
+            by_change.setdefault((current[pk][0], target), []).append(pk)
+
+    pending = sum(len(ids) for ids in by_change.values())
+    if not pending:
+        return results
+
+    # Every changed order needs its own change_seq so the feed can page through them
+    sequence = iter(ChangeSequence.reserve(CHANGE_SEQUENCE, pending))
+    now = timezone.now()
+    updated = []
+    for (expected_status, target), ids in by_change.items():
+        stamps = {pk: next(sequence) for pk in ids}
+        count = Order.objects.filter(pk__in=ids, status=expected_status).update(
+            status=target,
+            updated_at=now,
+            change_seq=Case(*[When(pk=pk, then=Value(stamp)) for pk, stamp in stamps.items()]),
+        )
+        if count == len(ids):
+            written = ids
+        else:
+            # Only read back which ones were written when some were not
+            written = [
+                pk for pk, change_seq in Order.objects.filter(pk__in=ids).values_list('pk', 'change_seq')
+                if change_seq == stamps[pk]
+            ]
+        results.update({pk: CONFLICT for pk in ids})
+        results.update({pk: UPDATED for pk in written})
+        updated.extend(written)
+
+    rollups.schedule_refresh_days(current[pk][1] for pk in updated)
+    events.publish_order_events(updated, events.ORDER_STATUS_CHANGED)
+    counts = Counter((current[pk][0], updates[pk]) for pk in updated)
+    transaction.on_commit(lambda: metrics.observe_transitions(counts))
+    return results
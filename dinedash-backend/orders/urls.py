@@ -1,16 +1,31 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
     OrderCreateAPIView,
     OrderListAPIView,
     OrderRetrieveAPIView,
+    OrderRetrieveAsyncView,
     CheckoutAPIView,
+    CheckoutStatusAPIView,
     StaffOrderRetrieveAPIView,
     OrderStatusUpdateAPIView,
+    OrderBulkStatusUpdateAPIView,
     AnalyticsAPIView,
+    AnalyticsAsyncView,
+    ArchivedOrderListAPIView,
+    OrderExportAPIView,
+    OrderEventStreamView,
+    OrderChangesAPIView,
 )
 
 app_name = "orders"  
 
+# Native async versions of the busiest read views, for the ASGI deployment (see dinedash.async_views)
+if settings.ASYNC_READ_VIEWS:
+    OrderRetrieveView, AnalyticsView = OrderRetrieveAsyncView.as_view(), AnalyticsAsyncView.as_view()
+else:
+    OrderRetrieveView, AnalyticsView = OrderRetrieveAPIView.as_view(), AnalyticsAPIView.as_view()
+
 urlpatterns = [
     # List all orders (staff only)
     path('', OrderListAPIView.as_view(), name='order-list'),
@@ -21,15 +36,33 @@ urlpatterns = [
     # Checkout endpoint (must be before tracking_code to avoid conflict)
     path('checkout/', CheckoutAPIView.as_view(), name='checkout'),
 
+    # Progress of an asynchronous checkout (must be before tracking_code to avoid conflict)
+    path('checkout/<str:tracking_code>/', CheckoutStatusAPIView.as_view(), name='checkout-status'),
+
+    # Live order events for dashboards (must be before tracking_code to avoid conflict)
+    path('stream/', OrderEventStreamView.as_view(), name='order-stream'),
+
+    # Orders changed since a token, for clients that can't hold a stream open
+    path('changes/', OrderChangesAPIView.as_view(), name='order-changes'),
+
+    # Streaming CSV/JSONL export for finance, staff only (must be before tracking_code to avoid conflict)
+    path('export/', OrderExportAPIView.as_view(), name='order-export'),
+
+    # Archived (cold storage) orders by day, staff only (must be before tracking_code to avoid conflict)
+    path('archive/', ArchivedOrderListAPIView.as_view(), name='order-archive'),
+
     # Analytics endpoint (must be before tracking_code to avoid conflict)
-    path('analytics/', AnalyticsAPIView.as_view(), name='analytics'),
+    path('analytics/', AnalyticsView, name='analytics'),
 
     # Staff retrieve by internal DB ID (must be before tracking_code to avoid conflict)
     path('staff/<int:pk>/', StaffOrderRetrieveAPIView.as_view(), name='staff-order-detail'),
 
+    # Update the status of many orders in one request (must be before tracking_code to avoid conflict)
+    path('bulk-status/', OrderBulkStatusUpdateAPIView.as_view(), name='order-bulk-status-update'),
+
     # Update order status by internal ID (must be before tracking_code to avoid conflict)
     path('<int:id>/status/', OrderStatusUpdateAPIView.as_view(), name='order-status-update'),
 
     # Retrieve a single order by tracking code (customers/guests) - this must be last
-    path('<str:tracking_code>/', OrderRetrieveAPIView.as_view(), name='order-detail'),
+    path('<str:tracking_code>/', OrderRetrieveView, name='order-detail'),
 ]
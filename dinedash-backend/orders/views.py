@@ -1,13 +1,32 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.db import transaction
+from django.db.models import Max, aprefetch_related_objects, prefetch_related_objects
+from django.http import StreamingHttpResponse
+from django.views import View
+import asyncio
 import logging
 import json
+from datetime import timedelta
 from decimal import Decimal
-from rest_framework import status, permissions, generics, parsers
+from rest_framework import status, permissions, generics, parsers, exceptions
 from rest_framework.views import APIView
 from rest_framework.response import Response
-import uuid
-
-from .models import Order, OrderItem
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.urls import reverse
+
+from dinedash import exports, metrics
+from dinedash.async_views import AsyncReadView, json_response
+from dinedash.instrumentation import timed_section
+from dinedash.pagination import KeysetPagination
+from dinedash.utils import conditional_response, filter_by_params, make_etag, set_validators
+from jobs.queue import enqueue
+from . import analytics, archive, events, rollups, tasks, transitions
+from . import exports as order_exports
+from .idempotency import idempotent
+from .models import Order, OrderItem, read_prefetches
+from .tracking import has_valid_check_character
 from .serializers import (
     OrderSerializer,
     OrderCreateSerializer,
@@ -26,6 +45,21 @@ class CheckoutAPIView(APIView):
     parser_classes = [parsers.JSONParser]  # We only accept JSON data
     throttle_scope = 'checkout'
 
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        metrics.observe_checkout(self.payment_method(request), response)
+        return response
+
+    @staticmethod
+    def payment_method(request):
+        """ The payment method a checkout asked for, or 'unknown' (for the checkout metrics). """
+        try:
+            method = (request.data.get('payment') or {}).get('method', 'cash')
+            return method if method in dict(Payment.PAYMENT_METHOD_CHOICES) else 'unknown'
+        except (AttributeError, TypeError, exceptions.ParseError):
+            return 'unknown'
+
+    @idempotent
     def post(self, request, *args, **kwargs):
         # Handle cases where the data might not be parsed automatically
         if not request.data and request.body:
@@ -48,7 +82,9 @@ class CheckoutAPIView(APIView):
         logger.info(f"Processing checkout request - Payment data keys: {list(payment_data.keys()) if payment_data else 'None'}")
 
         order_serializer = OrderCreateSerializer(data=order_data)
-        if not order_serializer.is_valid():
+        with timed_section('serializer'):
+            order_valid = order_serializer.is_valid()
+        if not order_valid:
             logger.warning(f"Order validation failed: {order_serializer.errors}")
             return Response(
                 {"error": "Order validation failed", "details": order_serializer.errors},
@@ -56,7 +92,9 @@ class CheckoutAPIView(APIView):
             )
 
         payment_serializer = CheckoutPaymentSerializer(data=payment_data)
-        if not payment_serializer.is_valid():
+        with timed_section('serializer'):
+            payment_valid = payment_serializer.is_valid()
+        if not payment_valid:
             logger.warning(f"Payment validation failed: {payment_serializer.errors}")
             return Response(
                 {"error": "Payment validation failed", "details": payment_serializer.errors},
@@ -64,6 +102,9 @@ class CheckoutAPIView(APIView):
             )
         payment_validated_data = payment_serializer.validated_data
 
+        if 'respond-async' in request.headers.get('Prefer', ''):
+            return self.checkout_async(order_serializer, payment_validated_data)
+
         payment = None
 
         try:
@@ -92,29 +133,19 @@ class CheckoutAPIView(APIView):
                     order.status = 'pending'
                     order.save()
 
-                if payment_method != 'cash':
-                    tx_ref = f"MOCK-PAY-{order.id}-{uuid.uuid4().hex[:6]}"
-                    payment.transaction_ref = tx_ref
-
-                    # Simulate some payments failing for testing
-                    if "fail" not in tx_ref.lower():
-                        payment.status = 'pending'
-                    else:
-                        payment.status = 'failed'
+                rollups.schedule_refresh(order)
+                events.publish_order_event(order, events.ORDER_CREATED)
 
-                    payment.save()
+                if payment_method != 'cash':
+                    tasks.initiate_payment(payment)
 
                     if payment.status == 'pending':
-                        mock_link = (
-                            f"/api/payments/mock-verify/?tx_ref={payment.transaction_ref}"
-                            f"&order_id={order.id}&status=successful"
-                        )
                         return Response(
                             {
                                 "order_id": order.id,
                                 "tracking_code": order.tracking_code,
                                 "status": "PENDING_PAYMENT_REDIRECT",
-                                "payment_link": mock_link,
+                                "payment_link": tasks.payment_link(payment),
                             },
                             status=status.HTTP_202_ACCEPTED,
                         )
@@ -126,9 +157,11 @@ class CheckoutAPIView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
+        with timed_section('serializer'):
+            serialized_order = OrderSerializer(order).data
         return Response(
             {
-                "order": OrderSerializer(order).data,
+                "order": serialized_order,
                 "payment": {
                     "id": payment.id,
                     "method": payment.method,
@@ -141,6 +174,79 @@ class CheckoutAPIView(APIView):
         )
 
 
+    def checkout_async(self, order_serializer, payment_data):
+        """ Asynchronous checkout, asked for with "Prefer: respond-async".
+
+            Only the order, its items and a payment record are written while the
+            client waits; starting the payment and the post-commit work run in a
+            background job. The client then polls the returned status_url (or
+            listens on the order stream) for the outcome. """
+        try:
+            with transaction.atomic():
+                order = order_serializer.save()
+                payment_method = payment_data.get('method', 'cash')
+                payment = Payment.objects.create(
+                    order=order,
+                    amount=Decimal(order.total_amount) + Decimal(order.delivery_fee),
+                    status=Payment.STATUS_COMPLETED if payment_method == 'cash' else Payment.STATUS_PENDING,
+                    **payment_data,
+                )
+                enqueue('orders.initiate_checkout_payment', payment_id=payment.id)
+        except Exception as e:
+            logger.error(f"Checkout failed: {str(e)}")
+            return Response(
+                {"error": "Checkout failed. Please try again."},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+        status_url = reverse('orders:checkout-status', kwargs={'tracking_code': order.tracking_code})
+        return Response(
+            {
+                "order_id": order.id,
+                "tracking_code": order.tracking_code,
+                "status": "PROCESSING",
+                "status_url": status_url,
+            },
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': status_url, 'Preference-Applied': 'respond-async'},
+        )
+
+
+class CheckoutStatusAPIView(APIView):
+    """Reports how an (asynchronous) checkout is going, looked up by tracking code.
+
+    status is one of PROCESSING, PENDING_PAYMENT_REDIRECT (with payment_link),
+    PAYMENT_FAILED, COMPLETED, or FAILED (with error) when the background job
+    that starts the payment gave up.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, tracking_code, *args, **kwargs):
+        if not has_valid_check_character(tracking_code):
+            return Response({"error": "Order not found."}, status=status.HTTP_404_NOT_FOUND)
+        order = Order.objects.filter(tracking_code=tracking_code).first()
+        if order is None or order.latest_payment is None:
+            return Response({"error": "Order not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        payment = order.latest_payment
+        body = {"order_id": order.id, "tracking_code": order.tracking_code, "order_status": order.status}
+        if payment.status == Payment.STATUS_FAILED:
+            body["status"] = "PAYMENT_FAILED"
+        elif payment.status == Payment.STATUS_COMPLETED:
+            body["status"] = "COMPLETED"
+        elif not payment.transaction_ref:
+            if tasks.checkout_job_failed(payment):
+                # The job ran out of retries: nothing more will happen, so stop the client polling
+                body["status"] = "FAILED"
+                body["error"] = "We couldn't start your payment. Please try again."
+            else:
+                body["status"] = "PROCESSING"
+        else:
+            body["status"] = "PENDING_PAYMENT_REDIRECT"
+            body["payment_link"] = tasks.payment_link(payment)
+        return Response(body, status=status.HTTP_200_OK)
+
+
 class OrderCreateAPIView(APIView):
     """Allows authenticated users to place new orders."""
     permission_classes = [permissions.IsAuthenticated]
@@ -152,6 +258,7 @@ class OrderCreateAPIView(APIView):
         try:
             with transaction.atomic():
                 order = serializer.save()
+                events.publish_order_event(order, events.ORDER_CREATED)
                 return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
         except Exception as e:
             logger.error(f"Order creation failed: {str(e)}")
@@ -162,10 +269,21 @@ class OrderCreateAPIView(APIView):
 
 
 class OrderListAPIView(generics.ListAPIView):
-    """Shows a list of all orders in the system."""
-    queryset = Order.objects.all()
+    """Shows a list of all orders in the system, newest first.
+
+    Pages with keyset cursors (?cursor=...), or page numbers with ?page=N.
+    Filter with ?status=, ?order_type=, ?start_date= and ?end_date= (YYYY-MM-DD).
+    """
+    queryset = Order.objects.for_read()
     serializer_class = OrderSerializer
     permission_classes = [permissions.AllowAny]
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        return filter_by_params(super().get_queryset(), self.request.query_params, {
+            'status': [choice[0] for choice in Order.STATUS_CHOICES],
+            'order_type': [choice[0] for choice in Order.ORDER_TYPE_CHOICES],
+        })
 
     def get_authenticators(self):
         if self.request.method in permissions.SAFE_METHODS:
@@ -178,37 +296,169 @@ class OrderListAPIView(generics.ListAPIView):
         return super().get_permissions()
 
     def list(self, request, *args, **kwargs):
-        response = super().list(request, *args, **kwargs)
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        with timed_section('serializer'):
+            data = self.get_serializer(page, many=True).data
+        return self.get_paginated_response(data)
+
+
+class OrderChangesAPIView(APIView):
+    """Returns the orders created or changed since a token, plus the token to use next time.
+
+    GET /api/orders/changes/?since=<token> costs O(changes) instead of re-reading
+    every order. Start without a token to get everything; when has_more is true,
+    call again straight away with the returned token.
+
+    Changes younger than settings.ORDER_CHANGES_VISIBILITY_LAG are held back, so
+    a write that commits after a later-numbered one is not skipped by the token.
+    """
+    permission_classes = [permissions.AllowAny]
+    max_changes = 200
+
+    def get(self, request, *args, **kwargs):
+        since = request.query_params.get('since') or '0'
+        if not since.isdigit():
+            return Response({"error": "Invalid 'since' token."}, status=status.HTTP_400_BAD_REQUEST)
+
+        changed = list(
+            Order.objects.for_read()
+            .filter(change_seq__gt=int(since))
+            .order_by('change_seq')[:self.max_changes + 1]
+        )
+        has_more = len(changed) > self.max_changes
+        changed = changed[:self.max_changes]
+
+        # Stop at the first change that is too recent; anything numbered after it waits with it
+        visible_before = timezone.now() - timedelta(seconds=settings.ORDER_CHANGES_VISIBILITY_LAG)
+        for position, order in enumerate(changed):
+            if order.updated_at > visible_before:
+                changed, has_more = changed[:position], False
+                break
+
+        return Response({
+            "changes": OrderSerializer(changed, many=True).data,
+            "token": str(changed[-1].change_seq) if changed else since,
+            "has_more": has_more,
+        }, status=status.HTTP_200_OK)
+
+
+class OrderEventStreamView(View):
+    """Pushes order create and status change events to dashboards as Server-Sent Events.
+
+    Reconnecting clients send the last event id they saw (Last-Event-ID header,
+    or ?last_event_id=) and only receive what they missed. Streams are held open
+    on the event loop, so this needs the ASGI app (dinedash/asgi.py): it answers 404
+    unless settings.ORDER_EVENT_STREAM is on, and dashboards poll instead.
+    """
+    keepalive_seconds = 15
+    retry_milliseconds = 3000
+
+    async def get(self, request, *args, **kwargs):
+        if not settings.ORDER_EVENT_STREAM:
+            return json_response({"error": "The order stream is not enabled."}, status=status.HTTP_404_NOT_FOUND)
+
+        last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+        response = StreamingHttpResponse(self.stream(last_event_id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
         return response
 
+    async def stream(self, last_event_id):
+        subscription, missed = events.hub.subscribe(last_event_id)
+        try:
+            yield f'retry: {self.retry_milliseconds}\n\n'
+            for event in missed:
+                yield events.format_sse(event)
+
+            while not subscription.overflowed or not subscription.queue.empty():
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=self.keepalive_seconds)
+                except asyncio.TimeoutError:
+                    # Comment lines keep proxies from closing an idle connection
+                    yield ': keepalive\n\n'
+                    continue
+                yield events.format_sse(event)
+        finally:
+            events.hub.unsubscribe(subscription)
+
 
 class OrderRetrieveAPIView(APIView):
     """Lets customers look up their orders using the tracking code."""
     permission_classes = [permissions.AllowAny]
 
     def get(self, request, tracking_code, *args, **kwargs):
+        # A mistyped code fails its check character, no need to ask the database
+        if not has_valid_check_character(tracking_code):
+            return Response(
+                {"error": "Order not found."},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
         try:
-            order = Order.objects.get(tracking_code=tracking_code)
+            order = Order.objects.annotate(
+                payments_updated_at=Max('payments__updated_at')
+            ).get(tracking_code=tracking_code)
         except Order.DoesNotExist:
             return Response(
                 {"error": "Order not found."},
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        serializer = OrderSerializer(order)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        # Customers poll this endpoint, so answer 304 if neither the order nor its payments changed
+        last_modified = max(filter(None, [order.updated_at, order.payments_updated_at]))
+        etag = make_etag('order', order.pk, last_modified.isoformat())
+        not_modified = conditional_response(request, etag, last_modified)
+        if not_modified:
+            return not_modified
+
+        prefetch_related_objects([order], *read_prefetches())
+        with timed_section('serializer'):
+            data = OrderSerializer(order).data
+        return set_validators(Response(data, status=status.HTTP_200_OK), etag, last_modified)
+
+
+class OrderRetrieveAsyncView(AsyncReadView):
+    """Async version of OrderRetrieveAPIView (see dinedash.async_views)."""
+
+    async def get(self, request, tracking_code, *args, **kwargs):
+        if not has_valid_check_character(tracking_code):
+            return json_response({"error": "Order not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        order = await Order.objects.annotate(
+            payments_updated_at=Max('payments__updated_at')
+        ).filter(tracking_code=tracking_code).afirst()
+        if order is None:
+            return json_response({"error": "Order not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        last_modified = max(filter(None, [order.updated_at, order.payments_updated_at]))
+        etag = make_etag('order', order.pk, last_modified.isoformat())
+        not_modified = conditional_response(request, etag, last_modified)
+        if not_modified:
+            return not_modified
+
+        await aprefetch_related_objects([order], *read_prefetches())
+        with timed_section('serializer'):
+            data = OrderSerializer(order).data
+        return set_validators(json_response(data), etag, last_modified)
 
 
 class StaffOrderRetrieveAPIView(generics.RetrieveAPIView):
     """Allows staff to look up specific orders using the internal ID."""
-    queryset = Order.objects.all()
+    queryset = Order.objects.for_read()
     serializer_class = OrderSerializer
     permission_classes = [permissions.AllowAny]
     lookup_field = 'id'
+    lookup_url_kwarg = 'pk'
 
 
 class OrderStatusUpdateAPIView(APIView):
-    """Changes the status of an order (like from pending to in progress)."""
+    """Changes the status of an order (like from pending to in progress).
+
+    Only changes allowed by Order.TRANSITIONS are accepted. Send the status the
+    order had when you read it as 'expected_status' to make sure nobody else
+    changed it since; if the order is no longer in that status (or changes
+    while this request runs) the response is 409 with its current status.
+    """
     permission_classes = [permissions.AllowAny]
 
     def patch(self, request, id, *args, **kwargs):
@@ -225,119 +475,153 @@ class OrderStatusUpdateAPIView(APIView):
         if new_status not in allowed_statuses:
             return Response({"error": f"Invalid status '{new_status}'."}, status=status.HTTP_400_BAD_REQUEST)
 
-        order.status = new_status
-        order.save()
+        try:
+            transitions.transition(order, new_status, request.data.get('expected_status'))
+        except transitions.InvalidTransition as e:
+            return Response({"error": str(e), "current_status": e.from_status}, status=status.HTTP_409_CONFLICT)
+        except transitions.StatusConflict as e:
+            return Response({"error": str(e), "current_status": e.current_status}, status=status.HTTP_409_CONFLICT)
 
+        prefetch_related_objects([order], *read_prefetches())
         return Response(OrderSerializer(order).data, status=status.HTTP_200_OK)
-      
+
+
+class OrderBulkStatusUpdateAPIView(APIView):
+    """Changes the status of many orders at once, e.g. when the kitchen bumps a batch of tickets.
+
+    POST /api/orders/bulk-status/ with either
+        {"updates": [{"id": 12, "status": "ready"}, ...]}
+    or a filter (same fields as the order list filters) and one target status:
+        {"filter": {"status": "in progress", "order_type": "takeaway"}, "status": "ready"}
+
+    Every change must be allowed by Order.TRANSITIONS. Returns the outcome per
+    order id: updated, unchanged, not_found, invalid_transition or conflict.
+    Staff only, like the other back-office endpoints.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    parser_classes = [parsers.JSONParser]
+    max_orders = 200
+
+    def post(self, request, *args, **kwargs):
+        allowed_statuses = {choice[0] for choice in Order.STATUS_CHOICES}
+
+        if 'filter' in request.data:
+            target = request.data.get('status')
+            order_filter = request.data.get('filter')
+            if target not in allowed_statuses:
+                return Response({"error": f"Invalid status '{target}'."}, status=status.HTTP_400_BAD_REQUEST)
+            if not isinstance(order_filter, dict) or not order_filter:
+                return Response({"error": "'filter' must be a non-empty object."}, status=status.HTTP_400_BAD_REQUEST)
+            orders = filter_by_params(Order.objects.all(), order_filter, {
+                'status': list(allowed_statuses),
+                'order_type': [choice[0] for choice in Order.ORDER_TYPE_CHOICES],
+            })
+            ids = list(orders.order_by('pk').values_list('pk', flat=True)[:self.max_orders + 1])
+            if len(ids) > self.max_orders:
+                return Response({"error": f"More than {self.max_orders} orders match; narrow the filter."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            updates = dict.fromkeys(ids, target)
+        else:
+            items = request.data.get('updates')
+            if not isinstance(items, list) or not items:
+                return Response({"error": "Send 'updates' or 'filter' and 'status'."}, status=status.HTTP_400_BAD_REQUEST)
+            if len(items) > self.max_orders:
+                return Response({"error": f"At most {self.max_orders} updates per request."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            updates = {}
+            for index, item in enumerate(items):
+                if not isinstance(item, dict) or not isinstance(item.get('id'), int) or isinstance(item['id'], bool):
+                    return Response({"error": f"updates[{index}] needs an integer 'id'."},
+                                    status=status.HTTP_400_BAD_REQUEST)
+                if item.get('status') not in allowed_statuses:
+                    return Response({"error": f"updates[{index}]: invalid status '{item.get('status')}'."},
+                                    status=status.HTTP_400_BAD_REQUEST)
+                if item['id'] in updates:
+                    return Response({"error": f"updates[{index}]: order {item['id']} is listed twice."},
+                                    status=status.HTTP_400_BAD_REQUEST)
+                updates[item['id']] = item['status']
+
+        results = transitions.apply_status_updates(updates)
+        return Response({
+            "results": {str(pk): results[pk] for pk in updates},
+            "updated": sum(result == transitions.UPDATED for result in results.values()),
+        }, status=status.HTTP_200_OK)
 
 
 
+class OrderExportAPIView(APIView):
+    """Streams every matching order, with its items and payments, as a file download (staff only).
+
+    GET /api/orders/export/?output=csv|jsonl&gzip=1 with the same ?status=,
+    ?order_type=, ?start_date= and ?end_date= filters as the order list.
+    Memory use stays the same whatever the date range.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        file_format = request.query_params.get('output', 'csv')
+        if file_format not in exports.FORMATS:
+            return Response({"error": "output must be 'csv' or 'jsonl'."}, status=status.HTTP_400_BAD_REQUEST)
+        orders = filter_by_params(Order.objects.all(), request.query_params, {
+            'status': [choice[0] for choice in Order.STATUS_CHOICES],
+            'order_type': [choice[0] for choice in Order.ORDER_TYPE_CHOICES],
+        })
+        return exports.export_response(
+            order_exports.order_rows(orders, file_format), file_format, 'orders',
+            columns=order_exports.CSV_COLUMNS, compress=request.query_params.get('gzip') in ('1', 'true'), request=request,
+        )
+
+
+class ArchivedOrderListAPIView(APIView):
+    """Lets staff read orders that were moved to the archive, one day at a time.
+
+    GET /api/orders/archive/?date=YYYY-MM-DD[&tracking_code=ORD...]
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            day = parse_date(request.query_params.get('date') or '')
+        except ValueError:
+            day = None
+        if day is None:
+            return Response({"error": "A date in YYYY-MM-DD format is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            orders = archive.read_partition(day, tracking_code=request.query_params.get('tracking_code') or None)
+        except archive.ArchiveError as e:
+            logger.error(f"Reading archived orders for {day} failed: {str(e)}")
+            return Response({"error": "The archive for this day cannot be read."},
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response({"date": day, "count": len(orders), "results": orders}, status=status.HTTP_200_OK)
+
+
 class AnalyticsAPIView(APIView):
     """ Provides business insights and statistics for the dashboard. """
     permission_classes = [permissions.AllowAny]
 
     def get(self, request, *args, **kwargs):
-        # Get all orders for analysis (including both completed and pending ones for demo)
-        orders = Order.objects.all()
-
         # Allow filtering by date range for more targeted analytics
-        start_date = request.query_params.get('start_date')
-        end_date = request.query_params.get('end_date')
-
-        if start_date:
-            orders = orders.filter(created_at__date__gte=start_date)
-        if end_date:
-            orders = orders.filter(created_at__date__lte=end_date)
-
-        completed_orders = orders
-
-        # Calculate overall business metrics
-        total_revenue = sum(float(order.total_amount) for order in completed_orders)
-
-        total_orders = completed_orders.count()
-
-        avg_order_value = total_revenue / total_orders if total_orders > 0 else 0
-
-        # Get today's performance
-        from django.utils import timezone
-        today = timezone.now().date()
-        today_orders = completed_orders.filter(created_at__date=today)
-        today_revenue = sum(float(order.total_amount) for order in today_orders)
-
-        # Build daily revenue chart data
-        daily_revenue = []
-        if start_date and end_date:
-            start = timezone.datetime.fromisoformat(start_date).date()
-            end = timezone.datetime.fromisoformat(end_date).date()
-            current_date = start
-            while current_date <= end:
-                day_orders = completed_orders.filter(created_at__date=current_date)
-                revenue = sum(float(order.total_amount) for order in day_orders)
-                daily_revenue.append({
-                    'date': current_date.isoformat(),
-                    'revenue': revenue,
-                    'orders': day_orders.count()
-                })
-                current_date += timezone.timedelta(days=1)
-        else:
-            # Show the last 7 days by default
-            for i in range(6, -1, -1):
-                date = today - timezone.timedelta(days=i)
-                day_orders = completed_orders.filter(created_at__date=date)
-                revenue = sum(float(order.total_amount) for order in day_orders)
-                daily_revenue.append({
-                    'date': date.isoformat(),
-                    'revenue': revenue,
-                    'orders': day_orders.count()
-                })
-
-        # See which payment methods customers prefer
-        payment_breakdown = {}
-        for order in completed_orders:
-            try:
-                payment = order.payments.first()  # Get the first payment
-                method = payment.method if payment else 'cash'
-            except:
-                method = 'cash'
-            payment_breakdown[method] = payment_breakdown.get(method, 0) + float(order.total_amount)
-
-        # Find out which meals are the most popular
-        from meals.models import Meal
-        meal_revenue = {}
-        for order in completed_orders:
-            for item in order.items.all():
-                meal_id = str(item.meal.id)
-                revenue = float(item.unit_price) * item.quantity
-                meal_revenue[meal_id] = meal_revenue.get(meal_id, 0) + revenue
-
-        most_profitable = []
-        for meal_id, revenue in sorted(meal_revenue.items(), key=lambda x: x[1], reverse=True)[:5]:
-            try:
-                meal = Meal.objects.get(id=meal_id)
-                most_profitable.append({
-                    'name': meal.name,
-                    'revenue': revenue
-                })
-            except Meal.DoesNotExist:
-                continue
-
-        # Track how many of each meal are currently ordered but not yet fulfilled
-        ordered_quantities = {}
-        for order in completed_orders:
-            if order.status == 'pending':
-                for item in order.items.all():
-                    meal_id = str(item.meal.id)
-                    ordered_quantities[meal_id] = ordered_quantities.get(meal_id, 0) + item.quantity
+        try:
+            start_date = parse_date(request.query_params.get('start_date') or '')
+            end_date = parse_date(request.query_params.get('end_date') or '')
+        except ValueError:
+            return Response({"error": "Dates must be in YYYY-MM-DD format."}, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response({
-            'total_revenue': total_revenue,
-            'total_orders': total_orders,
-            'avg_order_value': avg_order_value,
-            'today_revenue': today_revenue,
-            'daily_revenue': daily_revenue,
-            'payment_breakdown': payment_breakdown,
-            'most_profitable': most_profitable,
-            'ordered_quantities': ordered_quantities
-        })
-    
\ No newline at end of file
+        # Closed days are read from the daily rollups, only recent days are computed live
+        return Response(analytics.build_report(start_date, end_date, today=timezone.localdate()))
+
+
+class AnalyticsAsyncView(AsyncReadView):
+    """ Async version of AnalyticsAPIView (see dinedash.async_views). """
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            start_date = parse_date(request.GET.get('start_date') or '')
+            end_date = parse_date(request.GET.get('end_date') or '')
+        except ValueError:
+            return json_response({"error": "Dates must be in YYYY-MM-DD format."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # The report is a chain of aggregate queries; run it off the event loop in one go
+        report = await sync_to_async(analytics.build_report)(start_date, end_date, today=timezone.localdate())
+        return json_response(report)
@@ -0,0 +1,19 @@
+"""
+Payment export rows for dinedash.exports: one row per payment with its order's tracking code.
+"""
+from django.db.models import F
+
+PAYMENT_COLUMNS = [
+    'id', 'order_id', 'tracking_code', 'amount', 'method', 'status', 'transaction_id', 'transaction_ref',
+    'provider', 'created_at', 'updated_at',
+]
+
+
+def payment_rows(queryset, chunk_size=1000):
+    """ Rows for an export of the given payments, read chunk_size at a time in a single joined query. """
+    rows = (
+        queryset.order_by('created_at', 'pk')
+        .annotate(tracking_code=F('order__tracking_code'))
+        .values(*PAYMENT_COLUMNS)
+    )
+    return rows.iterator(chunk_size=chunk_size)
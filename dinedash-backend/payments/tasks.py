@@ -0,0 +1,28 @@
+"""
+Background jobs for payments, run by ``manage.py run_workers``.
+"""
+import logging
+
+from django.conf import settings
+from django.utils import timezone
+
+from jobs.queue import task
+from .models import Payment
+
+logger = logging.getLogger(__name__)
+
+
+def expire_pending_payments(older_than=None):
+    """ Marks payments that have been pending for too long as failed, in one UPDATE. Returns how many. """
+    cutoff = timezone.now() - timezone.timedelta(seconds=older_than or settings.PAYMENT_PENDING_TIMEOUT)
+    # update() skips auto_now, so set updated_at ourselves (order tracking ETags depend on it)
+    return Payment.objects.filter(status=Payment.STATUS_PENDING, created_at__lt=cutoff).update(
+        status=Payment.STATUS_FAILED, updated_at=timezone.now(),
+    )
+
+
+@task('payments.expire_pending_payments')
+def expire_pending_payments_job():
+    expired = expire_pending_payments()
+    if expired:
+        logger.info(f"Marked {expired} timed-out pending payments as failed")
@@ -1,3 +1,119 @@
-from django.test import TestCase
+import csv
+import io
+from decimal import Decimal
 
-# Create your tests here.
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from orders.models import Order
+from users.models import User
+from .models import Payment
+from .tasks import expire_pending_payments
+
+
+class PaymentListTests(APITestCase):
+    """ The payment audit list pages with keyset cursors and supports filters. """
+
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin', password='pass12345', role='admin', is_staff=True)
+        self.client.force_authenticate(self.admin)
+        for i in range(5):
+            order = Order.objects.create(total_amount=Decimal('10.00'))
+            Payment.objects.create(
+                order=order, amount=order.total_amount,
+                method='momo' if i % 2 else 'cash', status='completed',
+            )
+
+    def test_cursor_pages(self):
+        first = self.client.get('/api/payments/list/?page_size=3').data
+        second = self.client.get(first['next']).data
+
+        self.assertEqual(len(first['results']), 3)
+        self.assertEqual(len(second['results']), 2)
+        self.assertIsNone(second['next'])
+
+    def test_method_filter(self):
+        response = self.client.get('/api/payments/list/?method=momo')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({p['method'] for p in response.data['results']}, {'momo'})
+        self.assertEqual(len(response.data['results']), 2)
+
+
+class PendingPaymentExpiryTests(APITestCase):
+    """ Payments left pending past the timeout are failed by the expiry job in one query. """
+
+    def test_only_old_pending_payments_expire(self):
+        order = Order.objects.create(total_amount=Decimal('15.00'))
+        old = Payment.objects.create(order=order, amount=order.total_amount, method='momo', status='pending')
+        fresh = Payment.objects.create(order=order, amount=order.total_amount, method='momo', status='pending')
+        done = Payment.objects.create(order=order, amount=order.total_amount, method='cash', status='completed')
+        Payment.objects.filter(pk__in=[old.pk, done.pk]).update(created_at=timezone.now() - timezone.timedelta(days=2))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(expire_pending_payments(), 1)
+        self.assertEqual(
+            dict(Payment.objects.values_list('pk', 'status')),
+            {old.pk: 'failed', fresh.pk: 'pending', done.pk: 'completed'},
+        )
+
+
+class PaymentExportTests(APITestCase):
+    """ Staff can stream payments with their order's tracking code. """
+
+    def test_payments_are_streamed_with_filters(self):
+        admin = User.objects.create_user(username='finance', password='pass12345', is_staff=True)
+        self.client.force_authenticate(admin)
+        order = Order.objects.create(total_amount=Decimal('10.00'))
+        Payment.objects.create(order=order, amount=order.total_amount, method='cash', status='completed')
+        Payment.objects.create(order=order, amount=order.total_amount, method='momo', status='failed')
+
+        response = self.client.get('/api/payments/export/?method=momo')
+        self.assertEqual(response.status_code, 200)
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([(row['method'], row['status']) for row in rows], [('momo', 'failed')])
+        self.assertEqual(rows[0]['tracking_code'], order.tracking_code)
+
+
+class PaymentStatusTransitionTests(APITestCase):
+    """ Payment verification and staff finalisation move the order with conditional updates. """
+
+    def setUp(self):
+        self.order = Order.objects.create(total_amount=Decimal('10.00'))
+        self.payment = Payment.objects.create(
+            order=self.order, amount=self.order.total_amount, method='momo', status='pending', transaction_ref='MOCK-1',
+        )
+
+    def verify(self):
+        return self.client.get(
+            f'/api/payments/mock-verify/?tx_ref=MOCK-1&order_id={self.order.id}&status=successful'
+        )
+
+    def test_verification_moves_a_pending_order_to_the_kitchen(self):
+        self.assertEqual(self.verify().status_code, 200)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, Order.STATUS_IN_PROGRESS)
+        self.assertEqual(Payment.objects.get(pk=self.payment.pk).status, Payment.STATUS_COMPLETED)
+
+    def test_verification_of_a_cancelled_order_records_the_payment_only(self):
+        Order.objects.filter(pk=self.order.pk).update(status=Order.STATUS_CANCELLED)
+        response = self.verify()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['order_status'], Order.STATUS_CANCELLED)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, Order.STATUS_CANCELLED)
+        self.assertEqual(Payment.objects.get(pk=self.payment.pk).status, Payment.STATUS_COMPLETED)
+
+    def test_verification_after_the_kitchen_started_keeps_the_order_status(self):
+        Order.objects.filter(pk=self.order.pk).update(status=Order.STATUS_READY)
+        response = self.verify()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['order_status'], Order.STATUS_READY)
+        self.assertEqual(Payment.objects.get(pk=self.payment.pk).status, Payment.STATUS_COMPLETED)
+
+    def test_staff_finalise_an_order_in_the_kitchen(self):
+        admin = User.objects.create_user(username='admin', password='pass12345', role='admin', is_staff=True)
+        self.client.force_authenticate(admin)
+        body = {'order_id': self.order.id, 'payment_method': 'cash', 'amount': '10.00'}
+
+        self.assertEqual(self.client.post('/api/payments/finalize/', body, format='json').status_code, 400)
+        Order.objects.filter(pk=self.order.pk).update(status=Order.STATUS_IN_PROGRESS)
+        self.assertEqual(self.client.post('/api/payments/finalize/', body, format='json').status_code, 200)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, Order.STATUS_COMPLETED)
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import MockPaymentAPIView, MockVerifyAPIView, PaymentListAPIView, finalize_payment
+from .views import MockPaymentAPIView, MockVerifyAPIView, PaymentExportAPIView, PaymentListAPIView, finalize_payment
 
 app_name = "payments" 
 
@@ -10,6 +10,7 @@ urlpatterns = [
 
     # Staff/Admin Audit Endpoint
     path('list/', PaymentListAPIView.as_view(), name='payment-list'),
+    path('export/', PaymentExportAPIView.as_view(), name='payment-export'),
 
     # Staff Finalize Payment Endpoint
     path('finalize/', finalize_payment, name='finalize-payment'),
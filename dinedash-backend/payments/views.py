@@ -1,11 +1,18 @@
 import uuid
 from django.db import transaction
+from django.utils import timezone
 from rest_framework import generics, status
+from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.decorators import api_view, permission_classes
 
+from dinedash import exports
+from dinedash.pagination import KeysetPagination
+from dinedash.utils import filter_by_params
+from orders import transitions
 from orders.models import Order 
+from .exports import PAYMENT_COLUMNS, payment_rows
 from .models import Payment
 from .serializers import PaymentCreateSerializer, PaymentSerializer 
 
@@ -13,10 +20,41 @@ from .serializers import PaymentCreateSerializer, PaymentSerializer
 class PaymentListAPIView(generics.ListAPIView):
     """
     API endpoint that lets staff and admins see all payment records for review and auditing purposes.
+    Pages with keyset cursors, or page numbers with ?page=N, and can be filtered
+    by ?status=, ?method=, ?start_date= and ?end_date= (YYYY-MM-DD).
     """
     queryset = Payment.objects.all().select_related('order').order_by('-created_at')
     serializer_class = PaymentSerializer 
     permission_classes = [IsAdminUser] 
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        return filter_by_params(super().get_queryset(), self.request.query_params, {
+            'status': [choice[0] for choice in Payment.PAYMENT_STATUS_CHOICES],
+            'method': [choice[0] for choice in Payment.PAYMENT_METHOD_CHOICES],
+        })
+
+
+class PaymentExportAPIView(APIView):
+    """
+    Streams every matching payment as a CSV or JSONL download for finance (staff/admin only).
+    GET /api/payments/export/?output=csv|jsonl&gzip=1, filtered like the payment list
+    by ?status=, ?method=, ?start_date= and ?end_date= (YYYY-MM-DD).
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        file_format = request.query_params.get('output', 'csv')
+        if file_format not in exports.FORMATS:
+            return Response({"error": "output must be 'csv' or 'jsonl'."}, status=status.HTTP_400_BAD_REQUEST)
+        payments = filter_by_params(Payment.objects.all(), request.query_params, {
+            'status': [choice[0] for choice in Payment.PAYMENT_STATUS_CHOICES],
+            'method': [choice[0] for choice in Payment.PAYMENT_METHOD_CHOICES],
+        })
+        return exports.export_response(
+            payment_rows(payments), file_format, 'payments',
+            columns=PAYMENT_COLUMNS, compress=request.query_params.get('gzip') in ('1', 'true'), request=request,
+        )
 
 
 # --- MOCK PAYMENT GATEWAY  ---
@@ -75,7 +113,7 @@ class MockVerifyAPIView(generics.GenericAPIView):
     Simulates what happens when a payment gateway confirms a successful payment.
     1. Finds the payment that's waiting to be verified.
     2. Marks the payment as completed.
-    3. Updates the order status to show it's now being prepared.
+    3. Updates the order status to show it's now being prepared, if it is still pending.
     """
     permission_classes = [AllowAny] 
 
@@ -107,24 +145,40 @@ class MockVerifyAPIView(generics.GenericAPIView):
                 # Handle successful payment scenario
                 if mock_status.lower() == "successful":
 
-                    # Mark the payment as completed
-                    payment.status = Payment.STATUS_COMPLETED
-                    payment.transaction_id = f"MOCK-SUCCESS-{tx_ref}"
-                    payment.save()
-
-                    # Update the order to show it's now being prepared
-                    order.status = Order.STATUS_IN_PROGRESS # Use the constant you defined
-                    order.save()
+                    # Mark the payment as completed, unless another verification got there first
+                    completed = Payment.objects.filter(pk=payment.pk, status=payment.status).update(
+                        status=Payment.STATUS_COMPLETED,
+                        transaction_id=f"MOCK-SUCCESS-{tx_ref}",
+                        updated_at=timezone.now(),
+                    )
+                    if not completed:
+                        return Response({"error": "Payment was updated by another request."},
+                                        status=status.HTTP_409_CONFLICT)
+                    payment.refresh_from_db()
+
+                    # Send the order to the kitchen if it is still waiting for payment. The payment
+                    # is recorded either way: an order that already moved on (or was cancelled)
+                    # keeps its status, in a savepoint so the payment update is not rolled back
+                    try:
+                        with transaction.atomic():
+                            transitions.transition(order, Order.STATUS_IN_PROGRESS, expected_status=Order.STATUS_PENDING)
+                    except (transitions.InvalidTransition, transitions.StatusConflict):
+                        order.refresh_from_db(fields=['status'])
 
                     return Response({
                         "message": "Mock Payment successful and verified.",
-                        "order": PaymentSerializer(payment).data # Return payment details
+                        "order": PaymentSerializer(payment).data, # Return payment details
+                        "order_status": order.status,
                     }, status=status.HTTP_200_OK)
 
                 #  Handle failed payment scenario
                 else:
-                    payment.status = Payment.STATUS_FAILED
-                    payment.save()
+                    failed = Payment.objects.filter(pk=payment.pk, status=payment.status).update(
+                        status=Payment.STATUS_FAILED, updated_at=timezone.now(),
+                    )
+                    if not failed:
+                        return Response({"error": "Payment was updated by another request."},
+                                        status=status.HTTP_409_CONFLICT)
 
                     # The order stays pending when payment fails, so customer can try again
                     return Response({
@@ -160,7 +214,7 @@ def finalize_payment(request):
             order = Order.objects.get(id=order_id)
 
             # Make sure the order has been sent to the kitchen first
-            if order.status != 'sentToKitchen':
+            if not Order.can_transition(order.status, Order.STATUS_COMPLETED):
                 return Response({"error": "Order must be sent to kitchen before payment can be finalized."},
                                 status=status.HTTP_400_BAD_REQUEST)
 
@@ -180,9 +234,8 @@ def finalize_payment(request):
                 transaction_id=f"STAFF-COMPLETE-{tx_ref}"
             )
 
-            # Mark the order as fully completed
-            order.status = 'completed'
-            order.save()
+            # Mark the order as fully completed; the payment is rolled back if the order changed meanwhile
+            transitions.transition(order, Order.STATUS_COMPLETED)
 
             return Response({
                 "message": "Payment finalized successfully.",
@@ -191,6 +244,8 @@ def finalize_payment(request):
 
     except Order.DoesNotExist:
         return Response({"error": "Order not found."}, status=status.HTTP_404_NOT_FOUND)
+    except transitions.StatusConflict as e:
+        return Response({"error": str(e), "current_status": e.current_status}, status=status.HTTP_409_CONFLICT)
     except Exception as e:
         return Response({"error": f"An unexpected error occurred: {e}"},
                         status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -9,7 +9,7 @@ import Accounting from './Accounting';
 import { useToast } from './ui/toastContext';
 import { useSelector, useDispatch } from 'react-redux';
 import { fetchMeals, createMeal } from '../store/mealsSlice';
-import { fetchOrders, updateOrderStatus, finalizePayment } from '../store/ordersSlice';
+import { fetchOrders, fetchOrderChanges, updateOrderStatus, finalizePayment, upsertOrder, ORDER_STREAM_URL } from '../store/ordersSlice';
 import { EditMealModal } from './EditMealModal';
 
 
@@ -81,8 +81,59 @@ const Dashboard = () => {
       dispatch(fetchOrders());
     };
 
-    const interval = setInterval(pollOrders, 30000);
-    return () => clearInterval(interval);
+    let interval = null;
+    const startPolling = () => {
+      if (interval === null) {
+        interval = setInterval(pollOrders, 30000);
+      }
+    };
+    const stopPolling = () => {
+      clearInterval(interval);
+      interval = null;
+    };
+
+    // Fall back to polling where Server-Sent Events are not available
+    if (typeof EventSource === 'undefined') {
+      startPolling();
+      return stopPolling;
+    }
+
+    // The browser reconnects on its own and sends Last-Event-ID,
+    // so after a drop we only receive the changes we missed
+    const stream = new EventSource(ORDER_STREAM_URL);
+    const applyChange = (event) => dispatch(upsertOrder(JSON.parse(event.data)));
+    stream.addEventListener('order.created', applyChange);
+    stream.addEventListener('order.status_changed', applyChange);
+    // The server could not replay what we missed, so reload the whole list
+    stream.addEventListener('reset', pollOrders);
+
+    // Safety net for anything the stream did not deliver: read the changes feed
+    // on every (re)connect and every two minutes while connected
+    const catchUp = () => {
+      dispatch(fetchOrderChanges());
+    };
+    let catchUpInterval = null;
+    stream.addEventListener('open', () => {
+      stopPolling();
+      catchUp();
+      if (catchUpInterval === null) {
+        catchUpInterval = setInterval(catchUp, 120000);
+      }
+    });
+    // Poll while the stream is down. The browser gives up for good when the
+    // endpoint is disabled (404 under WSGI), so we keep polling from then on
+    stream.onerror = () => {
+      startPolling();
+      if (stream.readyState === EventSource.CLOSED) {
+        stream.close();
+      }
+    };
+
+    return () => {
+      stream.close();
+      stopPolling();
+      clearInterval(catchUpInterval);
+    };
   }, [dispatch]);
 
   const calculateOrderedQuantities = () => {
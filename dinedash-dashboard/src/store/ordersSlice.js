@@ -13,6 +13,9 @@ const BASE_URL = getApiBaseUrl();
 const API_URL = BASE_URL.endsWith('/') ? `${BASE_URL}api/orders/` : `${BASE_URL}/api/orders/`;
 const PAYMENT_API_URL = BASE_URL.endsWith('/') ? `${BASE_URL}api/payments/` : `${BASE_URL}/api/payments/`;
 
+// Server-Sent Events stream of order changes (replaces polling the full list)
+export const ORDER_STREAM_URL = `${API_URL}stream/`;
+
 export const fetchOrders = createAsyncThunk('orders/fetchOrders', async (_, thunkAPI) => {
     try {
         const response = await axios.get(API_URL);
@@ -22,6 +25,28 @@ export const fetchOrders = createAsyncThunk('orders/fetchOrders', async (_, thun
     }
 });
 
+// Orders created or changed since the last token (the changes feed). Used to catch up
+// on anything the live stream missed while it was down
+export const fetchOrderChanges = createAsyncThunk('orders/fetchOrderChanges', async (_, thunkAPI) => {
+    try {
+        let token = thunkAPI.getState().orders.changesToken;
+        let changes = [];
+        let hasMore = true;
+        while (hasMore) {
+            const response = await axios.get(`${API_URL}changes/`, { params: { since: token } });
+            changes = changes.concat(response.data.changes);
+            token = response.data.token;
+            hasMore = response.data.has_more;
+        }
+        return { changes, token };
+    } catch (error) {
+        return thunkAPI.rejectWithValue(error.response?.data?.error || error.message);
+    }
+}, {
+    // Wait for the order list, which sets the starting token
+    condition: (_, { getState }) => getState().orders.changesToken !== null,
+});
+
 // Complete the payment process for an order
 // This connects to a backend endpoint that handles payment finalization
 export const finalizePayment = createAsyncThunk('orders/finalizePayment', async ({ orderId, paymentMethod, amount }, thunkAPI) => {
@@ -62,12 +87,24 @@ export const updateOrderStatus = createAsyncThunk('orders/updateOrderStatus', as
     }
 });
 
+// Insert a new order at the top, or replace an existing one
+const upsert = (state, order) => {
+    const index = state.orders.findIndex(existing => String(existing.id) === String(order.id));
+    if (index !== -1) {
+        state.orders[index] = order;
+    } else {
+        state.orders.unshift(order);
+    }
+};
+
 const ordersSlice = createSlice({
     name: 'orders',
     initialState: {
         orders: [],
         loading: false,
         error: null,
+        // Changes feed position; starts from the newest change in the loaded list
+        changesToken: null,
     },
     reducers: {
         // Allow adding orders directly to the store if needed
@@ -83,8 +120,17 @@ const ordersSlice = createSlice({
         removeOrder: (state, action) => {
             state.orders = state.orders.filter((order) => order.id !== action.payload);
         },
+        // Insert a new order at the top, or replace an existing one (used by the live stream)
+        upsertOrder: (state, action) => {
+            upsert(state, action.payload);
+        },
     },
     extraReducers: (builder) => {
+        const advanceToken = (state, token) => {
+            if (state.changesToken === null || Number(token) > Number(state.changesToken)) {
+                state.changesToken = String(token);
+            }
+        };
         builder
             .addCase(fetchOrders.pending, (state) => {
                 state.loading = true;
@@ -93,11 +139,16 @@ const ordersSlice = createSlice({
             .addCase(fetchOrders.fulfilled, (state, action) => {
                 state.loading = false;
                 state.orders = action.payload.results || (Array.isArray(action.payload) ? action.payload : []);
+                advanceToken(state, Math.max(0, ...state.orders.map(order => order.change_seq || 0)));
             })
             .addCase(fetchOrders.rejected, (state, action) => {
                 state.loading = false;
                 state.error = action.payload;
             })
+            .addCase(fetchOrderChanges.fulfilled, (state, action) => {
+                action.payload.changes.forEach(order => upsert(state, order));
+                advanceToken(state, action.payload.token);
+            })
             .addCase(updateOrderStatus.pending, (state) => {
                 state.loading = true;
                 state.error = null;
@@ -118,5 +169,5 @@ const ordersSlice = createSlice({
     },
 });
 
-export const { addOrder, updateOrder, removeOrder } = ordersSlice.actions;
+export const { addOrder, updateOrder, removeOrder, upsertOrder } = ordersSlice.actions;
 export default ordersSlice.reducer;
\ No newline at end of file